@@ -0,0 +1,391 @@
+"""Benchmarks for the hot paths of the Rush Wars cog.
+
+Loads `RushWars` against an in-memory Config and fake Discord objects,
+fills it with a synthetic player population and measures the latency and
+throughput of rush, boxes, matchmaking, rushboard and card lookups.
+
+Needs the same environment as the cog (Red, discord.py, numpy).
+
+    python benchmarks/bench_rushwars.py --users 100000 --output results.json
+    python benchmarks/bench_rushwars.py --compare baseline.json
+
+With `--compare` the run exits with status 1 if any benchmark's
+throughput dropped by more than `--tolerance` compared to the baseline.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from copy import deepcopy
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import rushwars.rushwars as rw  # noqa: E402
+from tests.fakes import (  # noqa: E402
+    DATA_PATH, FakeBot, FakeConfig, FakeContext, FakeGuild, FakeUser, fake_menu)
+
+
+def make_player(cog, rng):
+    """Return a user document of a random HQ level with a squad and defense."""
+    doc = deepcopy(rw.default_user)
+    hq = rng.randint(1, len(cog.HQ_LEVELS))
+    doc["hq"] = hq
+    doc["chopper"] = rng.randint(1, min(hq, len(cog.CHOPPER_LEVELS)))
+    doc["lvl"] = rng.randint(1, len(cog.XP_LEVELS))
+    doc["gold"] = rng.randint(0, 100000)
+    doc["keys"] = rng.randint(0, 5)
+    doc["boxes"] = rng.randint(0, 100)
+    doc["stars"]["attack"] = rng.randint(0, 4000)
+    doc["stars"]["defense"] = rng.randint(0, 2000)
+    doc["temp_def_stars"] = rng.randint(0, 300)
+    for level in range(2, hq + 1):
+        cog.new_hq_cards(doc, level)
+    for card_type, cards in doc["cards"].items():
+        doc["cards"][card_type] = {
+            name: [rng.randint(stats[0], rw.max_card_level), rng.randint(0, 500)]
+            for name, stats in cards.items()}
+
+    chopper = cog.CHOPPER_LEVELS[str(doc["chopper"])]
+    active = doc["active"]
+    troops = list(doc["cards"]["troops"])
+    for _ in range(chopper["TroopHousing"]):
+        name = rng.choice(troops)
+        if sum(active["troops"].values()) + cog.CATALOG.get(name).Space <= chopper["TroopHousing"]:
+            active["troops"][name] = active["troops"].get(name, 0) + 1
+    if not active["troops"]:
+        active["troops"]["Troopers"] = 1
+    active["airdrops"][rng.choice(list(doc["cards"]["airdrops"]))] = 1
+    if doc["cards"]["commanders"]:
+        active["commanders"][rng.choice(list(doc["cards"]["commanders"]))] = 1
+    defenses = list(doc["cards"]["defenses"]) or troops
+    for _ in range(rng.randint(2, chopper["DefenceHousing"])):
+        name = rng.choice(defenses)
+        active["defenses"][name] = active["defenses"].get(name, 0) + 1
+    return doc
+
+
+async def build_cog(loop, users, guilds, seed, executor="inline", engine="classic",
+                    storage="config"):
+    """Return a RushWars cog and the fake bot over a synthetic population."""
+    rw.Config = FakeConfig
+    rw.bundled_data_path = lambda cog: DATA_PATH
+    data_path = Path(tempfile.mkdtemp(prefix="rushwars-bench-"))
+    rw.cog_data_path = lambda cog: data_path
+    rw.menu = fake_menu
+
+    rng = random.Random(seed)
+    members = [FakeUser(user_id) for user_id in range(1, users + 1)]
+    fake_guilds = []
+    size = max(users // guilds, 1)
+    for i in range(guilds):
+        fake_guilds.append(FakeGuild(1000 + i, members[i * size:(i + 1) * size]))
+
+    bot = FakeBot(loop, fake_guilds, {member.id: member for member in members})
+    cog = rw.RushWars(bot)
+    await cog.initialize()
+    await cog._index_task
+    cog.COMPUTE.set_mode(executor)
+    for guild in fake_guilds:
+        await cog.config.guild(guild).combat_engine.set(engine)
+    if engine != "classic":
+        cog.GUILD_ENGINES = {guild.id: engine for guild in fake_guilds}
+    for member in members:
+        cog.config.docs[member.id] = make_player(cog, rng)
+    if storage == "sqlite":
+        sqlite = rw.SQLiteStorage(cog.database_path, rw.default_user)
+        await rw.copy_players(cog.users.storage, sqlite, rw.default_user)
+        cog.users.storage = sqlite
+    await cog.rebuild_indexes()
+    return cog, bot
+
+
+class Timer:
+    """Latencies and Config calls of one benchmark."""
+
+    def __init__(self, cog):
+        self.cog = cog
+        self.latencies = []
+        self._calls = Counter(cog.config.calls)
+        self._cache = (cog.users.hits, cog.users.misses)
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.latencies.append(time.perf_counter() - self._start)
+
+    def report(self, ops=None, batch=1):
+        """Summarize the timings; each timing covered `batch` operations."""
+        total = sum(self.latencies)
+        latencies = sorted(latency / batch for latency in self.latencies)
+        ops = ops or len(latencies) * batch
+        calls = Counter(self.cog.config.calls)
+        calls.subtract(self._calls)
+        hits = self.cog.users.hits - self._cache[0]
+        misses = self.cog.users.misses - self._cache[1]
+
+        def percentile(p):
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+
+        return {
+            "ops": ops,
+            "seconds": total,
+            "ops_per_sec": ops / total if total else 0.0,
+            "mean_us": total / len(latencies) * 1e6,
+            "p50_us": percentile(0.50) * 1e6,
+            "p95_us": percentile(0.95) * 1e6,
+            "p99_us": percentile(0.99) * 1e6,
+            "max_us": latencies[-1] * 1e6,
+            "config_calls": {key: value for key, value in calls.items() if value},
+            "cache_hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+
+async def bench_rebuild(cog, bot, args, rng):
+    timer = Timer(cog)
+    with timer:
+        await cog.rebuild_indexes()
+    return timer.report(len(cog.config.docs))
+
+
+async def bench_rush(cog, bot, args, rng):
+    timer = Timer(cog)
+    guilds = [guild for guild in bot.guilds if guild.members]
+    for _ in range(args.iterations):
+        guild = rng.choice(guilds)
+        ctx = FakeContext(bot, rng.choice(guild.members), guild)
+        with timer:
+            await cog.rush.callback(cog, ctx)
+    return timer.report()
+
+
+async def bench_loop_lag(cog, bot, args, rng):
+    """Concurrent rushes while a probe task measures event loop lag."""
+    interval = 0.001
+    lags = []
+    running = True
+
+    async def probe():
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - start - interval)
+
+    guilds = [guild for guild in bot.guilds if guild.members]
+    contexts = []
+    for _ in range(args.iterations):
+        guild = rng.choice(guilds)
+        contexts.append(FakeContext(bot, rng.choice(guild.members), guild))
+
+    probe_task = asyncio.ensure_future(probe())
+    await asyncio.sleep(interval)
+    timer = Timer(cog)
+    with timer:
+        for i in range(0, len(contexts), args.concurrency):
+            await asyncio.gather(*[cog.rush.callback(cog, ctx)
+                                   for ctx in contexts[i:i + args.concurrency]])
+    running = False
+    await probe_task
+
+    report = timer.report(ops=len(contexts))
+    lags.sort()
+    report["executor"] = cog.COMPUTE.mode
+    report["loop_lag_ms"] = {
+        "samples": len(lags),
+        "p50": lags[len(lags) // 2] * 1000 if lags else 0.0,
+        "p99": lags[min(int(len(lags) * 0.99), len(lags) - 1)] * 1000 if lags else 0.0,
+        "max": lags[-1] * 1000 if lags else 0.0,
+    }
+    return report
+
+
+async def bench_box(cog, bot, args, rng):
+    timer = Timer(cog)
+    docs = [deepcopy(doc) for _, doc in zip(range(1000), cog.config.docs.values())]
+    for _ in range(args.iterations):
+        doc = rng.choice(docs)
+        with timer:
+            await cog._box(doc)
+    return timer.report()
+
+
+async def bench_collect_free(cog, bot, args, rng):
+    timer = Timer(cog)
+    guilds = [guild for guild in bot.guilds if guild.members]
+    for _ in range(args.iterations):
+        guild = rng.choice(guilds)
+        ctx = FakeContext(bot, rng.choice(guild.members), guild)
+        with timer:
+            await cog.collect_free_box.callback(cog, ctx)
+    return timer.report()
+
+
+async def bench_matchmaking(cog, bot, args, rng):
+    timer = Timer(cog)
+    guilds = [guild for guild in bot.guilds if guild.members]
+    for _ in range(args.iterations):
+        guild = rng.choice(guilds)
+        ctx = FakeContext(bot, rng.choice(guild.members), guild)
+        with timer:
+            await cog.matchmaking(ctx, rng.randint(0, 6000))
+    return timer.report()
+
+
+async def bench_rushboard(cog, bot, args, rng):
+    timer = Timer(cog)
+    guilds = [guild for guild in bot.guilds if guild.members]
+    for i in range(args.iterations):
+        guild = rng.choice(guilds)
+        ctx = FakeContext(bot, rng.choice(guild.members), guild)
+        scope = "global" if i % 2 else None
+        with timer:
+            await cog.rushboard.callback(cog, ctx, scope)
+    return timer.report()
+
+
+async def bench_card_search(cog, bot, args, rng):
+    timer = Timer(cog)
+    names = [card.Name for card in cog.CATALOG.cards] + ["Not A Card"]
+    batch = 1000
+    for _ in range(max(args.iterations // batch, 1)):
+        queries = [rng.choice(names) for _ in range(batch)]
+        with timer:
+            for name in queries:
+                cog.card_search(name)
+    return timer.report(batch=batch)
+
+
+async def bench_history(cog, bot, args, rng):
+    await cog.BATTLE_LOG.flush()
+    timer = Timer(cog)
+    user_ids = list(cog.config.docs)
+    for _ in range(args.iterations):
+        user_id = rng.choice(user_ids)
+        with timer:
+            await cog.BATTLE_LOG.history(user_id, rw.HISTORY_BATTLES)
+    return timer.report()
+
+
+async def bench_flush(cog, bot, args, rng):
+    timer = Timer(cog)
+    dirty = len(cog.users._dirty)
+    with timer:
+        await cog.users.flush()
+    return timer.report(batch=max(dirty, 1))
+
+
+BENCHMARKS = {
+    "rebuild_indexes": bench_rebuild,
+    "rush": bench_rush,
+    "loop_lag": bench_loop_lag,
+    "box": bench_box,
+    "collect_free": bench_collect_free,
+    "matchmaking": bench_matchmaking,
+    "rushboard": bench_rushboard,
+    "card_search": bench_card_search,
+    "battle_history": bench_history,
+    "cache_flush": bench_flush,
+}
+
+
+async def run(loop, args):
+    started = time.perf_counter()
+    cog, bot = await build_cog(
+        loop, args.users, args.guilds, args.seed, args.executor, args.engine, args.storage)
+    setup_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name in args.benchmarks:
+        results[name] = await BENCHMARKS[name](cog, bot, args, rng)
+        print(f"{name:>16}: {results[name]['ops_per_sec']:>12.1f} ops/s  "
+              f"p50 {results[name]['p50_us']:>10.1f} us  "
+              f"p99 {results[name]['p99_us']:>10.1f} us", file=sys.stderr)
+
+    await cog.users.close()
+    await cog.BATTLE_LOG.close()
+    cog.COMPUTE.close()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": args.users,
+            "guilds": args.guilds,
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "executor": args.executor,
+            "engine": args.engine,
+            "storage": args.storage,
+            "setup_seconds": setup_seconds,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return the benchmarks whose throughput regressed beyond `tolerance`."""
+    regressions = []
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old["ops_per_sec"]:
+            continue
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1
+        if change < -tolerance:
+            regressions.append((name, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--executor", default="inline", choices=["inline", "thread", "process"],
+                        help="where battles and boxes are computed")
+    parser.add_argument("--engine", default="classic", choices=["classic", "tick"],
+                        help="combat engine of every guild")
+    parser.add_argument("--storage", default="config", choices=["config", "sqlite"],
+                        help="where player documents are stored")
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="simultaneous rushes in the loop_lag benchmark")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline results file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop against the baseline")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    args = parser.parse_args(argv)
+    args.benchmarks = args.benchmarks or list(BENCHMARKS)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(run(loop, args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, change in regressions:
+            print(f"REGRESSION {name}: {change:+.1%} ops/s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
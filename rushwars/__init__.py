@@ -1,7 +1,7 @@
-from .rushwars import RushWars
-
-
 async def setup(bot):
-    cog = RushWars()
+    # imported here so the cog's pure modules load without Red installed
+    from .rushwars import RushWars
+
+    cog = RushWars(bot)
     await cog.initialize()
     bot.add_cog(cog)
@@ -0,0 +1,95 @@
+import random
+
+# battle score needed for 3, 2 and 1 stars
+STAR_THRESHOLDS = (8, 4, 0)
+
+ATTACK_TYPES = ["troops", "airdrops", "commanders"]
+
+
+def card_power(catalog, name: str, level: int, count: int):
+    """Return the (hp, attps, def_attps) a number of cards add to a battle.
+
+    `def_attps` is only non-zero for airdrops that slow down the defense
+    (Invisibility and Freeze) and is negative.
+    """
+    card = catalog.get(name)
+    stats = catalog.level_stats(name, level)
+
+    hp = attps = def_attps = 0
+    if card.Type == "airdrop":
+        effect = card.Value * stats.Duration * count
+        if card.Ability == "Damage":
+            attps += effect
+        elif card.Ability == "Boost":
+            attps += effect
+            hp += effect
+        elif card.Ability == "Heal":
+            hp += effect
+        elif card.Ability in ["Invisibility", "Freeze"]:
+            def_attps -= effect
+    else:
+        hp += stats.Hp * count
+        attps += stats.Att * count / card.AttSpeed
+    return hp, attps, def_attps
+
+
+def attack_power(catalog, active: dict, levels):
+    """Return (hp, attps, def_attps, average level) of an attack squad.
+
+    `levels(card_name, card_type)` returns the level of an attack card.
+    """
+    hp = attps = def_attps = 0
+    level_sum = level_count = 0
+    for card_type in ATTACK_TYPES:
+        for name, count in active[card_type].items():
+            level = levels(name, card_type)
+            c_hp, c_attps, c_def_attps = card_power(catalog, name, level, count)
+            hp += c_hp
+            attps += c_attps
+            def_attps += c_def_attps
+            level_sum += level
+            level_count += 1
+
+    if level_count:
+        avg_level = round(level_sum / level_count)
+    else:
+        avg_level = 1
+    return hp, attps, def_attps, avg_level
+
+
+def defense_power(catalog, defenses: dict, levels):
+    """Return (def_hp, def_attps) of a defense.
+
+    `levels(card_name)` returns the level of a defense card.
+    """
+    def_hp = def_attps = 0
+    for name, count in defenses.items():
+        c_hp, c_attps, _ = card_power(catalog, name, levels(name), count)
+        def_hp += c_hp
+        def_attps += c_attps
+    return def_hp, def_attps
+
+
+def computer_level(avg_level: int, rng=random):
+    """Return a defense level for the computer opponent around `avg_level`."""
+    level = rng.choice(range(avg_level-1, avg_level+2))
+    if level < 1:
+        level = 1
+    return level
+
+
+def battle_score(hp, attps, def_hp, def_attps):
+    """How long the attack survives minus how long the defense survives."""
+    survive = hp / def_attps if def_attps else float("inf")
+    destroy = def_hp / attps if attps else float("inf")
+    return survive - destroy
+
+
+def battle_stars(score):
+    """Return the number of stars (0-3) earned with a battle score."""
+    stars = 3
+    for threshold in STAR_THRESHOLDS:
+        if score > threshold:
+            return stars
+        stars -= 1
+    return 0
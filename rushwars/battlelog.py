@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import mmap
+from pathlib import Path
+
+log = logging.getLogger("red.rushwars.battlelog")
+
+SEGMENT_PREFIX = "battles-"
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class BattleLog:
+    """Append-only log of battles in rotating JSON lines segments.
+
+    Records are buffered in memory and appended to the newest segment
+    from an executor, so the event loop never waits on the disk. A new
+    segment is started once the newest one reaches `segment_size` bytes
+    and only the newest `max_segments` segments are kept.
+
+    Every record starts with the same keys in the same order:
+
+        {"t":<unix time>,"a":<attacker id>,"d":<defender id or null>,...}
+
+    so the reader can find a player's battles with a byte search over
+    memory-mapped segments instead of parsing every line.
+    """
+
+    def __init__(self, path, segment_size: int = 4 * 1024 * 1024, max_segments: int = 64,
+                 flush_interval: float = 5.0, flush_size: int = 256):
+        self.path = Path(path)
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._buffer = []
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._loop = None
+
+    def start(self, loop=None):
+        """Start the periodic flush task."""
+        self._loop = loop or asyncio.get_event_loop()
+        if self._flush_task is None:
+            self._flush_task = self._loop.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop the periodic flush task and write out buffered records."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def append(self, record: dict):
+        """Buffer a battle record. It is written on the next flush."""
+        self._buffer.append(json.dumps(record, separators=(",", ":")))
+        if len(self._buffer) >= self.flush_size and self._loop is not None:
+            self._loop.create_task(self.flush())
+
+    async def flush(self):
+        """Write all buffered records to the newest segment."""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            loop = self._loop or asyncio.get_event_loop()
+            try:
+                await loop.run_in_executor(None, self._write, lines)
+            except Exception:
+                # keep the records for the next flush
+                self._buffer[:0] = lines
+                log.exception("Error writing battle log.")
+
+    def segments(self):
+        """Return segment paths, oldest first."""
+        if not self.path.exists():
+            return []
+        return sorted(self.path.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"),
+                      key=self._segment_number)
+
+    async def history(self, user_id: int, limit: int = 50):
+        """Return up to `limit` battles of a user, newest first."""
+        needles = self._needles(user_id)
+        records = []
+        for line in reversed(self._buffer):
+            if any(needle in line.encode() for needle in needles):
+                records.append(json.loads(line))
+                if len(records) >= limit:
+                    return records
+
+        loop = self._loop or asyncio.get_event_loop()
+        records.extend(await loop.run_in_executor(
+            None, self._scan, needles, limit - len(records)))
+        return records
+
+    def _write(self, lines):
+        self.path.mkdir(parents=True, exist_ok=True)
+        segments = self.segments()
+        if segments and segments[-1].stat().st_size < self.segment_size:
+            segment = segments[-1]
+        else:
+            number = self._segment_number(segments[-1]) + 1 if segments else 1
+            segment = self.path / f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+            segments.append(segment)
+
+        with segment.open("a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        for old in segments[:-self.max_segments]:
+            try:
+                old.unlink()
+            except OSError:
+                log.exception(f"Error removing battle log segment {old}.")
+
+    def _scan(self, needles, limit):
+        records = []
+        for segment in reversed(self.segments()):
+            if limit <= 0:
+                break
+            try:
+                with segment.open("rb") as f:
+                    if not segment.stat().st_size:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        found = self._find_lines(mm, needles)
+            except (OSError, ValueError):
+                log.exception(f"Error reading battle log segment {segment}.")
+                continue
+            for line in reversed(found[-limit:]):
+                records.append(json.loads(line))
+            limit -= len(found)
+        return records
+
+    @staticmethod
+    def _find_lines(mm, needles):
+        """Return the lines of a mapped segment containing any needle, in order."""
+        starts = set()
+        for needle in needles:
+            pos = mm.find(needle)
+            while pos != -1:
+                start = mm.rfind(b"\n", 0, pos) + 1
+                starts.add(start)
+                end = mm.find(b"\n", pos)
+                if end == -1:
+                    break
+                pos = mm.find(needle, end)
+        lines = []
+        for start in sorted(starts):
+            end = mm.find(b"\n", start)
+            lines.append(mm[start:end if end != -1 else len(mm)])
+        return lines
+
+    @staticmethod
+    def _needles(user_id):
+        return (f'"a":{user_id},'.encode(), f'"d":{user_id},'.encode())
+
+    @staticmethod
+    def _segment_number(path):
+        return int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Error flushing battle log.")
@@ -1,32 +1,231 @@
 import random
+from math import ceil
+
+from .catalog import RARITIES
+
+# rarity tiers a box can roll, best first
+TIERS = ["Commander", "Epic", "Rare", "Common"]
+
+# number of card stacks of each rarity (commander, epic, rare, common)
+# for every tier and number of stacks in a box
+STACK_LAYOUTS = {
+    "Commander": {3: (1, 1, 0, 1), 4: (1, 1, 0, 2), 5: (1, 0, 1, 2), 8: (1, 1, 2, 4)},
+    "Epic": {3: (0, 1, 0, 2), 4: (0, 1, 1, 2), 5: (0, 1, 2, 2), 8: (0, 2, 2, 4)},
+    "Rare": {3: (0, 0, 1, 2), 4: (0, 0, 1, 3), 5: (0, 0, 2, 3), 8: (0, 0, 3, 5)},
+}
+
+# rarities tried, in order, when a user has no card of the drawn rarity
+FALLBACKS = {
+    "Commander": ["Commander", "Epic", "Rare", "Common"],
+    "Epic": ["Epic", "Rare", "Common"],
+    "Rare": ["Rare", "Common"],
+    "Common": ["Common"],
+}
+
+
+class AliasSampler:
+    """Walker's alias method for O(1) draws from a discrete distribution."""
+
+    def __init__(self, outcomes: list, weights: list):
+        total = sum(weights)
+        size = len(outcomes)
+        scaled = [weight * size / total for weight in weights]
+
+        self.outcomes = outcomes
+        self.prob = [0.0] * size
+        self.alias = [0] * size
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def draw(self, rng=random):
+        i = rng.randrange(len(self.outcomes))
+        if rng.random() < self.prob[i]:
+            return self.outcomes[i]
+        return self.outcomes[self.alias[i]]
+
+
+class BoxResult:
+    """Contents of an opened box."""
+
+    __slots__ = ("box_type", "tier", "gold", "gems", "stacks", "draws")
+
+    def __init__(self, box_type: str, tier: str, gold: int, gems: int, stacks: list):
+        self.box_type = box_type
+        self.tier = tier
+        self.gold = gold
+        self.gems = gems
+        # [(card name, rarity, count), ...] in the order they were drawn
+        self.stacks = stacks
+        # card name -> total count
+        self.draws = {}
+        for name, _, count in stacks:
+            self.draws[name] = self.draws.get(name, 0) + count
+
+    def __repr__(self):
+        return f"<BoxResult {self.box_type} ({self.tier}): {self.gold} gold, {self.draws}>"
+
 
 class Boxes:
-    """A class to represent boxes."""
+    """Box opening engine.
+
+    Tier probabilities of every box type and the cards available at every
+    HQ level are computed once, so opening a box costs constant work per
+    stack regardless of its size.
+    """
 
     battle_box_types = ["Common", "Rare", "Epic", "Mega"]
 
-    box_structure = {
-        "gold": 0,
-        "gems": 0,
-        "cards": []
-    }
+    def __init__(self, boxes_info: dict, catalog):
+        self.boxes_info = boxes_info
+        self.samplers = {}
+        for box_type, box_data in boxes_info.items():
+            commander = 1 / box_data["CommanderChance"]
+            epic = 1 / box_data["EpicChance"]
+            rare = 1 / box_data["RareChance"]
+            weights = [commander, epic - commander, rare - epic, 1 - rare]
+            self.samplers[box_type] = AliasSampler(TIERS, weights)
 
-    def __init__(self, boxes):
+        # hq -> rarity -> card names unlocked at or below that hq
+        self.pools = {}
+        max_hq = max(catalog.by_unlock) if catalog.by_unlock else 1
+        for hq in range(1, max_hq + 1):
+            self.pools[hq] = {
+                rarity: [card.Name for card in catalog.by_rarity.get(rarity, [])
+                         if card.UnlockLvl <= hq]
+                for rarity in RARITIES
+            }
+
+    @classmethod
+    def battle_box_type(cls, boxes: int, rng=random):
+        """Return the type of the next battle box after `boxes` opened boxes."""
         if boxes in [12, 83]:
-            self.box_type = self.battle_box_types[2]
+            box_type = cls.battle_box_types[2]
         elif boxes % 5 == 0 and boxes > 0:
-            self.box_type = self.battle_box_types[1]
+            box_type = cls.battle_box_types[1]
         else:
-            self.box_type = self.battle_box_types[0]
+            box_type = cls.battle_box_types[0]
 
-        chance = random.choice(range(1, 1000))
+        chance = rng.choice(range(1, 1000))
         if chance == 122:
-            self.box_type = self.battle_box_types[3]
-        
-        if boxes < 121:
-            boxes += 1
+            box_type = cls.battle_box_types[3]
+        return box_type
+
+    def pool(self, hq: int):
+        """Return the card names available to a player at an HQ level."""
+        if hq in self.pools:
+            return self.pools[hq]
+        return self.pools[max(self.pools)]
+
+    def open_box(self, box_type: str, multiplier: float, hq: int,
+                 force_commander: bool = False, rng=random):
+        """Draw the contents of a box. Does not touch any user data."""
+        box_data = self.boxes_info[box_type]
+        pools = self.pool(hq)
+
+        tier = self.samplers[box_type].draw(rng)
+        if force_commander:
+            tier = "Commander"
+
+        total_cards = round(box_data["TotalCards"] * multiplier)
+        totals = self.rarity_totals(tier, total_cards)
+        layout = STACK_LAYOUTS.get(tier, {}).get(box_data["Stacks"])
+        if layout is None:
+            layout = (0, 0, 0, box_data["Stacks"])
+
+        # rarities without a stack in this layout are given as commons
+        totals = list(totals)
+        for i in range(3):
+            if layout[i] == 0:
+                totals[3] += totals[i]
+                totals[i] = 0
+
+        stacks = []
+        for rarity, total, num_stacks in zip(TIERS, totals, layout):
+            if total <= 0 or num_stacks <= 0:
+                continue
+            choices = None
+            for fallback in FALLBACKS[rarity]:
+                if pools[fallback]:
+                    choices = pools[fallback]
+                    break
+            if choices is None:
+                continue
+            for count in self.split_in_integers(total, num_stacks):
+                if count > 0:
+                    stacks.append((rng.choice(choices), rarity, count))
+
+        min_gold = round(box_data["MinGold"] * multiplier)
+        max_gold = round(box_data["MaxGold"] * multiplier)
+        gold = rng.randint(min_gold, max_gold)
+
+        gems = 0
+        if box_type == "Free" and rng.randint(1, 10) >= 7:
+            gems = rng.randint(2, 8)
+
+        return BoxResult(box_type, tier, gold, gems, stacks)
+
+    def open_many(self, box_type: str, number: int, multiplier: float, hq: int,
+                  force_commander: bool = False, rng=random):
+        """Open `number` boxes of one type and merge them into one result.
+
+        The returned result has the best tier drawn and the stacks of every
+        box. `force_commander` only applies to the first box.
+        """
+        gold = gems = 0
+        stacks = []
+        best = len(TIERS) - 1
+        for i in range(number):
+            result = self.open_box(box_type, multiplier, hq,
+                                   force_commander and i == 0, rng)
+            gold += result.gold
+            gems += result.gems
+            stacks.extend(result.stacks)
+            best = min(best, TIERS.index(result.tier))
+        return BoxResult(box_type, TIERS[best], gold, gems, stacks)
+
+    @staticmethod
+    def rarity_totals(tier: str, total_cards: int):
+        """Return the number of (commander, epic, rare, common) cards in a box."""
+        if tier == "Commander":
+            commanders = 1
+            rest = total_cards - 1
+            epics = ceil(rest * 0.03)
+            rares = ceil(rest * 0.25)
+        elif tier == "Epic":
+            commanders = 0
+            epics = ceil(total_cards * 0.03)
+            rares = ceil(total_cards * 0.25)
+        elif tier == "Rare":
+            commanders = epics = 0
+            rares = ceil(total_cards * 0.28)
+        else:
+            commanders = epics = rares = 0
+        commons = max(total_cards - commanders - epics - rares, 0)
+        return commanders, epics, rares, commons
+
+    @staticmethod
+    def split_in_integers(number: int, num_of_pieces: int):
+        """Split a number into increasing integers.
+
+        The parts are weighted 1, 2, ... over the sum of 1 to
+        num_of_pieces - 1, so they add up to more than `number` (about
+        twice for 3 stacks). Box card totals depend on it.
+        """
+        if num_of_pieces == 1:
+            total_sum = 1
         else:
-            boxes = 0
-        
-    def open_box(self, box_data:dict, multiplier:float, user_cards:dict):
-        pass        
+            total_sum = sum(range(1, num_of_pieces))
+        return [int((i + 1) * number / total_sum) for i in range(num_of_pieces)]
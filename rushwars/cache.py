@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from copy import deepcopy
+
+log = logging.getLogger("red.rushwars.cache")
+
+
+class UserCache:
+    """Write-behind cache of user documents.
+
+    Documents are loaded once from the storage backend (see storage.py),
+    served from memory afterwards and written back when they are dirty.
+    Dirty documents are flushed periodically, in one batch, when they are
+    evicted from the cache and when the cache is closed.
+    """
+
+    def __init__(self, storage, max_size: int = 1000, flush_interval: float = 30.0):
+        self.storage = storage
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._docs = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+        # user_id -> asyncio.Lock, kept only while a transaction uses it
+        self._locks = weakref.WeakValueDictionary()
+        # one flush writes at a time, so a flush returns after every
+        # earlier write finished
+        self._flush_lock = asyncio.Lock()
+        # cleared while `exclusive` holds the cache, see there
+        self._open = asyncio.Event()
+        self._open.set()
+        self._exclusive = asyncio.Lock()
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, user_id):
+        return user_id in self._docs
+
+    def start(self, loop=None):
+        """Start the periodic flush task."""
+        if self._flush_task is None:
+            loop = loop or asyncio.get_event_loop()
+            self._flush_task = loop.create_task(self._flush_loop())
+
+    async def close(self):
+        """Stop the periodic flush task, flush every dirty document and close the storage."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        await self.storage.close()
+
+    async def get(self, user):
+        """Return the cached document of a user (or user ID).
+
+        The document is shared and must be treated as read-only; change
+        documents through `transaction`, which replaces them instead of
+        changing them in place. Copy parts that are handed to other
+        threads, as a later `get` may return a newer document.
+        """
+        user_id = getattr(user, "id", user)
+        doc = self._docs.get(user_id)
+        if doc is not None:
+            self.hits += 1
+            self._docs.move_to_end(user_id)
+            return doc
+
+        self.misses += 1
+        self.reads += 1
+        doc = await self.storage.load(user_id)
+        # another task may have loaded the document while we were waiting
+        if user_id in self._docs:
+            return self._docs[user_id]
+        self._docs[user_id] = doc
+        await self._evict()
+        return doc
+
+    def lock(self, user):
+        """Return the lock guarding a user's document."""
+        user_id = getattr(user, "id", user)
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    def transaction(self, *users):
+        """Return an async context manager for an atomic update of users.
+
+        The locks of all given users are held for the whole block, which
+        works on deep copies of their documents. When the block exits
+        without an exception the changed copies replace the cached
+        documents and are marked dirty; otherwise they are dropped.
+
+            async with cache.transaction(attacker, defender) as (att, dfn):
+                ...
+
+        A single user gives a single document. `None` users give `None`.
+        """
+        return Transaction(self, users)
+
+    def exclusive(self):
+        """Return an async context manager holding off every transaction.
+
+        Entering waits for running transactions to finish, new ones wait
+        until the block exits. Use it for operations on the whole storage,
+        like copying or importing every player:
+
+            async with cache.exclusive():
+                await cache.flush()
+                ...
+        """
+        return Exclusive(self)
+
+    def discard(self, user):
+        """Drop a user's document from the cache without writing it."""
+        user_id = getattr(user, "id", user)
+        self._docs.pop(user_id, None)
+        self._dirty.discard(user_id)
+
+    def clear(self):
+        """Drop every cached document without writing it."""
+        self._docs.clear()
+        self._dirty.clear()
+
+    async def flush(self, user=None):
+        """Write dirty documents (or only the given user's) to the storage.
+
+        Documents that could not be written stay dirty.
+        """
+        async with self._flush_lock:
+            await self._flush(user)
+
+    @property
+    def dirty(self):
+        """Return the number of documents not written to the storage yet."""
+        return len(self._dirty)
+
+    async def _flush(self, user):
+        if user is not None:
+            user_ids = [getattr(user, "id", user)]
+        else:
+            user_ids = list(self._dirty)
+
+        docs = {}
+        for user_id in user_ids:
+            if user_id not in self._dirty:
+                continue
+            self._dirty.discard(user_id)
+            doc = self._docs.get(user_id)
+            if doc is not None:
+                docs[user_id] = doc
+        if not docs:
+            return
+        # the storage logs failures, they are retried on the next flush
+        failed = await self.storage.save_many(docs)
+        self._dirty.update(failed)
+        self.writes += len(docs) - len(failed)
+
+    async def _evict(self):
+        while len(self._docs) > self.max_size:
+            user_id = next(iter(self._docs))
+            if user_id in self._dirty:
+                await self.flush(user_id)
+                if user_id in self._dirty:
+                    # write failed, keep the document and try again later
+                    self._docs.move_to_end(user_id)
+                    break
+            self._docs.pop(user_id, None)
+
+    def _enter(self):
+        self._active += 1
+        self._idle.clear()
+
+    def _leave(self):
+        self._active -= 1
+        if not self._active:
+            self._idle.set()
+
+    def _commit(self, user_id, doc):
+        self._docs[user_id] = doc
+        self._docs.move_to_end(user_id)
+        self._dirty.add(user_id)
+        self.commits += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Error flushing user cache.")
+
+
+class Transaction:
+    """Atomic update of one or more cached user documents.
+
+    Locks are always taken in user ID order so two transactions on the
+    same pair of users can not deadlock. Transactions do not start while
+    the cache is held by `UserCache.exclusive`.
+    """
+
+    def __init__(self, cache: UserCache, users):
+        self.cache = cache
+        self.user_ids = [getattr(user, "id", user) for user in users]
+        self.docs = []
+        self._locks = []
+
+    async def __aenter__(self):
+        while not self.cache._open.is_set():
+            await self.cache._open.wait()
+        self.cache._enter()
+        try:
+            for user_id in sorted({i for i in self.user_ids if i is not None}):
+                lock = self.cache.lock(user_id)
+                await lock.acquire()
+                self._locks.append(lock)
+
+            for user_id in self.user_ids:
+                if user_id is None:
+                    self.docs.append(None)
+                else:
+                    self.docs.append(deepcopy(await self.cache.get(user_id)))
+        except BaseException:
+            self._release()
+            raise
+
+        if len(self.docs) == 1:
+            return self.docs[0]
+        return tuple(self.docs)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                for user_id, doc in zip(self.user_ids, self.docs):
+                    if user_id is not None and doc != self.cache._docs.get(user_id):
+                        self.cache._commit(user_id, doc)
+        finally:
+            self._release()
+        return False
+
+    def _release(self):
+        while self._locks:
+            self._locks.pop().release()
+        self.cache._leave()
+
+
+class Exclusive:
+    """Holds the cache while no transaction runs, see UserCache.exclusive."""
+
+    def __init__(self, cache: UserCache):
+        self.cache = cache
+
+    async def __aenter__(self):
+        await self.cache._exclusive.acquire()
+        self.cache._open.clear()
+        try:
+            await self.cache._idle.wait()
+        except BaseException:
+            self._release()
+            raise
+        return self.cache
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._release()
+        return False
+
+    def _release(self):
+        self.cache._open.set()
+        self.cache._exclusive.release()
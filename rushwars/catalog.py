@@ -0,0 +1,169 @@
+import csv
+import logging
+
+log = logging.getLogger("red.rushwars.catalog")
+
+# (file name, card type) in the order cards are searched
+CARD_FILES = [
+    ("troops.csv", "troop"),
+    ("airdrops.csv", "airdrop"),
+    ("defenses.csv", "defense"),
+    ("commanders.csv", "commander"),
+]
+
+RARITIES = ["Common", "Rare", "Epic", "Commander"]
+
+base_card_levels = {
+    "common": 1,
+    "rare": 5,
+    "epic": 9,
+    "commander": 13
+}
+
+max_card_level = 20
+
+
+class Card:
+    """A single card record parsed from the bundled CSV files."""
+
+    __slots__ = (
+        "Name", "Type", "Rarity", "UnlockLvl", "Space", "Att", "Hp",
+        "Count", "Targets", "Aerial", "AttSpeed", "Ability", "Value",
+        "Duration", "Description"
+    )
+
+    def __init__(self, card_type: str, row: dict):
+        self.Type: str = card_type
+        self.Name: str = row["Name"]
+        self.Rarity: str = row["Rarity"]
+        self.UnlockLvl: int = int(row["UnlockLvl"])
+        # commanders do not take chopper space but count as one slot
+        self.Space: int = int(row.get("Space", 1))
+        self.Att: int = int(row.get("Att", 0))
+        self.Hp: int = int(row.get("Hp", 0))
+        self.Count: int = int(row.get("Count", 1))
+        self.Targets: int = int(row.get("Targets", 0))
+        self.Aerial: bool = row.get("Aerial", "False") == "True"
+        self.AttSpeed: float = float(row.get("AttSpeed", 0))
+        self.Ability: str = row.get("Ability", "")
+        self.Value: int = int(row.get("Value", 0))
+        self.Duration: float = float(row.get("Duration", 0))
+        self.Description: str = row.get("Description", "")
+
+    def __repr__(self):
+        return f"<Card {self.Name} ({self.Type}, {self.Rarity})>"
+
+
+class LevelStats:
+    """Stats of a card at a single level."""
+
+    __slots__ = ("Level", "Hp", "Att", "Duration", "Dps")
+
+    def __init__(self, level, hp, att, duration, dps):
+        self.Level: int = level
+        self.Hp: int = hp
+        self.Att: int = att
+        self.Duration: float = duration
+        self.Dps: int = dps
+
+    def __repr__(self):
+        return (f"<LevelStats {self.Level}: Hp={self.Hp} Att={self.Att} "
+                f"Duration={self.Duration} Dps={self.Dps}>")
+
+
+def build_stat_table(card: Card):
+    """Return stats of a card for every level from its base to max level.
+
+    Each level adds a tenth of the base Hp/Att (or half a second of
+    duration for airdrops). Stats are accumulated level by level so the
+    truncated values match the ones the game has always shown.
+    """
+    start = base_card_levels[card.Rarity.lower()]
+    hp, att, duration = float(card.Hp), float(card.Att), card.Duration
+
+    table = []
+    for level in range(start, max_card_level + 1):
+        if level > start:
+            if card.Type == "airdrop":
+                if duration != 0:
+                    duration += 0.5
+            else:
+                hp += card.Hp / 10
+                att += card.Att / 10
+        if card.AttSpeed:
+            dps = int(int(att) / card.AttSpeed)
+        else:
+            dps = 0
+        table.append(LevelStats(level, int(hp), int(att), duration, dps))
+    return table
+
+
+class CardCatalog:
+    """In-memory index of every card in the game."""
+
+    def __init__(self, cards: list):
+        self.cards = cards
+        self.by_name = {}
+        self.by_type = {card_type: [] for _, card_type in CARD_FILES}
+        self.by_rarity = {rarity: [] for rarity in RARITIES}
+        self.by_unlock = {}
+        self.stats = {}
+
+        for card in cards:
+            # first file wins, same as the old sequential CSV scan
+            self.by_name.setdefault(card.Name, card)
+            self.by_type[card.Type].append(card)
+            self.by_rarity.setdefault(card.Rarity, []).append(card)
+            self.by_unlock.setdefault(card.UnlockLvl, []).append(card)
+            self.stats.setdefault(card.Name, build_stat_table(card))
+
+    @classmethod
+    def from_path(cls, path):
+        """Load all card CSV files found in `path`."""
+        cards = []
+        for file, card_type in CARD_FILES:
+            fp = path / file
+            try:
+                with fp.open('rt', encoding='iso-8859-15') as f:
+                    reader = csv.DictReader(f, delimiter=',')
+                    for row in reader:
+                        cards.append(Card(card_type, row))
+            except FileNotFoundError:
+                log.exception(
+                    f"{file} file could not be found in Rush Wars data folder.")
+                continue
+        return cls(cards)
+
+    def get(self, name: str):
+        """Return the card with the given name or None."""
+        return self.by_name.get(name)
+
+    def stat_table(self, name: str):
+        """Return the list of level stats of a card, lowest level first."""
+        return self.stats.get(name)
+
+    def level_stats(self, name: str, level: int):
+        """Return stats of a card at the given level.
+
+        Levels outside the card's range are clamped to its base or
+        maximum level.
+        """
+        table = self.stats.get(name)
+        if table is None:
+            return None
+        index = level - table[0].Level
+        if index < 0:
+            index = 0
+        elif index >= len(table):
+            index = len(table) - 1
+        return table[index]
+
+    def unlocked_at(self, hq: int):
+        """Return cards unlocked at exactly the given HQ level."""
+        return self.by_unlock.get(hq, [])
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __contains__(self, name):
+        return name in self.by_name
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from .battle import (attack_power, battle_score, battle_stars,
+                     computer_level, defense_power)
+from .staticdata import DataStore
+
+log = logging.getLogger("red.rushwars.compute")
+
+MODES = ("inline", "thread", "process")
+
+# data path -> (version, StaticData) of this process
+_STATE = {}
+
+
+def register(snapshot):
+    """Share an already loaded StaticData snapshot with functions run in this process."""
+    path, version = snapshot.key
+    _STATE[path] = (version, snapshot)
+
+
+def _state(data_key):
+    """Return the StaticData of a (data path, version) key.
+
+    Worker processes load it once, and again when the cog reloaded a
+    newer version.
+    """
+    path, version = data_key
+    state = _STATE.get(path)
+    if state is None or state[0] < version:
+        state = _STATE[path] = (version, DataStore(path).load())
+    return state[1]
+
+
+def resolve_battle(data_key, seed, active, attack_levels, defenses, def_levels=None,
+                   engine="classic", attack=None, defense=None):
+    """Return (stars, defense levels) of a battle.
+
+    Without `def_levels` the defense is the computer's, with levels
+    around the squad's average level. `engine` is one of
+    `combat.ENGINES`. `attack` and `defense` are the materialized
+    powers of both sides, see CombatPower, and are computed when None.
+    """
+    data = _state(data_key)
+    catalog = data.catalog
+    rng = random.Random(seed)
+
+    if attack is None:
+        attack = attack_power(catalog, active, lambda name, card_type: attack_levels[name])
+    hp, attps, def_attps, avg_level = attack
+    if def_levels is None:
+        def_levels = {defense: computer_level(avg_level, rng) for defense in defenses}
+        defense = None
+    if engine == "tick":
+        return data.combat.battle(active, attack_levels, defenses, def_levels), def_levels
+    if defense is None:
+        defense = defense_power(catalog, defenses, def_levels.get)
+    def_hp, base_def_attps = defense
+
+    score = battle_score(hp, attps, def_hp, def_attps + base_def_attps)
+    return battle_stars(score), def_levels
+
+
+def open_boxes(data_key, seed, box_type, number, multiplier, hq, force_commander=False):
+    """Return the merged BoxResult of `number` boxes."""
+    boxes = _state(data_key).boxes
+    rng = random.Random(seed)
+    if number == 1:
+        return boxes.open_box(box_type, multiplier, hq, force_commander, rng)
+    return boxes.open_many(box_type, number, multiplier, hq, force_commander, rng)
+
+
+class ComputePool:
+    """Runs the pure battle and box functions inline or in a pool.
+
+    `inline` runs them on the event loop, `thread` in a thread pool and
+    `process` in a process pool, which keeps CPU heavy work from
+    stalling the bot when many battles happen at once.
+    """
+
+    def __init__(self, mode: str = "inline", workers: int = None):
+        self.mode = "inline"
+        self.workers = workers
+        self._pool = None
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown executor mode {mode}.")
+        if mode == self.mode and (mode == "inline" or self._pool is not None):
+            return
+        self.close()
+        if mode == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        elif mode == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.mode = mode
+
+    async def run(self, func, *args):
+        """Run `func(*args)` according to the mode and return its result."""
+        if self._pool is None:
+            return func(*args)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._pool, partial(func, *args))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,53 @@
+import asyncio
+
+
+class Confirmations:
+    """Pending yes/no prompts answered by reactions.
+
+    Every prompt is a future keyed by its message ID, so one reaction
+    listener resolves it with a dict lookup instead of every pending
+    prompt checking every reaction the bot sees. Prompts expire after
+    `timeout` seconds and are removed as soon as they are answered or
+    expire.
+    """
+
+    def __init__(self, yes: str, no: str, timeout: float = 60.0):
+        self.yes = yes
+        self.no = no
+        self.timeout = timeout
+        # message id -> (user id, future)
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def ask(self, message, user, timeout: float = None):
+        """Wait for `user` to react to `message`.
+
+        Returns True or False, or None when the prompt expired.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending[message.id] = (user.id, future)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pending.pop(message.id, None)
+
+    def dispatch(self, message_id: int, user_id: int, emoji: str):
+        """Answer the prompt of a reaction. Returns whether it answered one."""
+        pending = self._pending.get(message_id)
+        if pending is None:
+            return False
+        owner, future = pending
+        if user_id != owner or future.done() or emoji not in (self.yes, self.no):
+            return False
+        future.set_result(emoji == self.yes)
+        return True
+
+    def cancel_all(self):
+        """Cancel every pending prompt, e.g. when the cog unloads."""
+        for _, future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
@@ -0,0 +1,187 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from copy import deepcopy
+from pathlib import Path
+
+log = logging.getLogger("red.rushwars.export")
+
+EXPORT_FORMAT = "rushwars-players"
+EXPORT_VERSION = 1
+EXPORT_SUFFIX = ".jsonl.gz"
+CHUNK_SIZE = 500
+
+
+class ExportError(ValueError):
+    """Raised when a player export can not be read or is invalid."""
+
+
+def validate_player(doc, defaults: dict):
+    """Check an imported document against the defaults and fill in missing keys.
+
+    Returns the completed document. Raises ExportError when a key is
+    unknown or has a different type than its default.
+    """
+    if not isinstance(doc, dict):
+        raise ExportError("player data must be an object")
+    unknown = set(doc) - set(defaults)
+    if unknown:
+        raise ExportError(f"unknown keys {', '.join(sorted(unknown))}")
+
+    for key, default in defaults.items():
+        value = doc.setdefault(key, deepcopy(default))
+        if type(value) is not type(default):
+            raise ExportError(f"{key} must be {type(default).__name__}")
+        if not isinstance(default, dict):
+            continue
+        # nested groups like stars, cards and active
+        for sub_key, sub_default in default.items():
+            sub_value = value.setdefault(sub_key, deepcopy(sub_default))
+            if type(sub_value) is not type(sub_default):
+                raise ExportError(f"{key}.{sub_key} must be {type(sub_default).__name__}")
+
+    for card_type, cards in doc["cards"].items():
+        for name, stats in cards.items():
+            if (not isinstance(stats, list) or len(stats) != 2
+                    or not all(type(stat) is int for stat in stats)):
+                raise ExportError(f"cards.{card_type}.{name} must be [level, count]")
+    for category, cards in doc["active"].items():
+        if not isinstance(cards, dict) or not all(type(count) is int for count in cards.values()):
+            raise ExportError(f"active.{category} must map cards to numbers")
+    return doc
+
+
+async def export_players(storage, path, chunk_size: int = CHUNK_SIZE):
+    """Write every player of `storage` to a gzipped JSON lines file.
+
+    The first line is a header, every other line one player:
+
+        {"format": "rushwars-players", "version": 1}
+        {"id": <user id>, "data": <document>}
+
+    Players are read from the storage `chunk_size` at a time and encoded
+    and written from an executor. The file is written next to `path`
+    and renamed when complete. Returns the number of players written.
+    """
+    path = Path(path)
+    partial = path.with_name(path.name + ".part")
+    loop = asyncio.get_event_loop()
+    f = await loop.run_in_executor(None, _open_export, partial)
+    count = 0
+    try:
+        async for chunk in storage.iter_users(chunk_size):
+            await loop.run_in_executor(None, _write_chunk, f, chunk)
+            count += len(chunk)
+    except BaseException:
+        await loop.run_in_executor(None, _discard, f, partial)
+        raise
+    await loop.run_in_executor(None, _finish, f, partial, path)
+    return count
+
+
+async def import_players(storage, path, defaults: dict, chunk_size: int = CHUNK_SIZE):
+    """Write every player of an export file to `storage`.
+
+    The whole file is validated first, so an invalid file writes nothing.
+    Players are then read, checked and written `chunk_size` at a time.
+    Returns the imported user IDs.
+    """
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, _check_file, path, defaults, chunk_size)
+
+    user_ids = []
+    reader = await loop.run_in_executor(None, ExportReader, path, defaults)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, reader.read, chunk_size)
+            if not chunk:
+                break
+            failed = await storage.save_many(dict(chunk))
+            if failed:
+                raise ExportError(f"{len(failed)} players could not be written.")
+            user_ids.extend(user_id for user_id, _ in chunk)
+    finally:
+        await loop.run_in_executor(None, reader.close)
+    return user_ids
+
+
+def _open_export(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # level 6 compresses about as well as 9 in a fraction of the time
+    f = gzip.open(str(path), "wt", encoding="utf-8", compresslevel=6)
+    f.write(json.dumps({"format": EXPORT_FORMAT, "version": EXPORT_VERSION}) + "\n")
+    return f
+
+
+def _write_chunk(f, chunk):
+    f.write("".join(
+        json.dumps({"id": user_id, "data": doc}, separators=(",", ":")) + "\n"
+        for user_id, doc in chunk))
+
+
+def _finish(f, partial, path):
+    f.close()
+    os.replace(str(partial), str(path))
+
+
+def _discard(f, partial):
+    f.close()
+    try:
+        partial.unlink()
+    except OSError:
+        log.exception(f"Error removing unfinished export {partial}.")
+
+
+def _check_file(path, defaults, chunk_size):
+    reader = ExportReader(path, defaults)
+    try:
+        while reader.read(chunk_size):
+            pass
+    finally:
+        reader.close()
+
+
+class ExportReader:
+    """Reads validated players from an export file, a chunk at a time."""
+
+    def __init__(self, path, defaults: dict):
+        self.name = Path(path).name
+        self.defaults = defaults
+        # the header is line 1
+        self.line = 1
+        try:
+            self._file = gzip.open(str(path), "rt", encoding="utf-8")
+            header = json.loads(self._file.readline())
+        except (OSError, EOFError, ValueError) as ex:
+            raise ExportError(f"{self.name} could not be read: {ex}")
+        if (not isinstance(header, dict) or header.get("format") != EXPORT_FORMAT
+                or header.get("version") != EXPORT_VERSION):
+            self._file.close()
+            raise ExportError(f"{self.name} is not a Rush Wars player export.")
+
+    def read(self, chunk_size: int):
+        """Return up to `chunk_size` (user_id, document) pairs, none at the end."""
+        chunk = []
+        try:
+            while len(chunk) < chunk_size:
+                line = self._file.readline()
+                if not line:
+                    break
+                self.line += 1
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                user_id = record["id"]
+                if type(user_id) is not int:
+                    raise ExportError("id must be a number")
+                chunk.append((user_id, validate_player(record["data"], self.defaults)))
+        except ExportError as ex:
+            raise ExportError(f"{self.name}, line {self.line}: {ex}")
+        except (OSError, EOFError, ValueError, KeyError, TypeError) as ex:
+            raise ExportError(f"{self.name}, line {self.line} could not be read: {ex!r}")
+        return chunk
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,160 @@
+import zlib
+
+# active category -> chopper level key of its capacity, None for one slot
+CAPACITY_KEYS = {
+    "troops": "TroopHousing",
+    "airdrops": "AirdropHousing",
+    "commanders": None,
+    "defenses": "DefenceHousing",
+}
+
+SQUAD_CATEGORIES = ("troops", "airdrops", "commanders")
+
+# card type -> active category it can be placed in
+SQUAD_TYPES = {"troop": "troops", "airdrop": "airdrops", "commander": "commanders"}
+DEFENSE_TYPES = {"troop": "defenses", "defense": "defenses"}
+
+
+def parse_cards(args):
+    """Parse `card [number] card [number] ...` into {card: number}.
+
+    The number defaults to 1. Raises ValueError for numbers below 1.
+    """
+    cards = {}
+    i = 0
+    while i < len(args):
+        name = args[i].title()
+        number = 1
+        if i + 1 < len(args) and args[i + 1].lstrip("-").isdigit():
+            number = int(args[i + 1])
+            i += 1
+        i += 1
+        if number < 1:
+            raise ValueError(f"Must add at least one {name} card.")
+        cards[name] = cards.get(name, 0) + number
+    return cards
+
+
+def space_stamp(catalog):
+    """Return a checksum of every card's space in the catalog."""
+    spaces = ",".join(f"{card.Name}:{card.Space}" for card in catalog.cards)
+    return zlib.crc32(spaces.encode())
+
+
+class Housing:
+    """Occupied squad and defense housing of user documents.
+
+    The space used by every category of `active` is stored in the
+    document's `housing` dict and updated together with `active`, so
+    capacity checks never walk the selected cards. It is rebuilt when
+    missing or computed with different card spaces.
+    """
+
+    def __init__(self, catalog, chopper_levels: dict, power=None):
+        self.catalog = catalog
+        self.chopper_levels = chopper_levels
+        # CombatPower refreshed after every change
+        self.power = power
+        self.stamp = space_stamp(catalog)
+
+    def space(self, name: str):
+        card = self.catalog.get(name)
+        return card.Space if card is not None else 0
+
+    def compute(self, active: dict):
+        """Return the housing of every category of `active`."""
+        housing = {"stamp": self.stamp}
+        for category, cards in active.items():
+            housing[category] = sum(
+                self.space(name) * count for name, count in cards.items())
+        return housing
+
+    def housing(self, user_data):
+        """Return the stored housing, or a computed one when it is stale."""
+        housing = user_data.get("housing")
+        if not housing or housing.get("stamp") != self.stamp:
+            housing = self.compute(user_data["active"])
+        return housing
+
+    def _stored(self, user_data):
+        housing = user_data.get("housing")
+        if not housing or housing.get("stamp") != self.stamp:
+            housing = user_data["housing"] = self.compute(user_data["active"])
+        return housing
+
+    def used(self, user_data, category: str):
+        """Return the housing space used by a category."""
+        return self.housing(user_data).get(category, 0)
+
+    def capacity(self, user_data, category: str):
+        """Return the housing space of a category at the user's chopper level."""
+        key = CAPACITY_KEYS[category]
+        if key is None:
+            return 1
+        return self.chopper_levels[str(user_data["chopper"])][key]
+
+    def add(self, user_data, category: str, name: str, number: int):
+        """Add cards to a category. Capacity must be checked by the caller."""
+        housing = self._stored(user_data)
+        cards = user_data["active"][category]
+        cards[name] = cards.get(name, 0) + number
+        housing[category] = housing.get(category, 0) + self.space(name) * number
+        self._changed(user_data)
+
+    def remove(self, user_data, category: str, name: str, number: int):
+        """Remove cards from a category, dropping cards that reach zero."""
+        housing = self._stored(user_data)
+        cards = user_data["active"][category]
+        cards[name] -= number
+        if cards[name] <= 0:
+            del cards[name]
+        housing[category] = housing.get(category, 0) - self.space(name) * number
+        self._changed(user_data)
+
+    def compose(self, user_data, cards: dict, types: dict):
+        """Validate a whole composition against ownership and capacity.
+
+        `types` maps the allowed card types to their category, see
+        SQUAD_TYPES and DEFENSE_TYPES. Returns ({category: {card: number}},
+        None) or (None, error message).
+        """
+        active = {category: {} for category in types.values()}
+        used = dict.fromkeys(active, 0)
+        for name, number in cards.items():
+            card = self.catalog.get(name)
+            if card is None:
+                return None, f"{name} does not exist."
+            category = types.get(card.Type)
+            if category is None:
+                kind = "defense" if "defenses" in active else "attack"
+                return None, f"{name} is not a valid {kind} card."
+            owned = user_data["cards"][card.Type + "s"].get(name)
+            if not owned or owned[1] < 1:
+                return None, f"You have not unlocked {name}."
+            active[category][name] = number
+            used[category] += card.Space * number
+
+        for category, space in used.items():
+            capacity = self.capacity(user_data, category)
+            if space > capacity:
+                return None, f"{category.title()} need {space} space but only {capacity} is available."
+        return active, None
+
+    def replace(self, user_data, active: dict):
+        """Replace whole categories of `active`, e.g. from `compose`."""
+        housing = self._stored(user_data)
+        for category, cards in active.items():
+            user_data["active"][category] = dict(cards)
+            housing[category] = sum(
+                self.space(name) * number for name, number in cards.items())
+        self._changed(user_data)
+
+    def clear(self, user_data, category: str):
+        housing = self._stored(user_data)
+        user_data["active"][category] = {}
+        housing[category] = 0
+        self._changed(user_data)
+
+    def _changed(self, user_data):
+        if self.power is not None:
+            self.power.refresh(user_data)
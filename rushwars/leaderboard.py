@@ -0,0 +1,94 @@
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """Players sorted by total stars, highest first.
+
+    Entries are kept as `(-stars, user_id)` keys in a sorted list so a
+    user's rank and any page of the board are found with a binary search.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._stars = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._stars
+
+    def update(self, user_id: int, stars: int):
+        """Insert a user or move them to their new position."""
+        old = self._stars.get(user_id)
+        if old == stars:
+            return
+        if old is not None:
+            self._discard(user_id, old)
+        self._stars[user_id] = stars
+        insort(self._keys, (-stars, user_id))
+
+    def remove(self, user_id: int):
+        old = self._stars.pop(user_id, None)
+        if old is not None:
+            self._discard(user_id, old)
+
+    def stars(self, user_id: int):
+        return self._stars.get(user_id)
+
+    def rank(self, user_id: int):
+        """Return the 1-based rank of a user or None if not on the board."""
+        stars = self._stars.get(user_id)
+        if stars is None:
+            return None
+        return bisect_left(self._keys, (-stars, user_id)) + 1
+
+    def top(self, count: int = 10, start: int = 0):
+        """Return `count` (user_id, stars) entries starting at `start`."""
+        return [(user_id, -stars) for stars, user_id in self._keys[start:start + count]]
+
+    def _discard(self, user_id, stars):
+        index = bisect_left(self._keys, (-stars, user_id))
+        del self._keys[index]
+
+
+class Leaderboards:
+    """A global leaderboard and one leaderboard per guild."""
+
+    def __init__(self):
+        self.global_board = Leaderboard()
+        self._guilds = {}
+        # user_id -> set of guild ids the user is ranked in
+        self._memberships = {}
+
+    def guild(self, guild_id: int):
+        """Return the leaderboard of a guild."""
+        board = self._guilds.get(guild_id)
+        if board is None:
+            board = self._guilds[guild_id] = Leaderboard()
+        return board
+
+    def update(self, user_id: int, stars: int, guild_id: int = None):
+        """Update a user's stars on every board they are ranked in.
+
+        If `guild_id` is given the user is also added to that guild's board.
+        """
+        self.global_board.update(user_id, stars)
+        guilds = self._memberships.setdefault(user_id, set())
+        if guild_id is not None:
+            guilds.add(guild_id)
+        for guild in guilds:
+            self.guild(guild).update(user_id, stars)
+
+    def remove(self, user_id: int, guild_id: int = None):
+        """Remove a user from one guild board or, by default, from all boards."""
+        guilds = self._memberships.get(user_id, set())
+        if guild_id is not None:
+            if guild_id in guilds:
+                guilds.discard(guild_id)
+                self.guild(guild_id).remove(user_id)
+            return
+        for guild in guilds:
+            self.guild(guild).remove(user_id)
+        self._memberships.pop(user_id, None)
+        self.global_board.remove(user_id)
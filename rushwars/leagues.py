@@ -0,0 +1,66 @@
+from bisect import bisect_right
+
+LEAGUE_ICONS_BASE_URL = "https://www.rushstats.com/assets/league/"
+
+# (lower limit, upper limit, box multiplier)
+LEAGUES = {
+    "Rookie": (0, 200, 120),
+    "Bronze": (200, 600, 140),
+    "Silver": (600, 1200, 160),
+    "Gold": (1200, 1800, 180),
+    "Specialist": (1800, 2400, 200),
+    "Ninja": (2400, 3000, 220),
+    "Destroyer": (3000, 4000, 240),
+    "Champion": (4000, 5200, 260),
+    "Legend": (5200, 6500, 280),
+    "Supreme": (6500, 8000, 300),
+    "Superstar": (8000, 10000, 320),
+    "Elite": (10000, 12000, 340)
+}
+
+
+class League:
+    """A league and what it is worth."""
+
+    __slots__ = ("Name", "Tier", "Low", "High", "Multiplier")
+
+    def __init__(self, name: str, tier: int, low: int, high: int, multiplier: int):
+        self.Name = name
+        # 1-based position, also the XP rewarded per battle star
+        self.Tier = tier
+        self.Low = low
+        self.High = high
+        # box multiplier in percent
+        self.Multiplier = multiplier
+
+    @property
+    def icon_url(self):
+        return f"{LEAGUE_ICONS_BASE_URL}{self.Name}.png"
+
+    def __repr__(self):
+        return f"<League {self.Name} ({self.Low}-{self.High})>"
+
+
+class LeagueTable:
+    """Leagues sorted by their lower star limit.
+
+    Players below the first league's limit are in the first league and
+    players above the last league's upper limit stay in the last league.
+    """
+
+    def __init__(self, leagues: dict = LEAGUES):
+        ordered = sorted(leagues.items(), key=lambda item: item[1][0])
+        self.leagues = [
+            League(name, tier, low, high, multiplier)
+            for tier, (name, (low, high, multiplier)) in enumerate(ordered, 1)
+        ]
+        self.bounds = [league.Low for league in self.leagues]
+        self.by_name = {league.Name: league for league in self.leagues}
+
+    def resolve(self, stars: int):
+        """Return the League of a player with `stars` total stars."""
+        index = bisect_right(self.bounds, stars) - 1
+        return self.leagues[max(index, 0)]
+
+    def __iter__(self):
+        return iter(self.leagues)
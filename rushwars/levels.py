@@ -0,0 +1,34 @@
+from bisect import bisect_right
+
+
+class XPTable:
+    """Cumulative XP and gem rewards of every player level.
+
+    `cumulative[i]` is the total XP needed to go from level 1 to level
+    i + 1 and `gems[i]` the gems rewarded on the way, so resolving any
+    amount of XP is a single binary search.
+    """
+
+    def __init__(self, xp_levels: dict):
+        levels = sorted(int(level) for level in xp_levels)
+        self.max_level = levels[-1]
+        self.cumulative = [0]
+        self.gems = [0]
+        # the last level has no next level to reach
+        for level in levels[:-1]:
+            info = xp_levels[str(level)]
+            self.cumulative.append(self.cumulative[-1] + info["ExpToNextLevel"])
+            self.gems.append(self.gems[-1] + info["GemReward"])
+
+    def resolve(self, level: int, xp: int):
+        """Return (level, xp, gems) after applying every level up.
+
+        `xp` is the XP collected since reaching `level`. At the maximum
+        level XP keeps adding up and no more gems are rewarded.
+        """
+        level = min(max(level, 1), self.max_level)
+        total = self.cumulative[level - 1] + xp
+        new_level = min(bisect_right(self.cumulative, total), self.max_level)
+        new_level = max(new_level, level)
+        gems = self.gems[new_level - 1] - self.gems[level - 1]
+        return new_level, total - self.cumulative[new_level - 1], gems
@@ -0,0 +1,147 @@
+import random
+
+# number of random picks tried before falling back to a scan of the bands
+PICK_ATTEMPTS = 5
+
+
+class MatchmakingIndex:
+    """Players with an active defense, bucketed by guild and star band.
+
+    Every guild maps star bands (`stars // band_size`) to a list of user
+    IDs. A user's position in its band list is tracked so players can be
+    moved between bands and removed in O(1).
+    """
+
+    def __init__(self, band_size: int = 100):
+        self.band_size = band_size
+        # guild_id -> {band: [user_id, ...]}
+        self._buckets = {}
+        # (guild_id, user_id) -> index in the band list
+        self._positions = {}
+        # user_id -> [total stars, set of guild ids]
+        self._players = {}
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, user_id):
+        return user_id in self._players
+
+    def clear(self):
+        self._buckets.clear()
+        self._positions.clear()
+        self._players.clear()
+
+    def stars(self, user_id: int):
+        """Return the indexed stars of a user or None."""
+        player = self._players.get(user_id)
+        if player is None:
+            return None
+        return player[0]
+
+    def update(self, user_id: int, stars: int, has_defense: bool, guild_id: int = None):
+        """Add, move or remove a player after their stars or defense changed.
+
+        If `guild_id` is given the player also becomes matchable in that
+        guild.
+        """
+        if not has_defense:
+            return self.remove(user_id)
+
+        player = self._players.get(user_id)
+        if player is None:
+            player = [stars, set()]
+            self._players[user_id] = player
+        elif player[0] != stars:
+            old_band = self._band(player[0])
+            new_band = self._band(stars)
+            if old_band != new_band:
+                for guild in player[1]:
+                    self._take(guild, old_band, user_id)
+                    self._put(guild, new_band, user_id)
+            player[0] = stars
+
+        if guild_id is not None and guild_id not in player[1]:
+            player[1].add(guild_id)
+            self._put(guild_id, self._band(stars), user_id)
+
+    def remove(self, user_id: int, guild_id: int = None):
+        """Remove a player from one guild or, by default, from all of them."""
+        player = self._players.get(user_id)
+        if player is None:
+            return
+        band = self._band(player[0])
+        if guild_id is None:
+            guilds = list(player[1])
+        elif guild_id in player[1]:
+            guilds = [guild_id]
+        else:
+            return
+        for guild in guilds:
+            self._take(guild, band, user_id)
+            player[1].discard(guild)
+        if not player[1] and guild_id is None:
+            del self._players[user_id]
+
+    def find(self, guild_id: int, user_id: int, stars: int, window: int = 100):
+        """Return a random opponent for `user_id` within `window` stars or None.
+
+        An opponent matches when `opponent - window <= stars < opponent + window`.
+        """
+        bands = self._buckets.get(guild_id)
+        if not bands:
+            return None
+
+        first = self._band(stars - window)
+        last = self._band(stars + window)
+        pools = [bands[band] for band in range(first, last + 1) if band in bands]
+        total = sum(len(pool) for pool in pools)
+        if total == 0:
+            return None
+
+        for _ in range(PICK_ATTEMPTS):
+            pick = random.randrange(total)
+            for pool in pools:
+                if pick < len(pool):
+                    candidate = pool[pick]
+                    break
+                pick -= len(pool)
+            if self._matches(candidate, user_id, stars, window):
+                return candidate
+
+        candidates = [
+            candidate for pool in pools for candidate in pool
+            if self._matches(candidate, user_id, stars, window)
+        ]
+        if not candidates:
+            return None
+        return random.choice(candidates)
+
+    def _matches(self, candidate, user_id, stars, window):
+        if candidate == user_id:
+            return False
+        opponent_stars = self._players[candidate][0]
+        return opponent_stars - window <= stars < opponent_stars + window
+
+    def _band(self, stars):
+        return stars // self.band_size
+
+    def _put(self, guild_id, band, user_id):
+        pool = self._buckets.setdefault(guild_id, {}).setdefault(band, [])
+        self._positions[(guild_id, user_id)] = len(pool)
+        pool.append(user_id)
+
+    def _take(self, guild_id, band, user_id):
+        index = self._positions.pop((guild_id, user_id), None)
+        if index is None:
+            return
+        bands = self._buckets[guild_id]
+        pool = bands[band]
+        last = pool.pop()
+        if last != user_id:
+            pool[index] = last
+            self._positions[(guild_id, last)] = index
+        if not pool:
+            del bands[band]
+            if not bands:
+                del self._buckets[guild_id]
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, like a Prometheus histogram."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        # one count per bucket plus one for values above the last bucket
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float):
+        """Estimate a quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """Latency histograms and counters of the cog."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.timings = {}
+        self.counters = Counter()
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram()
+        histogram.observe(seconds)
+
+    def incr(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def reset(self):
+        self.__init__()
+
+    def timer(self, name: str):
+        """Context manager timing a block into the `name` histogram."""
+        return _Timer(self, name)
+
+    def to_prometheus(self, gauges: dict = None, prefix: str = "rushwars"):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# TYPE {prefix}_latency_seconds histogram",
+        ]
+        for name in sorted(self.timings):
+            histogram = self.timings[name]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{prefix}_latency_seconds_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(
+                f'{prefix}_latency_seconds_bucket{{name="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{prefix}_latency_seconds_sum{{name="{name}"}} {histogram.sum}')
+            lines.append(f'{prefix}_latency_seconds_count{{name="{name}"}} {histogram.count}')
+
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name in sorted(self.counters):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {self.counters[name]}')
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_log_line(self, gauges: dict = None):
+        """Return a one-line `key=value` summary of all metrics."""
+        parts = []
+        for name in sorted(self.timings):
+            histogram = self.timings[name]
+            parts.append(
+                f"{name}.count={histogram.count} "
+                f"{name}.p50_ms={histogram.quantile(0.5) * 1000:.3f} "
+                f"{name}.p99_ms={histogram.quantile(0.99) * 1000:.3f}")
+        for name in sorted(self.counters):
+            parts.append(f"{name}={self.counters[name]}")
+        for name, value in sorted((gauges or {}).items()):
+            parts.append(f"{name}={value}")
+        return " ".join(parts)
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# metrics of the loaded cog
+METRICS = Metrics()
+
+
+def timed(name: str):
+    """Decorator timing every call of a function or coroutine function."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    METRICS.observe(name, time.perf_counter() - start)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    METRICS.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
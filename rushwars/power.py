@@ -0,0 +1,94 @@
+import zlib
+
+from .battle import ATTACK_TYPES, attack_power, defense_power
+
+
+def stats_stamp(catalog):
+    """Return a checksum of every card stat used by the battle formula."""
+    stats = ",".join(
+        f"{card.Name}:{card.Type}:{card.Rarity}:{card.Hp}:{card.Att}:{card.AttSpeed}:"
+        f"{card.Ability}:{card.Value}:{card.Duration}"
+        for card in catalog.cards)
+    return zlib.crc32(stats.encode())
+
+
+def card_level(cards: dict, name: str, card_type: str):
+    """Return the level of a card a user owns.
+
+    Defenses can also be troops, so both are searched for `defenses`.
+    """
+    card_types = ["troops", "defenses"] if card_type == "defenses" else [card_type]
+    for ctype in card_types:
+        if name in cards[ctype]:
+            return cards[ctype][name][0]
+
+
+class CombatPower:
+    """Materialized battle power of user squads and defenses.
+
+    The classic battle only needs the summed power of both sides, which
+    changes only when `active` or a card level changes. It is stored in
+    the document's `power` dict:
+
+        {"stamp": <stats checksum>,
+         "attack": [hp, attps, def_attps, average level],
+         "defense": [def_hp, def_attps],
+         "attack_levels": {card: level}, "defense_levels": {card: level}}
+
+    and refreshed by every command changing them. It is computed again
+    when missing or computed with different card stats.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.stamp = stats_stamp(catalog)
+
+    def compute(self, user_data):
+        """Return the power dict of a user document."""
+        cards = user_data["cards"]
+        # cards removed from the data files do not fight
+        active = {
+            category: {name: count for name, count in selected.items() if name in self.catalog}
+            for category, selected in user_data["active"].items()}
+        # cards that are no longer owned fight at their base level
+        attack_levels = {
+            name: card_level(cards, name, card_type) or self.base_level(name)
+            for card_type in ATTACK_TYPES
+            for name in active[card_type]}
+        defense_levels = {
+            name: card_level(cards, name, "defenses") or self.base_level(name)
+            for name in active["defenses"]}
+        hp, attps, def_attps, avg_level = attack_power(
+            self.catalog, active, lambda name, card_type: attack_levels[name])
+        def_hp, base_def_attps = defense_power(
+            self.catalog, active["defenses"], defense_levels.get)
+        return {
+            "stamp": self.stamp,
+            "attack": [hp, attps, def_attps, avg_level],
+            "defense": [def_hp, base_def_attps],
+            "attack_levels": attack_levels,
+            "defense_levels": defense_levels,
+        }
+
+    def base_level(self, name: str):
+        """Return the lowest level of a card, where its rarity starts."""
+        return self.catalog.stat_table(name)[0].Level
+
+    def power(self, user_data):
+        """Return the stored power, or a computed one when it is stale."""
+        power = user_data.get("power")
+        if not power or power.get("stamp") != self.stamp:
+            power = self.compute(user_data)
+        return power
+
+    def stored(self, user_data):
+        """Return the stored power, storing it first when it is stale."""
+        power = user_data.get("power")
+        if not power or power.get("stamp") != self.stamp:
+            power = self.refresh(user_data)
+        return power
+
+    def refresh(self, user_data):
+        """Recompute and store the power after `active` or a level changed."""
+        power = user_data["power"] = self.compute(user_data)
+        return power
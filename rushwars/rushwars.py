@@ -1,23 +1,42 @@
 # Standard Library
-import csv
-import json
 import random
 import logging
-from collections import namedtuple
+import time
+from datetime import datetime
+from functools import partial
+from pathlib import Path
 from typing import Optional
 from math import ceil
 
 from .boxes import Boxes
+from .cache import UserCache
+from .battle import ATTACK_TYPES
+from .battlelog import BattleLog
+from .confirm import Confirmations
+from .export import EXPORT_SUFFIX, ExportError, export_players, import_players
+from .compute import MODES, ComputePool, open_boxes, register, resolve_battle
+from .catalog import base_card_levels, max_card_level
+from .combat import ENGINES
+from .housing import (DEFENSE_TYPES, SQUAD_CATEGORIES, SQUAD_TYPES, Housing,
+                      parse_cards)
+from .leaderboard import Leaderboards
+from .leagues import LeagueTable
+from .levels import XPTable
+from .matchmaking import MatchmakingIndex
+from .metrics import METRICS, timed
+from .power import CombatPower, card_level
+from .staticdata import DataError, DataStore, StaticData
+from .storage import BACKENDS, ConfigStorage, SQLiteStorage, copy_players, has_defense
 
 # Discord
 import discord
 
 # Redbot
-from redbot.core import commands, Config
+from redbot.core import checks, commands, Config
 from redbot.core.config import Group
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.utils.menus import menu, DEFAULT_CONTROLS
-from redbot.core.utils.chat_formatting import box
+from redbot.core.utils.chat_formatting import box, pagify
 from redbot.core.utils.predicates import ReactionPredicate
 from redbot.core.utils.menus import start_adding_reactions
 
@@ -68,7 +87,16 @@ default_user = {
     "gems": 150,
     "boxes": 0,
     "temp_stars": 0,
-    "temp_def_stars": 0
+    "temp_def_stars": 0,
+    # space used by every category of active, see Housing
+    "housing": {},
+    # battle power of active, see CombatPower
+    "power": {},
+    # preset name -> saved active categories
+    "presets": {
+        "squad": {},
+        "defense": {}
+    }
 }
 
 default_defenses = [
@@ -80,34 +108,8 @@ default_defenses = [
     {"Pitcher": 3, "Shields": 1}
 ]
 
-base_card_levels = {
-    "common": 1,
-    "rare": 5,
-    "epic": 9,
-    "commander": 13
-}
-
-max_card_level = 20
-
 TOTAL_CARDS = 43
 
-LEAGUE_ICONS_BASE_URL = "https://www.rushstats.com/assets/league/"
-# (lower limit, upper limit, box multiplier)
-LEAGUES = {
-    "Rookie": (0, 200, 120),
-    "Bronze": (200, 600, 140),
-    "Silver": (600, 1200, 160),
-    "Gold": (1200, 1800, 180),
-    "Specialist": (1800, 2400, 200),
-    "Ninja": (2400, 3000, 220),
-    "Destroyer": (3000, 4000, 240),
-    "Champion": (4000, 5200, 260),
-    "Legend": (5200, 6500, 280),
-    "Supreme": (6500, 8000, 300),
-    "Superstar": (8000, 10000, 320),
-    "Elite": (10000, 12000, 340)
-}
-
 STAT_EMOTES = {
     "Experience": "<:RW_XP:625783207518011412>",
     "Stars": "<:RW_Stars:626716336797777921>",
@@ -135,51 +137,224 @@ STAT_EMOTES = {
 
 LEVEL_BASE_URL = "https://www.rushstats.com/assets/level/"
 
+# maximum number of pages (10 players each) shown in rushboard
+LEADERBOARD_PAGES = 10
+
 LowGoldError = "You do not have enough gold"
 
+# defense stars needed for a defense box
+DEFENSE_BOX_STARS = 100
+
+# battles shown by rushhistory, 5 per page
+HISTORY_BATTLES = 50
+
+# card types allowed in squad and defense presets
+PRESET_TYPES = {"squad": SQUAD_TYPES, "defense": DEFENSE_TYPES}
+MAX_PRESETS = 5
+
+# most players exported from Config, which loads all of them at once
+CONFIG_EXPORT_LIMIT = 10_000
+
 
 class RushWars(BaseCog):
     """Simulate Rush Wars"""
 
-    def __init__(self):
+    def __init__(self, bot):
+        self.bot = bot
         self.path = bundled_data_path(self)
 
         self.config = Config.get_conf(
             self, 1_070_701_001, force_registration=True)
 
-        self.XP_LEVELS: dict = None
-        self.HQ_LEVELS: dict = None
-        self.CHOPPER_LEVELS: dict = None
-        self.BOXES_INFO: dict = None
-        self.RARITY_INFO: dict = None
-        self.TIPS: list = None
+        self.DATA = DataStore(self.path)
+        self.LEAGUES = LeagueTable()
+        self.MATCHMAKING = MatchmakingIndex()
+        self.LEADERBOARDS = Leaderboards()
+        self.METRICS = METRICS
+        self.BATTLE_LOG: BattleLog = None
+        self.COMPUTE = ComputePool()
+        self.CONFIRMATIONS = Confirmations(*ReactionPredicate.YES_OR_NO_EMOJIS)
+        # guild_id -> combat engine, for guilds not using "classic"
+        self.GUILD_ENGINES = {}
+        self._index_task = None
 
         self.config.register_user(**default_user)
+        self.config.register_global(
+            executor_mode="inline", confirm_timeout=60, storage_backend="config")
+        self.config.register_guild(combat_engine="classic")
+        self.users = UserCache(ConfigStorage(self.config))
 
     async def initialize(self):
         """This will load all the bundled data into respective variables."""
+        self.apply_data(self.DATA.load())
+        self.COMPUTE.set_mode(await self.config.executor_mode())
+        self.CONFIRMATIONS.timeout = await self.config.confirm_timeout()
+        self.GUILD_ENGINES = {
+            guild_id: data["combat_engine"]
+            for guild_id, data in (await self.config.all_guilds()).items()
+            if data.get("combat_engine", "classic") != "classic"
+        }
+        if await self.config.storage_backend() == "sqlite":
+            self.users = UserCache(SQLiteStorage(self.database_path, default_user))
+
+        self.BATTLE_LOG = BattleLog(cog_data_path(self) / "battles")
+        self.BATTLE_LOG.start(self.bot.loop)
+
+        self._index_task = self.bot.loop.create_task(self.rebuild_indexes())
+        self.users.start(self.bot.loop)
+
+    # the bundled data of the current snapshot, swapped as a whole on reload
+    @property
+    def XP_LEVELS(self) -> dict:
+        return self.DATA.snapshot.xp_levels
+
+    @property
+    def XP_TABLE(self) -> XPTable:
+        return self.DATA.snapshot.xp_table
+
+    @property
+    def HQ_LEVELS(self) -> dict:
+        return self.DATA.snapshot.hq_levels
+
+    @property
+    def CHOPPER_LEVELS(self) -> dict:
+        return self.DATA.snapshot.chopper_levels
+
+    @property
+    def BOXES_INFO(self) -> dict:
+        return self.DATA.snapshot.boxes_info
+
+    @property
+    def RARITY_INFO(self) -> dict:
+        return self.DATA.snapshot.rarity_info
+
+    @property
+    def TIPS(self) -> list:
+        return self.DATA.snapshot.tips
+
+    @property
+    def CATALOG(self):
+        return self.DATA.snapshot.catalog
+
+    @property
+    def HOUSING(self) -> Housing:
+        return self.DATA.snapshot.housing
+
+    @property
+    def POWER(self) -> CombatPower:
+        return self.DATA.snapshot.power
+
+    @property
+    def SIMULATOR(self):
+        return self.DATA.snapshot.simulator
+
+    @property
+    def BOXES(self):
+        return self.DATA.snapshot.boxes
+
+    @property
+    def database_path(self):
+        return cog_data_path(self) / "players.db"
+
+    @property
+    def exports_path(self):
+        return cog_data_path(self) / "exports"
+
+    def apply_data(self, snapshot: StaticData):
+        """Make a loaded snapshot available to the compute workers."""
+        register(snapshot)
+
+    def cog_unload(self):
+        if self._index_task:
+            self._index_task.cancel()
+        # write back every cached change before the cog goes away
+        self.bot.loop.create_task(self.users.close())
+        if self.BATTLE_LOG:
+            self.bot.loop.create_task(self.BATTLE_LOG.close())
+        self.COMPUTE.close()
+        self.CONFIRMATIONS.cancel_all()
+
+    @listener()
+    async def on_reaction_add(self, reaction, user):
+        # answers every pending prompt, see Confirmations
+        if user.bot or not len(self.CONFIRMATIONS):
+            return
+        self.CONFIRMATIONS.dispatch(reaction.message.id, user.id, str(reaction.emoji))
+
+    async def cog_before_invoke(self, ctx):
+        # group commands run this hook again for their subcommand
+        perf = getattr(ctx, "rushwars_perf", None)
+        if perf is not None:
+            perf[3] += 1
+            return
+        ctx.rushwars_perf = [time.perf_counter(), self.users.reads, self.users.commits, 1]
+
+    async def cog_after_invoke(self, ctx):
+        perf = getattr(ctx, "rushwars_perf", None)
+        if perf is None:
+            return
+        start, reads, commits, hooks = perf
+        # the group callback finishes before its subcommand is prepared
+        if ctx.invoked_subcommand is not None and hooks < 2:
+            return
+        command = ctx.invoked_subcommand or ctx.command
+        name = f"command.{command.qualified_name.replace(' ', '_')}"
+        self.METRICS.observe(name, time.perf_counter() - start)
+        self.METRICS.incr(f"{name}.invocations")
+        self.METRICS.incr(f"{name}.config_reads", self.users.reads - reads)
+        self.METRICS.incr(f"{name}.user_commits", self.users.commits - commits)
+
+    async def send(self, ctx, *args, **kwargs):
+        """Reply to a command, timing the Discord call as `discord_send`."""
+        with self.METRICS.timer("discord_send"):
+            return await ctx.send(*args, **kwargs)
+
+    def perf_gauges(self):
+        """Return current cache and index sizes for the metric exports."""
+        users = self.users
+        lookups = users.hits + users.misses
+        return {
+            "cache_hits": users.hits,
+            "cache_misses": users.misses,
+            "cache_hit_rate": round(users.hits / lookups, 4) if lookups else 0,
+            "cache_size": len(users),
+            "cache_dirty": users.dirty,
+            "config_reads": users.reads,
+            "config_writes": users.writes,
+            "leaderboard_players": len(self.LEADERBOARDS.global_board),
+            "pending_confirmations": len(self.CONFIRMATIONS),
+        }
+
+    @timed("rebuild_indexes")
+    async def rebuild_indexes(self):
+        """Rebuild the matchmaking index and leaderboards from the storage."""
+        await self.bot.wait_until_ready()
+        storage = self.users.storage
         try:
-            xp_levels_fp = bundled_data_path(self) / "xp_levels.json"
-            hq_levels_fp = bundled_data_path(self) / "hq_levels.json"
-            chopper_levels_fp = bundled_data_path(self) / "chopper_levels.json"
-            boxes_fp = bundled_data_path(self) / "boxes.json"
-            rarities_fp = bundled_data_path(self) / "rarities.json"
-            tips_fp = bundled_data_path(self) / "tips.json"
+            self.METRICS.incr(f"{storage.name}.ranking")
+            ranking = await storage.ranking()
         except:
-            log.exception("Error with file path.")
-
-        with xp_levels_fp.open("r") as f:
-            self.XP_LEVELS = json.load(f)
-        with hq_levels_fp.open("r") as f:
-            self.HQ_LEVELS = json.load(f)
-        with chopper_levels_fp.open("r") as f:
-            self.CHOPPER_LEVELS = json.load(f)
-        with boxes_fp.open("r") as f:
-            self.BOXES_INFO = json.load(f)
-        with rarities_fp.open("r") as f:
-            self.RARITY_INFO = json.load(f)
-        with tips_fp.open("r") as f:
-            self.TIPS = json.load(f)
+            log.exception("Error rebuilding matchmaking index.")
+            return
+
+        index = MatchmakingIndex()
+        leaderboards = Leaderboards()
+        players = {}
+        # most stars first, so every board insert appends
+        for user_id, stars, defense in ranking:
+            leaderboards.update(user_id, stars)
+            players[user_id] = (stars, defense)
+        for guild in self.bot.guilds:
+            for member in guild.members:
+                player = players.get(member.id)
+                if player is None:
+                    continue
+                stars, defense = player
+                index.update(member.id, stars, defense, guild.id)
+                leaderboards.update(member.id, stars, guild.id)
+        self.MATCHMAKING = index
+        self.LEADERBOARDS = leaderboards
+        log.debug(f"Indexes rebuilt with {len(players)} players.")
 
     @commands.command(name="rushversion", autohelp=True)
     @commands.cooldown(rate=5, per=120, type=commands.BucketType.guild)
@@ -200,156 +375,142 @@ class RushWars(BaseCog):
             if member.id == ctx.author.id:
                 return await ctx.send("You can't battle against yourself!")
 
+        # pick the opponent from the cached documents; the battle itself
+        # runs in a transaction below
         try:
-            async with self.config.user(ctx.author).active() as active:
-                troops = active["troops"]
-                airdrops = active["airdrops"]
-                commanders = active["commanders"]
-                player = ctx.author.name
+            attacker = await self.users.get(ctx.author)
         except Exception as ex:
-            return await ctx.send(f"Error with character sheet!")
             log.exception(f"Error with character sheet: {ex}!")
+            return await ctx.send(f"Error with character sheet!")
 
-        try:
-            async with self.config.user(ctx.author).stars() as tot_stars:
-                att_stars = tot_stars["attack"]
-                def_stars = tot_stars["defense"]
-        except:
-            log.exception("Error with character sheet.")
-            return
+        player = ctx.author.name
 
-        total_stars = att_stars + def_stars
+        total_stars = attacker["stars"]["attack"] + attacker["stars"]["defense"]
 
+        defender = None
+        notice = None
         if member:
             try:
-                async with self.config.user(member).active() as active:
-                    defenses = active["defenses"]
-                    opponent = member.name
+                defender = await self.users.get(member)
             except:
                 log.exception("Error with character sheet.")
                 return
+            defenses = defender["active"]["defenses"]
+            opponent = member.name
             if not defenses:
                 return await ctx.send("User has not set up a defense.")
 
-            opponent_stars = await self.get_stars(member)
+            opponent_stars = defender["stars"]["attack"] + \
+                defender["stars"]["defense"]
             if total_stars - opponent_stars >= 100:
                 return await ctx.send(f"Can't attack {opponent} because of large difference in stars.")
 
             if total_stars < 10:
-                await ctx.send("First 4 battles must be against computer. Changing to computer...")
+                notice = "First 4 battles must be against computer. Changed to computer."
                 defenses = random.choice(default_defenses)
                 opponent = "Computer"
+                member = None
+                defender = None
         else:
             defenses = random.choice(default_defenses)
             opponent = "Computer"
             if total_stars > 10:
-                member = await self.matchmaking(ctx)
+                member = await self.matchmaking(ctx, total_stars)
                 if member:
                     try:
-                        async with self.config.user(member).active() as active:
-                            defenses = active["defenses"]
-                            opponent = member.name
+                        defender = await self.users.get(member)
                     except:
                         log.exception("Error with character sheet.")
                         return
+                    defenses = defender["active"]["defenses"]
+                    opponent = member.name
 
-        hp = 0
-        attps = 0
-        def_hp = 0
-        def_attps = 0
-        user_avg_levels = [0, 0]  # [iterations, value]
-
-        sel_trp = sum(troops.values())
-        sel_ardp = sum(airdrops.values())
-
-        if sel_trp == 0 or sel_trp == 0:
-            return await ctx.send("Please add items to squad! Help: `[p]help squad`")
-
-        foo = await self.cost_gold(ctx)
-        if not foo:
-            return await ctx.send("You do not have enough gold to cover attack costs.")
-
-        for troop in troops.keys():
-            stats = self.card_search(troop)[1]
-            level = await self.rush_card_level(ctx, troop.title(), "troops")
-            lvl_stats = [int(stats.Hp), int(stats.Att)]
-            upd_stats = self.card_level(
-                level, lvl_stats, stats.Rarity, "troops")
-
-            count = troops[troop]
-
-            hp += upd_stats[0] * count
-            # return await ctx.send(hp)
-            att = upd_stats[1] * count
-            attps += (att/float(stats.AttSpeed))
-
-            user_avg_levels[0] += 1
-            user_avg_levels[1] += level
-
-        for airdrop in airdrops.keys():
-            stats = self.card_search(airdrop)[1]
-            level = await self.rush_card_level(ctx, airdrop.title(), "airdrops")
-
-            lvl_stats = [int(stats.Duration)]
-            upd_stats = self.card_level(
-                level, lvl_stats, stats.Rarity, "airdrops")
-
-            count = airdrops[airdrop]
-
-            duration = upd_stats[0] * count
-
-            ability = stats.Ability
-            if ability == "Damage":
-                attps += int(stats.Value) * duration
-            elif ability == "Boost":
-                attps += int(stats.Value) * duration
-                hp += int(stats.Value) * duration
-            elif ability == "Heal":
-                hp += int(stats.Value) * duration
-            elif ability in ["Invisibility", "Freeze"]:
-                def_attps -= int(stats.Value) * duration
-
-            user_avg_levels[0] += 1
-            user_avg_levels[1] += level
-
-        for commander in commanders.keys():
-            stats = self.card_search(commander)[1]
-            level = await self.rush_card_level(ctx, commander.title(), "commanders")
-            lvl_stats = [int(stats.Hp), int(stats.Att)]
-            upd_stats = self.card_level(
-                level, lvl_stats, stats.Rarity, "commanders")
-
-            count = commanders[commander]
+        engine = "classic"
+        if ctx.guild is not None:
+            engine = self.GUILD_ENGINES.get(ctx.guild.id, "classic")
+
+        # both players are locked from here until the results are committed
+        async with self.users.transaction(ctx.author, member) as (attacker, defender):
+            troops = attacker["active"]["troops"]
+            airdrops = attacker["active"]["airdrops"]
+            commanders = attacker["active"]["commanders"]
+            total_stars = attacker["stars"]["attack"] + attacker["stars"]["defense"]
+            # either player may have changed since the opponent was picked
+            if defender is not None:
+                defenses = defender["active"]["defenses"]
+                if not has_defense(defender["active"]):
+                    return await ctx.send(f"{opponent} has not set up a defense.")
+                opponent_stars = defender["stars"]["attack"] + defender["stars"]["defense"]
+                if total_stars - opponent_stars >= 100:
+                    return await ctx.send(f"Can't attack {opponent} because of large difference in stars.")
+
+            sel_trp = sum(troops.values())
+
+            if sel_trp == 0:
+                return await ctx.send("Please add items to squad! Help: `[p]help squad`")
+
+            if not self.cost_gold(attacker):
+                return await ctx.send("You do not have enough gold to cover attack costs.")
+
+            power = self.POWER.stored(attacker)
+            attack_levels = power["attack_levels"]
+            defense = None
+            if defender is not None:
+                defender_power = self.POWER.stored(defender)
+                def_levels = defender_power["defense_levels"]
+                defense = defender_power["defense"]
+            else:
+                # the computer's levels are picked around the squad's levels
+                def_levels = None
+
+            # battle logic
+            battle = (self.DATA.snapshot.key, random.getrandbits(64), attacker["active"],
+                      attack_levels, defenses, def_levels, engine, power["attack"], defense)
+            if engine == "classic" and defense is not None:
+                # both sides are materialized, only the score is left
+                stars, def_levels = resolve_battle(*battle)
+            else:
+                stars, def_levels = await self.COMPUTE.run(resolve_battle, *battle)
 
-            hp += upd_stats[0] * count
-            # return await ctx.send(hp)
-            att = upd_stats[1] * count
-            attps += (att/float(stats.AttSpeed))
+            if total_stars < 9:
+                stars = 3
+            elif total_stars < 10:
+                stars = 1
 
-            user_avg_levels[0] += 1
-            user_avg_levels[1] += level
+            rewards = self.get_rewards(attacker, stars)
 
-        user_avg_level = round(user_avg_levels[1]/user_avg_levels[0])
+            box = None
+            open_box = self.handle_keys(attacker, stars)
+            if open_box:
+                box = await self.open_reward_box(attacker)
 
-        for defense in defenses.keys():
-            stats = self.card_search(defense)[1]
-            if member:
-                level = await self.rush_card_level(ctx, defense.title(), "defenses")
-            else:
-                level = random.choice(
-                    range(user_avg_level-1, user_avg_level+2))
-                if level < 1:
-                    level = 1
+            # update defense stars of opponent
+            if stars != 3 and defender is not None:
+                defender["stars"]["defense"] += 3 - stars
 
-            lvl_stats = [int(stats.Hp), int(stats.Att)]
-            upd_stats = self.card_level(
-                level, lvl_stats, stats.Rarity, "defenses")
+            level_up = self.xp_level_handler(attacker)
 
-            count = defenses[defense]
+        self.index_player(ctx.author, ctx.guild, attacker)
+        if defender is not None:
+            self.index_player(member, ctx.guild, defender)
 
-            def_hp += upd_stats[0] * count
-            def_att = upd_stats[1] * count
-            def_attps += (def_att/float(stats.AttSpeed))
+        # the battle is committed, a failing history entry must not hide it
+        try:
+            self.BATTLE_LOG.append({
+                "t": int(time.time()),
+                "a": ctx.author.id,
+                "d": member.id if defender is not None else None,
+                "s": stars,
+                "g": rewards[1],
+                "x": rewards[2],
+                "sq": {name: [count, attack_levels.get(name)]
+                       for card_type in ATTACK_TYPES
+                       for name, count in attacker["active"][card_type].items()},
+                "df": {name: [count, def_levels.get(name)]
+                       for name, count in defenses.items()},
+            })
+        except:
+            log.exception("Error logging battle.")
 
         troop = [(troop, troops[troop]) for troop in troops.keys()]
         airdrop = [(airdrop, airdrops[airdrop]) for airdrop in airdrops.keys()]
@@ -367,71 +528,391 @@ class RushWars(BaseCog):
             attack_str += self.rush_strings(commander)
         defense_str = self.rush_strings(defense)
 
-        embed = discord.Embed(colour=0x98D9EB, title="Battle Info",
-                              description="Will you get mega rich after this battle?")
-        embed.set_author(name=f"{player} vs {opponent}",
-                         icon_url="https://cdn.discordapp.com/attachments/622323508755693581/626058519929684027/Leaderboard.png")
-        embed.add_field(
-            name="Attack <:RW_Attck:625783202836905984>", value=attack_str)
-        embed.add_field(
-            name="Defense <:RW_Defenses:626339085501333504>", value=defense_str)
-        await ctx.send(embed=embed)
-
-        # battle logic
-        res = hp/def_attps - def_hp/attps
-        if res > 8:
-            stars = 3
-        elif res > 4:
-            stars = 2
-        elif res > 0:
-            stars = 1
+        # every outcome of the battle goes out in a single message
+        embed = self.battle_embed(player, opponent, attack_str, defense_str,
+                                  stars, rewards, box, level_up)
+        if notice:
+            embed.set_footer(text=notice)
+        await self.send(ctx, embed=embed)
+
+    @commands.command(name="rushhistory")
+    @commands.cooldown(rate=1, per=10, type=commands.BucketType.user)
+    async def rush_history(self, ctx, member: discord.Member = None):
+        """Show recent battles: `[p]rushhistory [member]`"""
+        user = member or ctx.author
+        battles = await self.BATTLE_LOG.history(user.id, HISTORY_BATTLES)
+        if not battles:
+            return await ctx.send(f"No battles found for {user.name}.")
+
+        pages = ceil(len(battles) / 5)
+        embeds = []
+        for page in range(pages):
+            embed = discord.Embed(colour=0x98D9EB)
+            embed.set_author(name=f"{user.name}'s Battles",
+                             icon_url="https://cdn.discordapp.com/attachments/622323508755693581/626058519929684027/Leaderboard.png")
+            for battle in battles[page * 5:(page + 1) * 5]:
+                attacking = battle["a"] == user.id
+                opponent_id = battle["d"] if attacking else battle["a"]
+                if opponent_id is None:
+                    opponent = "Computer"
+                else:
+                    opponent = self.bot.get_user(opponent_id) or "Unknown player"
+                when = datetime.utcfromtimestamp(battle["t"]).strftime("%Y-%m-%d %H:%M")
+
+                if attacking:
+                    name = f"{STAT_EMOTES['Attack Stars']} Attack on {opponent}"
+                    result = f"{STAT_EMOTES['Stars']} {battle['s']} " \
+                        f"{STAT_EMOTES['Gold_Icon']} {battle['g']} " \
+                        f"{STAT_EMOTES['Experience']} {battle['x']}"
+                else:
+                    name = f"{STAT_EMOTES['Defense Stars']} Defense against {opponent}"
+                    result = f"{STAT_EMOTES['Defense Stars']} {3 - battle['s']}"
+
+                squad = ", ".join(f"{card} x{count} (L{level or '?'})"
+                                  for card, (count, level) in battle["sq"].items())
+                defense = ", ".join(f"{card} x{count} (L{level or '?'})"
+                                    for card, (count, level) in battle["df"].items())
+                value = f"{result} `{when} UTC`\nSquad: {squad}\nDefense: {defense}"
+                embed.add_field(name=name, value=value[:1024], inline=False)
+            if pages > 1:
+                embed.set_footer(text=f"Page {page+1}/{pages}")
+            embeds.append(embed)
+
+        if len(embeds) == 1:
+            return await self.send(ctx, embed=embeds[0])
+        await menu(ctx, embeds, DEFAULT_CONTROLS)
+
+    @commands.command(name="rushsim")
+    @commands.is_owner()
+    async def rush_sim(self, ctx, battles: int = 100000, member: discord.Member = None):
+        """Simulate battles of a squad against the computer.
+
+        Uses your squad unless a member is specified. Reports win rate and
+        star distribution.
+            Examples:
+                `[p]rushsim`
+                `[p]rushsim 1000000 @member`
+        """
+        if battles < 1 or battles > 10_000_000:
+            return await ctx.send("Number of battles must be between 1 and 10000000.")
+
+        user = member or ctx.author
+        try:
+            user_data = await self.users.get(user)
+        except:
+            log.exception("Error with character sheet.")
+            return
+
+        # same levels as in rush: cards no longer owned fight at their base
+        # level and cards removed from the data files do not fight
+        levels = dict(self.POWER.power(user_data)["attack_levels"])
+        active = {
+            card_type: {name: count for name, count in user_data["active"][card_type].items()
+                        if name in levels}
+            for card_type in ATTACK_TYPES}
+        if not sum(active["troops"].values()):
+            return await ctx.send(f"{user.name} has no troops in squad.")
+
+        async with ctx.typing():
+            report = await self.bot.loop.run_in_executor(
+                None, partial(self.SIMULATOR.simulate_computer,
+                              active, levels, default_defenses, battles))
+
+        stars_str = ""
+        for stars, share in report["stars"].items():
+            stars_str += f"{STAT_EMOTES['Stars']} {stars}: `{share:.2%}`\n"
+
+        embed = discord.Embed(colour=0x98D9EB, title="Battle Simulation",
+                              description=f"{report['battles']} battles of {user.name}'s squad against the computer.")
+        embed.add_field(name="Win Rate", value=f"{report['win_rate']:.2%}")
+        embed.add_field(name="Average Stars",
+                        value=f"{report['average_stars']:.2f}")
+        embed.add_field(name="Star Distribution", value=stars_str)
+        await self.send(ctx, embed=embed)
+
+    @commands.group(name="rushset")
+    @commands.is_owner()
+    async def rushset(self, ctx):
+        """Configure Rush Wars."""
+        pass
+
+    @rushset.command(name="executor")
+    async def rushset_executor(self, ctx, mode: str = None):
+        """Choose where battles and boxes are computed: `[p]rushset executor [mode]`
+            Modes:
+                `inline` - on the bot's event loop (default)
+                `thread` - in a thread pool
+                `process` - in a process pool, keeps a busy bot responsive
+        """
+        if mode is None:
+            return await ctx.send(f"Battles and boxes are computed in `{self.COMPUTE.mode}` mode.")
+        mode = mode.lower()
+        if mode not in MODES:
+            return await ctx.send(f"Mode must be one of: {', '.join(MODES)}.")
+        self.COMPUTE.set_mode(mode)
+        await self.config.executor_mode.set(mode)
+        await ctx.send(f"Battles and boxes are now computed in `{mode}` mode.")
+
+    @rushset.command(name="timeout")
+    async def rushset_timeout(self, ctx, seconds: int = None):
+        """Set how long confirmations wait for a reaction: `[p]rushset timeout [seconds]`"""
+        if seconds is None:
+            return await ctx.send(
+                f"Confirmations expire after {self.CONFIRMATIONS.timeout} seconds.")
+        if seconds < 5 or seconds > 600:
+            return await ctx.send("Timeout must be between 5 and 600 seconds.")
+        self.CONFIRMATIONS.timeout = seconds
+        await self.config.confirm_timeout.set(seconds)
+        await ctx.send(f"Confirmations now expire after {seconds} seconds.")
+
+    @rushset.command(name="storage")
+    async def rushset_storage(self, ctx, backend: str = None):
+        """Choose where player data is stored: `[p]rushset storage [backend]`
+            Backends:
+                `config` - Red's Config (default)
+                `sqlite` - a SQLite database in the cog's data folder
+            Switching copies every player to the new backend, replacing
+            the players stored there, and uses it right away.
+        """
+        storage = self.users.storage
+        if backend is None:
+            stats = await storage.stats(time.time() - 7 * 24 * 3600)
+            desc = f"Player data is stored in `{storage.name}`."
+            if stats:
+                desc += f"\n{stats['players']} players, {stats['active']} active in the last 7 days."
+            return await ctx.send(desc)
+        backend = backend.lower()
+        if backend not in BACKENDS:
+            return await ctx.send(f"Backend must be one of: {', '.join(BACKENDS)}.")
+        if backend == storage.name:
+            return await ctx.send(f"Player data is already stored in `{backend}`.")
+
+        msg = await ctx.send(
+            f"Every player stored in `{backend}` will be replaced with the players "
+            f"in `{storage.name}`. Continue?")
+        confirmed = await self.confirm(ctx, msg)
+        if not confirmed:
+            return
+
+        if backend == "sqlite":
+            target = SQLiteStorage(self.database_path, default_user)
         else:
-            stars = 0
+            target = ConfigStorage(self.config)
+        # no player changes until the cache uses the new backend
+        async with ctx.typing(), self.users.exclusive():
+            await self.users.flush()
+            try:
+                if self.users.dirty:
+                    raise RuntimeError(f"{self.users.dirty} players could not be written.")
+                await target.clear()
+                count = await copy_players(storage, target, default_user)
+            except:
+                log.exception(f"Error copying player data to {backend}.")
+                await target.close()
+                return await ctx.send("Switching failed, player data stays in "
+                                      f"`{storage.name}`. Check your logs for details.")
+            self.users.storage = target
+            await self.config.storage_backend.set(backend)
+        await storage.close()
+        await ctx.send(f"Copied {count} players, player data is now stored in `{backend}`.")
+
+    @rushset.command(name="export")
+    async def rushset_export(self, ctx):
+        """Back up all player data to a compressed file: `[p]rushset export`"""
+        players = len(self.LEADERBOARDS.global_board)
+        if self.users.storage.name == "config" and players > CONFIG_EXPORT_LIMIT:
+            # Config can only read every player at once
+            return await ctx.send(
+                f"{players} players are too many to export from Config. "
+                f"Move them to SQLite with `{ctx.prefix}rushset storage sqlite` first.")
+        await self.users.flush()
+        path = self.exports_path / f"players-{datetime.utcnow():%Y%m%d-%H%M%S}{EXPORT_SUFFIX}"
+        try:
+            async with ctx.typing():
+                count = await export_players(self.users.storage, path)
+        except:
+            log.exception("Error exporting player data.")
+            return await ctx.send("Export failed, check your logs for details.")
+        await ctx.send(f"Exported {count} players to `{path.name}`.")
 
-        if total_stars < 9:
-            stars = 3
-        elif total_stars < 10:
-            stars = 1
+    @rushset.command(name="import")
+    async def rushset_import(self, ctx, file: str = None):
+        """Restore player data from an export: `[p]rushset import [file]`
 
-        if stars > 0:
-            victory = True
-            await ctx.send(f"You win!")
+            Lists the available exports without a file. Players in the
+            export are overwritten, other players are kept.
+        """
+        exports = sorted(self.exports_path.glob(f"*{EXPORT_SUFFIX}"))
+        if file is None:
+            if not exports:
+                return await ctx.send(f"No exports found, use `{ctx.prefix}rushset export` first.")
+            return await ctx.send(box("\n".join(path.name for path in exports)))
+        # only files in the exports folder can be imported
+        path = self.exports_path / Path(file).name
+        if path not in exports:
+            return await ctx.send(f"`{path.name}` is not in the exports folder.")
+
+        # no player changes until the indexes match the imported players
+        async with ctx.typing(), self.users.exclusive():
+            # a dirty cached document written later would overwrite an imported one
+            await self.users.flush()
+            if self.users.dirty:
+                return await ctx.send(
+                    f"Import cancelled, {self.users.dirty} players could not be saved. "
+                    "Check your logs for details.")
+            try:
+                user_ids = await import_players(self.users.storage, path, default_user)
+            except ExportError as ex:
+                error = f"Import failed: {ex}"
+            except:
+                log.exception("Error importing player data.")
+                error = "Import failed, check your logs for details."
+            else:
+                error = None
+            # cached documents may be older than the stored ones, even when
+            # only a part of the file was written; none of them is dirty
+            self.users.clear()
+            await self.rebuild_indexes()
+        if error:
+            return await ctx.send(error)
+        await ctx.send(f"Imported {len(user_ids)} players from `{path.name}`.")
+
+    @commands.group(name="rushserver")
+    @commands.guild_only()
+    @checks.admin_or_permissions(manage_guild=True)
+    async def rushserver(self, ctx):
+        """Configure Rush Wars for this server."""
+        pass
+
+    @rushserver.command(name="engine")
+    async def rushserver_engine(self, ctx, engine: str = None):
+        """Choose how battles in this server are fought: `[p]rushserver engine [engine]`
+            Engines:
+                `classic` - compares squad and defense power (default)
+                `tick` - simulates every unit second by second, using card
+                         counts, targets, flying units and airdrop durations
+        """
+        if engine is None:
+            engine = self.GUILD_ENGINES.get(ctx.guild.id, "classic")
+            return await ctx.send(f"Battles in this server use the `{engine}` engine.")
+        engine = engine.lower()
+        if engine not in ENGINES:
+            return await ctx.send(f"Engine must be one of: {', '.join(ENGINES)}.")
+        await self.config.guild(ctx.guild).combat_engine.set(engine)
+        if engine == "classic":
+            self.GUILD_ENGINES.pop(ctx.guild.id, None)
         else:
-            victory = False
-            await ctx.send("You lose!")
-
-        rewards = await self.get_rewards(ctx, stars)
-        await ctx.send(embed=rewards)
-
-        open_box = await self.handle_keys(ctx, stars)
-        if open_box:
-            box = await self._box(ctx)
-            await ctx.send(embed=box)
-
-        # update defense stars of opponent
-        if stars != 3:
-            if member:
-                async with self.config.user(member).stars() as member_stars:
-                    def_stars = member_stars["defense"] + (3 - stars)
-                await self.config.user(member).set_raw("stars", "defense", value=def_stars)
-
-        level_up = True
-        while level_up:
-            level_up = await self.xp_level_handler(ctx)
-            if level_up:
-                await ctx.send(level_up[0])
-                await ctx.send(level_up[1])
+            self.GUILD_ENGINES[ctx.guild.id] = engine
+        await ctx.send(f"Battles in this server now use the `{engine}` engine.")
+
+    @commands.group(name="rushdata")
+    @commands.is_owner()
+    async def rushdata(self, ctx):
+        """Manage the bundled game data."""
+        pass
+
+    @rushdata.command(name="reload")
+    async def rushdata_reload(self, ctx, force: bool = False):
+        """Load changed data files without reloading the cog: `[p]rushdata reload [force]`
+            Only files modified since they were loaded are parsed again,
+            unless `force` is true. Invalid files leave the current data in use.
+        """
+        try:
+            snapshot, changed = await self.bot.loop.run_in_executor(
+                None, partial(self.DATA.reload, force))
+        except DataError as ex:
+            return await ctx.send(f"Data was not reloaded: {ex}")
+        if not changed:
+            return await ctx.send("No data files changed.")
+        self.apply_data(snapshot)
+        await ctx.send(
+            f"Loaded data version {snapshot.version} from: {', '.join(sorted(changed))}.")
+
+    @rushdata.command(name="info")
+    async def rushdata_info(self, ctx):
+        """Show the loaded data version: `[p]rushdata info`"""
+        snapshot = self.DATA.snapshot
+        await ctx.send(
+            f"Data version {snapshot.version}: {len(snapshot.catalog)} cards, "
+            f"{len(snapshot.hq_levels)} HQ levels, {len(snapshot.xp_levels)} player levels, "
+            f"{len(snapshot.tips)} tips.")
+
+    @commands.group(name="rushstats")
+    @commands.is_owner()
+    async def rushstats(self, ctx):
+        """Performance statistics of the cog."""
+        pass
+
+    @rushstats.command(name="perf")
+    async def rushstats_perf(self, ctx):
+        """Show latency, Config and cache statistics: `[p]rushstats perf`"""
+        metrics = self.METRICS
+        if not metrics.timings:
+            return await ctx.send("No statistics recorded yet.")
+
+        lines = [f"{'name':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"]
+        for name in sorted(metrics.timings):
+            hist = metrics.timings[name]
+            lines.append(
+                f"{name:<28}{hist.count:>8}{hist.mean * 1000:>10.2f}"
+                f"{hist.quantile(0.5) * 1000:>10.2f}{hist.quantile(0.95) * 1000:>10.2f}"
+                f"{hist.quantile(0.99) * 1000:>10.2f}{hist.max * 1000:>10.2f}")
+        lines.append("(milliseconds)")
+
+        lines.append("")
+        lines.append(f"{'command':<28}{'runs':>8}{'reads/run':>12}{'commits/run':>12}")
+        for name in sorted(metrics.timings):
+            runs = metrics.counters.get(f"{name}.invocations")
+            if not runs:
+                continue
+            reads = metrics.counters[f"{name}.config_reads"] / runs
+            commits = metrics.counters[f"{name}.user_commits"] / runs
+            lines.append(f"{name:<28}{runs:>8}{reads:>12.2f}{commits:>12.2f}")
+
+        lines.append("")
+        for name, value in self.perf_gauges().items():
+            lines.append(f"{name:<28}{value:>12}")
+        uptime = time.time() - metrics.started
+        lines.append(f"{'collected for (s)':<28}{uptime:>12.0f}")
+
+        for page in pagify("\n".join(lines), shorten_by=10):
+            await ctx.send(box(page))
+
+    @rushstats.command(name="export")
+    async def rushstats_export(self, ctx, target: str = "file"):
+        """Export statistics to a Prometheus text file or the log.
+            Examples:
+                `[p]rushstats export`
+                `[p]rushstats export log`
+        """
+        gauges = self.perf_gauges()
+        if target.lower() == "log":
+            log.info(f"perf {self.METRICS.to_log_line(gauges)}")
+            return await ctx.send("Statistics written to the log.")
+        if target.lower() != "file":
+            return await ctx.send("Export target must be `file` or `log`.")
+
+        path = cog_data_path(self) / "metrics.prom"
+        text = self.METRICS.to_prometheus(gauges)
+        await self.bot.loop.run_in_executor(None, path.write_text, text)
+        await ctx.send(f"Statistics written to `{path}`.")
+
+    @rushstats.command(name="reset")
+    async def rushstats_reset(self, ctx):
+        """Clear all recorded statistics: `[p]rushstats reset`"""
+        self.METRICS.reset()
+        await ctx.send("Statistics reset.")
 
     @commands.command(name="rushinfo")
     @commands.cooldown(rate=1, per=30, type=commands.BucketType.user)
     async def rush_info(self, ctx):
         """Get information related to rush (battle)."""
-        hq = await self.config.user(ctx.author).hq()
+        user_data = await self.users.get(ctx.author)
 
-        attack_cost = self.HQ_LEVELS[str(hq)]["AttackCost"]
-        temp_stars = await self.config.user(ctx.author).temp_stars()
-        temp_def_stars = await self.config.user(ctx.author).temp_def_stars()
-        keys = await self.config.user(ctx.author).keys()
+        attack_cost = self.HQ_LEVELS[str(user_data["hq"])]["AttackCost"]
+        temp_stars = user_data["temp_stars"]
+        temp_def_stars = user_data["temp_def_stars"]
+        keys = user_data["keys"]
 
         embed = discord.Embed(colour=0x98D9EB, title="Rush Info")
         embed.add_field(name="Attack Cost",
@@ -439,10 +920,10 @@ class RushWars(BaseCog):
         embed.add_field(name="Stars Till Next Box",
                         value=f"{STAT_EMOTES['Stars']} {5 - temp_stars}")
         embed.add_field(name="Defense Box",
-                        value=f"{STAT_EMOTES['Stars']} {temp_def_stars}/100")
+                        value=f"{STAT_EMOTES['Stars']} {temp_def_stars}/{DEFENSE_BOX_STARS}")
         embed.add_field(name="Keys", value=f"{STAT_EMOTES['Keys']} {keys}")
 
-        await ctx.send(embed=embed)
+        await self.send(ctx, embed=embed)
 
     @commands.command()
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.guild)
@@ -474,8 +955,13 @@ class RushWars(BaseCog):
 
         description = description.replace("\\n\\n", '\n\n')
 
+        start = base_card_levels[(card.Rarity).lower()]
         if level is None:
-            level = base_card_levels[(card.Rarity).lower()]
+            level = start
+        elif level < start:
+            await ctx.send((f"{card.Rarity} starts at level {start}! Showing level {start} stats..."))
+            level = start
+        upd_stats = self.CATALOG.level_stats(card.Name, level)
 
         embed = discord.Embed(colour=color, description=description)
         embed.set_author(name=card.Name, url=url)
@@ -484,25 +970,14 @@ class RushWars(BaseCog):
             name="Level", value=f"<:RW_Level:625788888480350216> {level}")
 
         if card_type == 'troop' or card_type == 'defense' or card_type == 'commander':
-            lvl_stats = [int(card.Hp), int(card.Att)]
-            upd_stats = self.card_level(
-                level, lvl_stats, card.Rarity, card_type+"s")
-
-            if isinstance(upd_stats, int):
-                await ctx.send((f"{card.Rarity} starts at level {upd_stats}! Showing level {upd_stats} stats..."))
-                level = upd_stats
-                upd_stats = lvl_stats
-
-            target = self.card_targets(int(card.Targets))
-
-            dps = int(upd_stats[1]/float(card.AttSpeed))
+            target = self.card_targets(card.Targets)
 
             embed.add_field(
-                name="Health", value=f"<:RW_Health:625786278058917898> {upd_stats[0]}")
+                name="Health", value=f"<:RW_Health:625786278058917898> {upd_stats.Hp}")
             embed.add_field(
-                name="Damage", value=f"<:RW_Damage:625786276938907659> {upd_stats[1]}")
+                name="Damage", value=f"<:RW_Damage:625786276938907659> {upd_stats.Att}")
             embed.add_field(
-                name="Damage per second", value=f"<:RW_DPS:625786277903466498> {dps}")
+                name="Damage per second", value=f"<:RW_DPS:625786277903466498> {upd_stats.Dps}")
             if card_type == 'troop':
                 embed.add_field(
                     name="Squad Size", value=f"<:RW_Count:625786275802382347> {card.Count}")
@@ -517,21 +992,12 @@ class RushWars(BaseCog):
                 name="Attack Speed", value=f"<:RW_AttSpeed:625787097709543427> {card.AttSpeed}s")
 
         elif card_type == 'airdrop':
-            lvl_stats = [float(card.Duration)]
-            upd_stats = self.card_level(
-                level, lvl_stats, card.Rarity, card_type+"s")
-
-            if isinstance(upd_stats, int):
-                await ctx.send((f"{card.Rarity} starts at level {upd_stats}! Showing level {upd_stats} stats..."))
-                level = upd_stats
-                upd_stats = lvl_stats
-
             value_emote = self.airdrop_value_emotes(card.Ability)
 
             embed.add_field(
                 name=f"{card.Ability} {value_emote}", value=card.Value)
             embed.add_field(
-                name="Duration", value=f"<:Duration:626042235753857034> {str(upd_stats[0])+'s'}")
+                name="Duration", value=f"<:Duration:626042235753857034> {str(upd_stats.Duration)+'s'}")
             embed.add_field(
                 name="Space", value=f"<:RW_Airdrop:626000292810588164> {card.Space}")
 
@@ -539,14 +1005,16 @@ class RushWars(BaseCog):
             name="Rarity", value=f"<:RW_Rarity:625783200983154701> {card.Rarity}")
         embed.add_field(
             name="Required HQ Level", value=f"<:RW_HQ:625787531664818224> {card.UnlockLvl}")
-        await ctx.send(embed=embed)
+        await self.send(ctx, embed=embed)
 
     @commands.group(name="squad", autohelp=False)
     @commands.cooldown(rate=1, per=15, type=commands.BucketType.user)
     async def _squad(self, ctx, member: Optional[discord.Member] = None):
         """Lookup your or any other server member's squad. Subcommands give more squad functions.
 
+        set:   Replace the whole squad - `[p]squad set card [number] ...`
         save:  Save current squad - `[p]squad save (squad_name)`
+        load:  Switch to a saved squad - `[p]squad load (squad_name)`
         """
         if not ctx.invoked_subcommand:
             if member is None:
@@ -554,13 +1022,8 @@ class RushWars(BaseCog):
             else:
                 user = member
             try:
-                async with self.config.user(user).active() as active:
-                    att_data = [
-                        active["troops"],
-                        active["airdrops"],
-                        active["commanders"]
-                    ]
-                chopperLvl = await self.config.user(ctx.author).chopper()
+                user_data = await self.users.get(user)
+                active = user_data["active"]
             except Exception as ex:
                 return await ctx.send(f"Error with character sheet!")
                 log.exception(f"Error with character sheet: {ex}!")
@@ -569,25 +1032,12 @@ class RushWars(BaseCog):
                                   description="Is your squad strong enough to kick butt and get mega rich?")
             embed.set_author(
                 name=f"{ctx.author.name}'s Squad", icon_url="https://cdn.discordapp.com/attachments/626063027543736320/626719420219392010/SilverStar.png")
-            i = 1
-            for items in att_data:
-                if i == 1:
-                    kind = "Troops"
-                    capacity = self.CHOPPER_LEVELS[str(
-                        chopperLvl)]["TroopHousing"]
-                elif i == 2:
-                    kind = "Airdrops"
-                    capacity = self.CHOPPER_LEVELS[str(
-                        chopperLvl)]["AirdropHousing"]
-                elif i == 3:
-                    kind = "Commanders"
-                    capacity = 1
-                else:
-                    break
-                i += 1
+            housing = self.HOUSING.housing(user_data)
+            for category in SQUAD_CATEGORIES:
+                kind = category.title()
+                capacity = self.HOUSING.capacity(user_data, category)
+                items = active[category]
                 sqd_str = ""
-                total_type = 0
-                # card_info = [(item, items[item]) for item in items.keys()]
                 for item in items.keys():
                     if item:
                         card_name = item
@@ -596,10 +1046,7 @@ class RushWars(BaseCog):
                         if count <= 0:
                             continue
                         sqd_str += f"{card_emote} `{card_name}` x{count}\n"
-
-                        card_space = int(
-                            (self.card_search(card_name)[1]).Space)
-                        total_type += count * card_space
+                total_type = housing.get(category, 0)
 
                 if sqd_str == "":
                     sqd_str = f"No {kind.lower()} in squad."
@@ -608,7 +1055,12 @@ class RushWars(BaseCog):
                 embed.add_field(
                     name=f"{kind} ({total_type}/{capacity}) {type_emote}", value=sqd_str)
 
-            await ctx.send(embed=embed)
+            hp, attps, _, _ = self.POWER.power(user_data)["attack"]
+            embed.add_field(
+                name="Power", value=f"<:RW_Health:625786278058917898> {int(hp)}\n"
+                                    f"<:RW_DPS:625786277903466498> {int(attps)}")
+
+            await self.send(ctx, embed=embed)
 
     @_squad.command(name="add")
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
@@ -620,6 +1072,9 @@ class RushWars(BaseCog):
                 `[p]squad add "sneaky ninja"`
                 `[p]squad add "rocket trucks" 2`
         """
+        if number < 1:
+            return await ctx.send("Must add at least one card.")
+
         card = card.title()
 
         card_info = self.card_search(card)
@@ -628,79 +1083,25 @@ class RushWars(BaseCog):
             return await ctx.send(f"{card.title()} does not exist.")
 
         card_type = str(card_info[0]) + "s"
-        if card_type == "commanders":
-            card_space = 1
-        else:
-            card_space = int(card_info[1].Space)
-
-        chopperLvl = await self.config.user(ctx.author).chopper()
-
-        if card_type == "troops":
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active[card_type]
-            except:
-                log.exception("Error with character sheet.")
-                return
-            capacity = self.CHOPPER_LEVELS[str(chopperLvl)]["TroopHousing"]
-
-        elif card_type == "airdrops":
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active[card_type]
-            except:
-                log.exception("Error with character sheet.")
-                return
-            capacity = self.CHOPPER_LEVELS[str(chopperLvl)]["AirdropHousing"]
-
-        elif card_type == "commanders":
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active[card_type]
-            except:
-                log.exception("Error with character sheet.")
-                return
-            capacity = 1
-
-        else:
+        if card_type not in SQUAD_CATEGORIES:
             return await ctx.send(f"{card.title()} is not a valid attack card.")
+        card_space = card_info[1].Space
 
-        total_selected = self.total_selected(card, data)
-        if total_selected >= capacity:
-            return await ctx.send("Chopper is already full. Remove some cards first.")
+        housing = self.HOUSING
+        async with self.users.transaction(ctx.author) as user_data:
+            capacity = housing.capacity(user_data, card_type)
+            total_selected = housing.used(user_data, card_type)
+            if total_selected >= capacity:
+                return await ctx.send("Chopper is already full. Remove some cards first.")
 
-        # check if user owns the card
-        try:
-            async with self.config.user(ctx.author).cards() as cards:
-                owned = cards[card_type]
-        except:
-            log.exception("Error with character sheet.")
-            return
+            # check if user owns the card
+            owned = user_data["cards"][card_type].get(card)
+            if not owned or owned[1] < 1:
+                return await ctx.send("You have not unlocked the card.")
 
-        owns = False
-        for item in owned.keys():
-            if card == item:
-                if owned[item][1] >= 1:
-                    owns = True
-                    break
-
-        if owns:
             if total_selected + (number * card_space) > capacity:
                 return await ctx.send("Adding the card(s) will exceed chopper capacity.")
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active[card_type]
-                    for sqd_card in data.keys():
-                        if card == sqd_card:
-                            data[sqd_card] += number
-                            break
-                    else:
-                        data[card] = number
-            except:
-                log.exception("Error with character sheet.")
-                return
-        else:
-            return await ctx.send("You have not unlocked the card.")
+            housing.add(user_data, card_type, card, number)
 
         await ctx.send(f"{number} {card.title()} card(s) added to squad.")
 
@@ -717,49 +1118,19 @@ class RushWars(BaseCog):
         if number < 1:
             return await ctx.send("Must remove at least one card.")
 
-        try:
-            async with self.config.user(ctx.author).active() as active:
-                cards_selected = [active["troops"],
-                                  active["airdrops"], active["commanders"]]
-        except:
-            log.exception("Error with character sheet.")
-            return
-
         card = card.title()
 
-        selected = False
-        i = 0
-        for items in cards_selected:
-            i += 1
-            for item in items.keys():
-                if item == card:
-                    selected = True
-                    if i == 1:
-                        card_type = "troops"
-                    elif i == 2:
-                        card_type = "airdrops"
-                    elif i == 3:
-                        card_type = "commanders"
+        async with self.users.transaction(ctx.author) as user_data:
+            active = user_data["active"]
+            for card_type in SQUAD_CATEGORIES:
+                if card in active[card_type]:
                     break
+            else:
+                return await ctx.send(f"{card.title()} is not in squad.")
 
-        if selected:
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active[card_type]
-                    for sqd_card in data.keys():
-                        if card == sqd_card:
-                            if data[sqd_card] >= number:
-                                data[sqd_card] -= number
-                                if data[sqd_card] == 0:
-                                    del data[sqd_card]
-                                break
-                            else:
-                                return await ctx.send(f"Number of {card.title()} cards in squad are less than {number}.")
-            except:
-                log.exception("Error with character sheet.")
-                return
-        else:
-            return await ctx.send(f"{card.title()} is not in squad.")
+            if active[card_type][card] < number:
+                return await ctx.send(f"Number of {card.title()} cards in squad are less than {number}.")
+            self.HOUSING.remove(user_data, card_type, card, number)
 
         await ctx.send(f"{number} {card.title()} card(s) removed from squad.")
 
@@ -772,44 +1143,68 @@ class RushWars(BaseCog):
                 `[p]squad reset airdrops`
         """
         if card_type is None:
-            categories = ["troops", "airdrops", "commanders"]
             msg = await ctx.send(f"Are you sure you want to reset the whole squad?")
-            start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-            pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-            await ctx.bot.wait_for("reaction_add", check=pred)
-            if pred.result is True:
-                for category in categories:
-                    try:
-                        async with self.config.user(ctx.author).active() as active:
-                            active[category] = {}
-                    except:
-                        log.exception("Error with character sheet.")
-                        return
+            confirmed = await self.confirm(ctx, msg)
+            if confirmed is None:
+                return
+            if confirmed:
+                async with self.users.transaction(ctx.author) as user_data:
+                    for category in SQUAD_CATEGORIES:
+                        self.HOUSING.clear(user_data, category)
                 await ctx.send("Squad reset.")
             else:
                 return await ctx.send("Reset cancelled by the user.")
         else:
             card_type = card_type.lower()
-            if card_type not in ["troops", "airdrops", "commanders"]:
+            if card_type not in SQUAD_CATEGORIES:
                 return await ctx.send("Entered card type is not valid.")
             else:
                 msg = await ctx.send(f"Are you sure you want to reset {card_type} squad?")
-                start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-                pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-                await ctx.bot.wait_for("reaction_add", check=pred)
-                if pred.result is True:
-                    try:
-                        async with self.config.user(ctx.author).active() as active:
-                            active[card_type].clear()
-                            await ctx.send(f"{card_type.title()} squad reset.")
-                    except:
-                        log.exception("Error with character sheet.")
-                        return
+                confirmed = await self.confirm(ctx, msg)
+                if confirmed is None:
+                    return
+                if confirmed:
+                    async with self.users.transaction(ctx.author) as user_data:
+                        self.HOUSING.clear(user_data, card_type)
+                    await ctx.send(f"{card_type.title()} squad reset.")
                 else:
                     return await ctx.send("Reset cancelled by the user.")
 
+    @_squad.command(name="set")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def squad_set(self, ctx, *cards):
+        """Replace your whole squad at once: `[p]squad set card [number] ...`
+            Cards that are not named are removed from the squad.
+            Examples:
+                `[p]squad set troopers 2 pitcher 1 arcade 1`
+                `[p]squad set "sneaky ninja" 2 shields "lady grenade"`
+        """
+        await self.set_cards(ctx, "squad", cards)
+
+    @_squad.command(name="save")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def squad_save(self, ctx, name: str):
+        """Save your current squad as a preset: `[p]squad save name`"""
+        await self.save_preset(ctx, "squad", name)
+
+    @_squad.command(name="load")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def squad_load(self, ctx, name: str):
+        """Switch to a saved squad: `[p]squad load name`"""
+        await self.load_preset(ctx, "squad", name)
+
+    @_squad.command(name="presets")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def squad_presets(self, ctx):
+        """List your saved squads: `[p]squad presets`"""
+        await self.list_presets(ctx, "squad")
+
+    @_squad.command(name="delete")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def squad_delete(self, ctx, name: str):
+        """Delete a saved squad: `[p]squad delete name`"""
+        await self.delete_preset(ctx, "squad", name)
+
     @commands.group(name="defense", autohelp=False)
     @commands.cooldown(rate=1, per=15, type=commands.BucketType.user)
     async def _defense(self, ctx):
@@ -817,9 +1212,8 @@ class RushWars(BaseCog):
 
         if not ctx.invoked_subcommand:
             try:
-                async with self.config.user(ctx.author).active() as active:
-                    defense = active["defenses"]
-                chopperLvl = await self.config.user(ctx.author).chopper()
+                user_data = await self.users.get(ctx.author)
+                defense = user_data["active"]["defenses"]
             except Exception as ex:
                 return await ctx.send(f"Error with character sheet!")
                 log.exception(f"Error with character sheet: {ex}!")
@@ -829,10 +1223,9 @@ class RushWars(BaseCog):
             embed.set_author(
                 name=f"{ctx.author.name}'s Defense", icon_url="https://cdn.discordapp.com/attachments/626063027543736320/626338507958386697/Defense.png")
 
-            capacity = self.CHOPPER_LEVELS[str(chopperLvl)]["DefenceHousing"]
+            capacity = self.HOUSING.capacity(user_data, "defenses")
+            total_defense = self.HOUSING.used(user_data, "defenses")
             def_str = ""
-            total_defense = 0
-            # card_info = [(item, items[item]) for item in items.keys()]
             for item in defense.keys():
                 if item:
                     card_name = item
@@ -842,8 +1235,6 @@ class RushWars(BaseCog):
                         continue
 
                     def_str += f"{card_emote} `{card_name}` x{count}\n"
-                    card_space = int((self.card_search(card_name)[1]).Space)
-                    total_defense += count * card_space
 
             if def_str == "":
                 def_str = "No defenses in squad."
@@ -851,8 +1242,12 @@ class RushWars(BaseCog):
             emote = self.type_emotes("Defenses")
             embed.add_field(
                 name=f"Defenses ({total_defense}/{capacity}) {emote}", value=def_str)
+            def_hp, def_attps = self.POWER.power(user_data)["defense"]
+            embed.add_field(
+                name="Power", value=f"<:RW_Health:625786278058917898> {int(def_hp)}\n"
+                                    f"<:RW_DPS:625786277903466498> {int(def_attps)}")
 
-            await ctx.send(embed=embed)
+            await self.send(ctx, embed=embed)
 
     @_defense.command(name="add")
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
@@ -864,6 +1259,9 @@ class RushWars(BaseCog):
                 `[p]defense add "rocket trap"`
                 `[p]defense add "cluster cake" 2`
         """
+        if number < 1:
+            return await ctx.send("Must add at least one card.")
+
         card = card.title()
 
         card_info = self.card_search(card)
@@ -875,54 +1273,25 @@ class RushWars(BaseCog):
         if card_type not in ["troops", "defenses"]:
             return await ctx.send(f"{card.title()} is not a valid defense card.")
 
-        card_space = int(card_info[1].Space)
-        chopperLvl = await self.config.user(ctx.author).chopper()
-
-        try:
-            async with self.config.user(ctx.author).active() as active:
-                data = active["defenses"]
-        except:
-            log.exception("Error with character sheet.")
-            return
-        capacity = self.CHOPPER_LEVELS[str(chopperLvl)]["DefenceHousing"]
-
-        total_selected = self.total_selected(card, data)
-        if total_selected >= capacity:
-            return await ctx.send(f"Defense is already full. Remove some cards first.")
+        card_space = card_info[1].Space
 
-        # check if user owns the card
-        try:
-            async with self.config.user(ctx.author).cards() as cards:
-                owned = cards[card_type]
-        except:
-            log.exception("Error with character sheet.")
-            return
+        housing = self.HOUSING
+        async with self.users.transaction(ctx.author) as user_data:
+            capacity = housing.capacity(user_data, "defenses")
+            total_selected = housing.used(user_data, "defenses")
+            if total_selected >= capacity:
+                return await ctx.send(f"Defense is already full. Remove some cards first.")
 
-        owns = False
-        for item in owned.keys():
-            if card == item:
-                if owned[item][1] >= 1:
-                    owns = True
-                    break
+            # check if user owns the card
+            owned = user_data["cards"][card_type].get(card)
+            if not owned or owned[1] < 1:
+                return await ctx.send("You have not unlocked the card.")
 
-        if owns:
             if total_selected + (number * card_space) > capacity:
                 return await ctx.send("Adding the card(s) will exceed defense capacity.")
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active["defenses"]
-                    for def_card in data.keys():
-                        if card == def_card:
-                            data[def_card] += number
-                            break
-                    else:
-                        data[card] = number
-            except:
-                log.exception("Error with character sheet.")
-                return
-        else:
-            return await ctx.send("You have not unlocked the card.")
+            housing.add(user_data, "defenses", card, number)
 
+        self.index_player(ctx.author, ctx.guild, user_data)
         await ctx.send(f"{number} {card.title()} card(s) added to defense.")
 
     @_defense.command(name="remove")
@@ -938,37 +1307,17 @@ class RushWars(BaseCog):
         if number < 1:
             return await ctx.send("Must remove at least one card.")
 
-        try:
-            async with self.config.user(ctx.author).active() as active:
-                data = active["defenses"]
-        except:
-            log.exception("Error with character sheet.")
-            return
-
         card = card.title()
 
-        selected = False
-        for item in data.keys():
-            if item == card:
-                selected = True
-
-        if selected:
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    data = active["defenses"]
-                    for def_card in data.keys():
-                        if card == def_card:
-                            if data[def_card] >= number:
-                                data[def_card] -= number
-                                break
-                            else:
-                                return await ctx.send(f"Number of {card.title()} cards in defense are less than {number}.")
-            except:
-                log.exception("Error with character sheet.")
-                return
-        else:
-            return await ctx.send(f"{card.title()} is not in defense.")
+        async with self.users.transaction(ctx.author) as user_data:
+            data = user_data["active"]["defenses"]
+            if card not in data:
+                return await ctx.send(f"{card.title()} is not in defense.")
+            if data[card] < number:
+                return await ctx.send(f"Number of {card.title()} cards in defense are less than {number}.")
+            self.HOUSING.remove(user_data, "defenses", card, number)
 
+        self.index_player(ctx.author, ctx.guild, user_data)
         await ctx.send(f"{number} {card.title()} card(s) removed from defense.")
 
     @_defense.command(name="reset")
@@ -976,21 +1325,52 @@ class RushWars(BaseCog):
     async def defense_reset(self, ctx):
         """Remove all cards from defense: `[p]defense reset`"""
         msg = await ctx.send(f"Are you sure you want to reset your defense?")
-        start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-        pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
-        if pred.result is True:
-            try:
-                async with self.config.user(ctx.author).active() as active:
-                    active["defenses"].clear()
-                    await ctx.send(f"Defense reset.")
-            except:
-                log.exception("Error with character sheet.")
-                return
+        confirmed = await self.confirm(ctx, msg)
+        if confirmed is None:
+            return
+        if confirmed:
+            async with self.users.transaction(ctx.author) as user_data:
+                self.HOUSING.clear(user_data, "defenses")
+            self.MATCHMAKING.remove(ctx.author.id)
+            await ctx.send(f"Defense reset.")
         else:
             return await ctx.send("Reset cancelled by the user.")
 
+    @_defense.command(name="set")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def defense_set(self, ctx, *cards):
+        """Replace your whole defense at once: `[p]defense set card [number] ...`
+            Cards that are not named are removed from the defense.
+            Examples:
+                `[p]defense set mortar 2 troopers 2`
+                `[p]defense set "rocket trap" "cluster cake" 2`
+        """
+        await self.set_cards(ctx, "defense", cards)
+
+    @_defense.command(name="save")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def defense_save(self, ctx, name: str):
+        """Save your current defense as a preset: `[p]defense save name`"""
+        await self.save_preset(ctx, "defense", name)
+
+    @_defense.command(name="load")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def defense_load(self, ctx, name: str):
+        """Switch to a saved defense: `[p]defense load name`"""
+        await self.load_preset(ctx, "defense", name)
+
+    @_defense.command(name="presets")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def defense_presets(self, ctx):
+        """List your saved defenses: `[p]defense presets`"""
+        await self.list_presets(ctx, "defense")
+
+    @_defense.command(name="delete")
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
+    async def defense_delete(self, ctx, name: str):
+        """Delete a saved defense: `[p]defense delete name`"""
+        await self.delete_preset(ctx, "defense", name)
+
     # @commands.command(name="sethq")
     # async def set_hq(self, ctx, lvl: int = None):
     #     await self.new_hq_cards(ctx, lvl)
@@ -1003,33 +1383,33 @@ class RushWars(BaseCog):
         """Shows all the cards you can find in boxes."""
         embed = discord.Embed(colour=0x98D9EB, title="Cards")
         try:
-            async with self.config.user(ctx.author).cards() as cards:
-                embeds = []
-                for card_type in ['troops', 'airdrops', 'defenses', 'commanders']:
-                    data = cards[card_type]
-
-                    type_emote = self.type_emotes(card_type.title())
-                    embed = discord.Embed(
-                        color=0x98D9EB, title=f"{card_type.title()}")
-
-                    for item in data.keys():
-                        emote = self.card_emotes(item)
-                        level = data[item][0]
-                        found = data[item][1]
-                        # if found < 1:
-                        #     found = "Not Found"
-                        # else:
-                        #     found = str(found) + " Cards"
-                        try:
-                            val_str = f"<:RW_Levels:626490780386721792>`{level}\u28FFLevel`" \
-                                f" | <:RW_Cards:626422103092232192>`{found}\u28FFCards`\n"
-                            embed.add_field(
-                                name=f"{item.upper()} {emote}", value=val_str)
-                        except:
-                            embed.add_field(name="No cards!",
-                                            value=f"No {card_type} unlocked.")
-                    embeds.append(embed)
-                await menu(ctx, embeds, DEFAULT_CONTROLS)
+            cards = (await self.users.get(ctx.author))["cards"]
+            embeds = []
+            for card_type in ['troops', 'airdrops', 'defenses', 'commanders']:
+                data = cards[card_type]
+
+                type_emote = self.type_emotes(card_type.title())
+                embed = discord.Embed(
+                    color=0x98D9EB, title=f"{card_type.title()}")
+
+                for item in data.keys():
+                    emote = self.card_emotes(item)
+                    level = data[item][0]
+                    found = data[item][1]
+                    # if found < 1:
+                    #     found = "Not Found"
+                    # else:
+                    #     found = str(found) + " Cards"
+                    try:
+                        val_str = f"<:RW_Levels:626490780386721792>`{level}\u28FFLevel`" \
+                            f" | <:RW_Cards:626422103092232192>`{found}\u28FFCards`\n"
+                        embed.add_field(
+                            name=f"{item.upper()} {emote}", value=val_str)
+                    except:
+                        embed.add_field(name="No cards!",
+                                        value=f"No {card_type} unlocked.")
+                embeds.append(embed)
+            await menu(ctx, embeds, DEFAULT_CONTROLS)
         except Exception as ex:
             log.exception(ex)
             return
@@ -1044,39 +1424,29 @@ class RushWars(BaseCog):
             user = ctx.author
 
         try:
-            hq = await self.config.user(user).hq()
-            chopper = await self.config.user(user).chopper()
-            keys = await self.config.user(user).keys()
-            gold = await self.config.user(user).gold()
-            gems = await self.config.user(user).gems()
-            lvl = await self.config.user(user).lvl()
-            xp = await self.config.user(user).xp()
+            user_data = await self.users.get(user)
         except:
             log.exception("Error with character sheet.")
             return
 
-        try:
-            async with self.config.user(user).stars() as stars:
-                att_stars = stars["attack"]
-                def_stars = stars["defense"]
-        except:
-            log.exception("Error with character sheet.")
-            return
+        hq = user_data["hq"]
+        chopper = user_data["chopper"]
+        keys = user_data["keys"]
+        gold = user_data["gold"]
+        gems = user_data["gems"]
+        lvl = user_data["lvl"]
+        xp = user_data["xp"]
+        att_stars = user_data["stars"]["attack"]
+        def_stars = user_data["stars"]["defense"]
 
         total_stars = att_stars + def_stars
-        # return await ctx.send(total_stars)
-        # get user league
-        for item in LEAGUES.keys():
-            low, high = LEAGUES[item][0], LEAGUES[item][1]
-            if total_stars in range(low, high):
-                league = item
-        league_url = f"{LEAGUE_ICONS_BASE_URL}{league}.png"
+        league = self.LEAGUES.resolve(total_stars)
 
         # xp required for next level
         next_xp = self.XP_LEVELS[str(lvl)]["ExpToNextLevel"]
 
         embed = discord.Embed(colour=0x98D9EB)
-        # embed.set_thumbnail(url=league_url)
+        # embed.set_thumbnail(url=league.icon_url)
         embed.set_author(name=f"{user.name}'s Profile",
                          icon_url=f"{LEVEL_BASE_URL}{lvl}.png")
         embed.add_field(name="HQ Level", value=f"{STAT_EMOTES['HQ']} {hq}")
@@ -1084,7 +1454,7 @@ class RushWars(BaseCog):
                         value=f"{STAT_EMOTES['Chopper']} {chopper}")
         embed.add_field(name="Keys", value=f"{STAT_EMOTES['Keys']} {keys}/5")
         embed.add_field(
-            name="Stars", value=f"{STAT_EMOTES[league]} {total_stars}")
+            name="Stars", value=f"{STAT_EMOTES[league.Name]} {total_stars}")
         embed.add_field(name="Attack Stars",
                         value=f"{STAT_EMOTES['Attack Stars']} {att_stars}")
         embed.add_field(name="Defense Stars",
@@ -1095,7 +1465,7 @@ class RushWars(BaseCog):
         embed.add_field(name="Experience",
                         value=f"{STAT_EMOTES['Experience']} {xp}/{next_xp}")
 
-        await ctx.send(embed=embed)
+        await self.send(ctx, embed=embed)
 
     @commands.group(name="upgrade", autohelp=False)
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
@@ -1108,11 +1478,13 @@ class RushWars(BaseCog):
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
     async def upgrade_hq(self, ctx):
         """Upgrade HQ level: `[p]upgrade hq`"""
+        user_data = await self.users.get(ctx.author)
+
         # get new hq level
-        hq = await self.config.user(ctx.author).hq() + 1
+        hq = user_data["hq"] + 1
 
         # check if HQ level up is possible with user's xp level
-        lvl = await self.config.user(ctx.author).lvl()
+        lvl = user_data["lvl"]
         highest_possible_hq = self.XP_LEVELS[str(lvl)]["MaxHQLevel"]
         if hq > highest_possible_hq:
             return await ctx.send("You need more experience to upgrade HQ!")
@@ -1120,25 +1492,23 @@ class RushWars(BaseCog):
         upgrade_cost = self.HQ_LEVELS[str(hq-1)]["UpgradeGold"]
 
         msg = await ctx.send(f"Upgrading HQ will cost {upgrade_cost} {STAT_EMOTES['Gold_Icon']}. Continue?")
-        start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-        pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
-        if pred.result is True:
+        confirmed = await self.confirm(ctx, msg)
+        if confirmed is None:
+            return
+        if confirmed:
             try:
-                gold = await self.config.user(ctx.author).gold()
-                if gold >= upgrade_cost:
-                    await self.config.user(ctx.author).hq.set(hq)
-                    await self.new_hq_cards(ctx, hq)
-
-                    upd_gold = gold - upgrade_cost
-                    await self.config.user(ctx.author).gold.set(upd_gold)
-                    return await ctx.send(f"HQ upgraded to level {hq}.")
-                else:
-                    return await ctx.send("You do not have enough gold to upgrade.")
+                async with self.users.transaction(ctx.author) as user_data:
+                    if user_data["hq"] + 1 != hq:
+                        return await ctx.send("HQ level has changed. Please try again.")
+                    if user_data["gold"] < upgrade_cost:
+                        return await ctx.send("You do not have enough gold to upgrade.")
+                    user_data["hq"] = hq
+                    self.new_hq_cards(user_data, hq)
+                    user_data["gold"] -= upgrade_cost
             except:
                 log.exception("Error with updating character sheet.")
                 return
+            return await ctx.send(f"HQ upgraded to level {hq}.")
         else:
             return await ctx.send("Upgrade cancelled by the user.")
 
@@ -1146,35 +1516,35 @@ class RushWars(BaseCog):
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
     async def upgrade_chopper(self, ctx):
         """Upgrade chopper level: `[p]upgrade chopper`"""
+        user_data = await self.users.get(ctx.author)
+
         # get new chopper level
-        chopper = await self.config.user(ctx.author).chopper() + 1
+        chopper = user_data["chopper"] + 1
 
         # check if chopper level up is possible
-        hq = await self.config.user(ctx.author).hq()
+        hq = user_data["hq"]
         if chopper > hq:
             return await ctx.send("You need to upgrade HQ first!")
 
         upgrade_cost = self.CHOPPER_LEVELS[str(chopper-1)]["UpgradeGold"]
 
         msg = await ctx.send(f"Upgrading Chopper will cost {upgrade_cost} {STAT_EMOTES['Gold_Icon']}. Continue?")
-        start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-        pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
-        if pred.result is True:
+        confirmed = await self.confirm(ctx, msg)
+        if confirmed is None:
+            return
+        if confirmed:
             try:
-                gold = await self.config.user(ctx.author).gold()
-                if gold >= upgrade_cost:
-                    await self.config.user(ctx.author).chopper.set(chopper)
-
-                    upd_gold = gold - upgrade_cost
-                    await self.config.user(ctx.author).gold.set(upd_gold)
-                    return await ctx.send(f"Chopper upgraded to level {chopper}.")
-                else:
-                    return await ctx.send("You do not have enough gold to upgrade.")
+                async with self.users.transaction(ctx.author) as user_data:
+                    if user_data["chopper"] + 1 != chopper:
+                        return await ctx.send("Chopper level has changed. Please try again.")
+                    if user_data["gold"] < upgrade_cost:
+                        return await ctx.send("You do not have enough gold to upgrade.")
+                    user_data["chopper"] = chopper
+                    user_data["gold"] -= upgrade_cost
             except:
                 log.exception("Error with updating character sheet.")
                 return
+            return await ctx.send(f"Chopper upgraded to level {chopper}.")
         else:
             return await ctx.send("Upgrade cancelled by the user.")
 
@@ -1191,17 +1561,16 @@ class RushWars(BaseCog):
         card_info = self.card_search(card_name)
 
         if not card_info:
-            return await ctx.send(f"{card.title()} does not exist.")
+            return await ctx.send(f"{card_name} does not exist.")
 
         card_type = str(card_info[0]) + "s"
         card_info = card_info[1]
 
         # get user card level and number of cards
-        async with self.config.user(ctx.author).cards() as cards:
-            for item in cards[card_type]:
-                if card_name == item:
-                    user_level = cards[card_type][item][0]
-                    user_num_of_cards = cards[card_type][item][1]
+        cards = (await self.users.get(ctx.author))["cards"]
+        if card_name not in cards[card_type]:
+            return await ctx.send("You have not unlocked the card.")
+        user_level, user_num_of_cards = cards[card_type][card_name]
 
         rarity = card_info.Rarity
         cards_reqd = self.RARITY_INFO[rarity]["UpgradeCards"][user_level]
@@ -1215,41 +1584,36 @@ class RushWars(BaseCog):
         reward_xp = self.RARITY_INFO[rarity]["UpgradePlayerExp"][user_level]
 
         msg = await ctx.send(f"Upgrading {card_name} to level {user_level+1} will cost {upgrade_cost} {STAT_EMOTES['Gold_Icon']}. Continue?")
-        start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
-
-        pred = ReactionPredicate.yes_or_no(msg, ctx.author)
-        await ctx.bot.wait_for("reaction_add", check=pred)
-        if not pred.result:
+        confirmed = await self.confirm(ctx, msg)
+        if confirmed is None:
+            return
+        if not confirmed:
             return await ctx.send("Upgrade cancelled by the user.")
 
         try:
-            gold = await self.config.user(ctx.author).gold()
-            if gold >= upgrade_cost:
-                # update config variables
-                async with self.config.user(ctx.author).cards() as cards:
-                    for item in cards[card_type]:
-                        if card_name == item:
-                            cards[card_type][item][0] += 1
-                            cards[card_type][item][1] = leftover
-                upd_gold = gold - upgrade_cost
-                await self.config.user(ctx.author).gold.set(upd_gold)
-                xp = await self.config.user(ctx.author).xp()
-                await self.config.user(ctx.author).xp.set(reward_xp+xp)
-
-                await ctx.send(f"{card_name} upgraded to level {user_level+1}.")
-                await ctx.send(f"Rewards: {reward_xp} {STAT_EMOTES['Experience']}")
-                level_up = True
-                while level_up:
-                    level_up = await self.xp_level_handler(ctx)
-                    if level_up:
-                        await ctx.send(level_up[0])
-                        await ctx.send(level_up[1])
-            else:
-                return await ctx.send("You do not have enough gold to upgrade.")
+            async with self.users.transaction(ctx.author) as user_data:
+                card = user_data["cards"][card_type][card_name]
+                if card != [user_level, user_num_of_cards]:
+                    return await ctx.send("Your cards have changed. Please try again.")
+                if user_data["gold"] < upgrade_cost:
+                    return await ctx.send("You do not have enough gold to upgrade.")
+                # update user variables
+                card[0] += 1
+                card[1] = leftover
+                user_data["gold"] -= upgrade_cost
+                user_data["xp"] += reward_xp
+                self.POWER.refresh(user_data)
+
+                level_up = self.xp_level_handler(user_data)
         except:
             log.exception("Error with updating character sheet.")
             return
 
+        await ctx.send(f"{card_name} upgraded to level {user_level+1}.")
+        await ctx.send(f"Rewards: {reward_xp} {STAT_EMOTES['Experience']}")
+        if level_up:
+            await ctx.send(f"{level_up[0]} {level_up[1]}")
+
     @commands.group(name="collect", autohelp=False)
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.user)
     async def _collect(self, ctx):
@@ -1261,71 +1625,130 @@ class RushWars(BaseCog):
     @commands.cooldown(rate=1, per=3600, type=commands.BucketType.user)
     async def collect_gold(self, ctx):
         """Collect gold from gold mine once every hour: `[p]collect gold`"""
-        gold = await self.config.user(ctx.author).gold()
-        hq = await self.config.user(ctx.author).hq()
-        resource_gold = self.HQ_LEVELS[str(hq)]["ResourceMax"]
-        await self.config.user(ctx.author).gold.set(gold+resource_gold)
+        async with self.users.transaction(ctx.author) as user_data:
+            resource_gold = self.HQ_LEVELS[str(user_data["hq"])]["ResourceMax"]
+            user_data["gold"] += resource_gold
         await ctx.send(f"You got {resource_gold} {STAT_EMOTES['Gold_Icon']}!")
 
     @_collect.command(name="key")
     @commands.cooldown(rate=1, per=3600, type=commands.BucketType.user)
     async def collect_key(self, ctx):
         """Collect a key once every hour: `[p]collect key`"""
-        keys = await self.config.user(ctx.author).keys()
-        if keys == 5:
-            return await ctx.send("You already have 5 keys!")
-        else:
-            await self.config.user(ctx.author).keys.set(keys+1)
+        async with self.users.transaction(ctx.author) as user_data:
+            if user_data["keys"] >= 5:
+                return await ctx.send("You already have 5 keys!")
+            user_data["keys"] += 1
             await ctx.send(f"You got 1 {STAT_EMOTES['Keys']}!")
 
     @_collect.command(name="free")
     @commands.cooldown(rate=1, per=10800, type=commands.BucketType.user)
     async def collect_free_box(self, ctx):
         """Collect a free box once every 3 hours: `[p]collect free`"""
-        box = await self._box(ctx, "Free")
-        await ctx.send(embed=box)
+        async with self.users.transaction(ctx.author) as user_data:
+            box = await self._box(user_data, "Free")
+        await self.send(ctx, embed=box)
 
     @_collect.command(name="defense")
     @commands.cooldown(rate=1, per=10, type=commands.BucketType.user)
     async def collect_defense_box(self, ctx):
         """Collect defense box if it is available: `[p]collect defense`"""
-        temp_def_stars = await self.config.user(ctx.author).temp_def_stars()
+        await self.open_defense_boxes(ctx, 1)
 
-        if temp_def_stars < 100:
-            return await ctx.send(f"You do not have enough defense stars. ({temp_def_stars}/100)")
-
-        box = await self._box(ctx, "Defense")
-        await ctx.send(embed=box)
+    @commands.command(name="open")
+    @commands.cooldown(rate=1, per=10, type=commands.BucketType.user)
+    async def open_boxes(self, ctx, number: str = "all"):
+        """Open several defense boxes at once: `[p]open [number]`
+            Every 100 defense stars make one defense box available.
+            Examples:
+                `[p]open`
+                `[p]open all`
+                `[p]open 3`
+        """
+        if number.lower() == "all":
+            number = None
+        else:
+            try:
+                number = int(number)
+            except ValueError:
+                return await ctx.send("Number of boxes must be a number or `all`.")
+            if number < 1:
+                return await ctx.send("Must open at least one box.")
+
+        await self.open_defense_boxes(ctx, number)
+
+    async def open_defense_boxes(self, ctx, number=None):
+        """Open up to `number` defense boxes (all available if None) in one write."""
+        async with self.users.transaction(ctx.author) as user_data:
+            temp_def_stars = user_data["temp_def_stars"]
+            available = temp_def_stars // DEFENSE_BOX_STARS
+
+            if available < 1:
+                return await ctx.send(f"You do not have enough defense stars. ({temp_def_stars}/{DEFENSE_BOX_STARS})")
+
+            if number is None or number > available:
+                number = available
+
+            multiplier, desc = self.box_multiplier(user_data, "Defense")
+            result = await self.COMPUTE.run(
+                open_boxes, self.DATA.snapshot.key, random.getrandbits(64),
+                "Defense", number, multiplier, user_data["hq"],
+                self.commander_guaranteed(user_data))
+            self.apply_box(user_data, result, number)
+
+        if number > 1:
+            desc = f"{number}x {desc}"
+        await self.send(ctx, embed=self.box_embed(result, desc))
     
     @commands.command(name="rushboard")
-    async def rushboard(self, ctx):
-        """Check the leaderboards to see who is at the top!"""
-        all_users = await self.config.all_users()
-        users = []
-        for user_id in all_users:
-            user = ctx.guild.get_member(user_id)
-            stars = await self.get_stars(user)
-            users.append({'name': user, 'stars': stars})
-        users = sorted(users, key=lambda k: k['stars'], reverse=True)
-        embed_desc = ""
-        # return first 10 (or fewer) members
-        for i in range(10):
-            try:
-                embed_desc += f"`{(i+1):02d}.` {STAT_EMOTES['Levels']} `{users[i]['stars']}` {users[i]['name']}\n"
-            except:
-                break
-        
-        embed = discord.Embed(colour=0x98D9EB, description=embed_desc)
-        embed.set_author(name="Leaderboard", 
-            icon_url="https://cdn.discordapp.com/attachments/626063027543736320/627811022723350528/Leaderboard.png")
-        embed.set_thumbnail(url="https://www.rushstats.com/assets/league/Elite.png")
+    async def rushboard(self, ctx, scope: str = None):
+        """Check the leaderboards to see who is at the top!
+
+        Use `[p]rushboard global` to see players from every server.
+        """
+        if ctx.guild is None or (scope and scope.lower() == "global"):
+            board = self.LEADERBOARDS.global_board
+            get_user = self.bot.get_user
+        else:
+            board = self.LEADERBOARDS.guild(ctx.guild.id)
+            get_user = ctx.guild.get_member
+
+        if not len(board):
+            return await ctx.send("Nobody is on the leaderboard yet.")
+
         # add rank of user
-        for idx, user in enumerate(users):
-            if ctx.author == user['name']:
-                    embed.add_field(name=f"You", value=f"`{(idx+1):02d}.` {STAT_EMOTES['Levels']} `{user['stars']}` {user['name']}")
-        
-        await ctx.send(embed=embed)
-    
+        user_field = None
+        rank = board.rank(ctx.author.id)
+        if rank is not None:
+            user_stars = board.stars(ctx.author.id)
+            user_league = self.LEAGUES.resolve(user_stars)
+            user_field = f"`{rank:02d}.` {STAT_EMOTES[user_league.Name]} `{user_stars}` {ctx.author}"
+
+        pages = min(ceil(len(board) / 10), LEADERBOARD_PAGES)
+        embeds = []
+        for page in range(pages):
+            embed_desc = ""
+            entries = board.top(10, page * 10)
+            for i, (user_id, stars) in enumerate(entries):
+                user = get_user(user_id)
+                if user is None:
+                    user = "Unknown player"
+                league = self.LEAGUES.resolve(stars)
+                embed_desc += f"`{(page*10+i+1):02d}.` {STAT_EMOTES[league.Name]} `{stars}` {user}\n"
+
+            embed = discord.Embed(colour=0x98D9EB, description=embed_desc)
+            embed.set_author(name="Leaderboard",
+                icon_url="https://cdn.discordapp.com/attachments/626063027543736320/627811022723350528/Leaderboard.png")
+            embed.set_thumbnail(url=self.LEAGUES.resolve(entries[0][1]).icon_url)
+            if user_field:
+                embed.add_field(name=f"You", value=user_field)
+            if pages > 1:
+                embed.set_footer(text=f"Page {page+1}/{pages}")
+            embeds.append(embed)
+
+        if len(embeds) == 1:
+            return await self.send(ctx, embed=embeds[0])
+        await menu(ctx, embeds, DEFAULT_CONTROLS)
+
     @commands.command(name="tip")
     async def tip(self, ctx, *, number:int=None):
         """Send a random (unless specified) in-game story tip."""
@@ -1341,27 +1764,13 @@ class RushWars(BaseCog):
         
         await ctx.send(f"Story Tip #{index+1}:\n> {self.TIPS[index]}")
     
+    @timed("card_search")
     def card_search(self, name):
-        files = ['troops.csv', 'airdrops.csv',
-                 'defenses.csv', 'commanders.csv']
-        for file in files:
-            fp = self.path / file
-            try:
-                with fp.open('rt', encoding='iso-8859-15') as f:
-                    reader = csv.DictReader(f, delimiter=',')
-                    for row in reader:
-                        if row['Name'] == name:
-                            Card = namedtuple('Name', reader.fieldnames)
-                            card_type = file.split('.')[0]
-                            # remove trailing "s"
-                            card_type = card_type[:-1]
-                            return (card_type, Card(**row))
-                        else:
-                            continue
-            except FileNotFoundError:
-                log.exception(
-                    f"{file} file could not be found in Rush Wars data folder.")
-                continue
+        """Return a (card_type, card) tuple for the given card name."""
+        card = self.CATALOG.get(name)
+        if card is None:
+            return None
+        return (card.Type, card)
 
     def card_targets(self, targets):
         if targets == 0:
@@ -1371,36 +1780,6 @@ class RushWars(BaseCog):
         else:
             return "Air & Ground"
 
-    def card_level(self, level, stats: list, rarity, card_type):
-        """Get stats by selected level"""
-
-        start = base_card_levels[rarity.lower()]
-
-        if level < start:
-            return start
-
-        level -= start - 1
-
-        new_stats = []
-
-        for stat in stats:
-            if stat != 0:
-                if card_type == 'airdrops':
-                    upgrader = 0.5
-                else:
-                    upgrader = stat/10
-                i = 1
-                while i < level:
-                    stat += upgrader
-                    i += 1
-                if card_type == 'airdrops':
-                    new_stats.append(stat)
-                else:
-                    new_stats.append(int(stat))
-            else:
-                new_stats.append(stat)
-        return new_stats
-
     @staticmethod
     def color_lookup(rarity):
         colors = {"Common": 0xAE8F6F, "Rare": 0x74BD9C,
@@ -1480,17 +1859,94 @@ class RushWars(BaseCog):
         }
         return emotes[airdrop_ability]
 
-    def total_selected(self, card, data):
-        total = 0
-        for item in data.keys():
-            card_info = self.card_search(item)
-            card_space = int(card_info[1].Space)
-
-            number = data[item]
-            total += (number * card_space)
-        return total
+    async def set_cards(self, ctx, kind, args):
+        """Replace a user's squad or defense with the named cards in one commit."""
+        try:
+            cards = parse_cards(args)
+        except ValueError as ex:
+            return await ctx.send(str(ex))
+        if not cards:
+            return await ctx.send(f"Name the cards of your {kind}.")
+
+        async with self.users.transaction(ctx.author) as user_data:
+            active, error = self.HOUSING.compose(user_data, cards, PRESET_TYPES[kind])
+            if error:
+                return await ctx.send(error)
+            self.HOUSING.replace(user_data, active)
+
+        if kind == "defense":
+            self.index_player(ctx.author, ctx.guild, user_data)
+        await ctx.send(f"{kind.title()} set.")
+
+    async def save_preset(self, ctx, kind, name):
+        name = name.lower()
+        categories = dict.fromkeys(PRESET_TYPES[kind].values())
+        async with self.users.transaction(ctx.author) as user_data:
+            presets = user_data["presets"][kind]
+            if name not in presets and len(presets) >= MAX_PRESETS:
+                return await ctx.send(
+                    f"You can only save {MAX_PRESETS} {kind} presets. Delete one first.")
+            active = user_data["active"]
+            presets[name] = {category: dict(active[category]) for category in categories}
+        await ctx.send(f"{kind.title()} saved as `{name}`.")
+
+    async def load_preset(self, ctx, kind, name):
+        name = name.lower()
+        async with self.users.transaction(ctx.author) as user_data:
+            preset = user_data["presets"][kind].get(name)
+            if preset is None:
+                return await ctx.send(f"You have no {kind} saved as `{name}`.")
+            cards = {}
+            for category_cards in preset.values():
+                cards.update(category_cards)
+            # capacity and cards may have changed since the preset was saved
+            active, error = self.HOUSING.compose(user_data, cards, PRESET_TYPES[kind])
+            if error:
+                return await ctx.send(f"`{name}` cannot be loaded: {error}")
+            self.HOUSING.replace(user_data, active)
+
+        if kind == "defense":
+            self.index_player(ctx.author, ctx.guild, user_data)
+        await ctx.send(f"Switched to {kind} `{name}`.")
+
+    async def list_presets(self, ctx, kind):
+        presets = (await self.users.get(ctx.author))["presets"][kind]
+        if not presets:
+            return await ctx.send(
+                f"You have no saved {kind}s. Save one with `{ctx.prefix}{kind} save name`.")
+        embed = discord.Embed(colour=0x98D9EB, title=f"{ctx.author.name}'s {kind.title()} Presets")
+        for name, preset in sorted(presets.items()):
+            value = ""
+            for category_cards in preset.values():
+                for card_name, count in category_cards.items():
+                    value += f"{self.card_emotes(card_name)} `{card_name}` x{count}\n"
+            embed.add_field(name=name, value=value or "Empty")
+        await self.send(ctx, embed=embed)
+
+    async def delete_preset(self, ctx, kind, name):
+        name = name.lower()
+        async with self.users.transaction(ctx.author) as user_data:
+            if user_data["presets"][kind].pop(name, None) is None:
+                return await ctx.send(f"You have no {kind} saved as `{name}`.")
+        await ctx.send(f"Deleted {kind} `{name}`.")
+
+    async def confirm(self, ctx, msg):
+        """Ask the author to confirm with a reaction to `msg`.
+
+        Returns True or False, or None after telling the author that the
+        prompt expired.
+        """
+        start_adding_reactions(msg, ReactionPredicate.YES_OR_NO_EMOJIS)
+        with self.METRICS.timer("reaction_wait"):
+            confirmed = await self.CONFIRMATIONS.ask(msg, ctx.author)
+        if confirmed is None:
+            self.METRICS.incr("confirm.timeout")
+            await ctx.send("No reaction received in time, nothing was changed.")
+        else:
+            self.METRICS.incr("confirm.yes" if confirmed else "confirm.no")
+        return confirmed
 
-    async def new_hq_cards(self, ctx, hq):
+    def new_hq_cards(self, user_data, hq):
         """Function to handle HQ level ups."""
         # check which cards are unlocked at the new HQ level
         cards_unlocked = {
@@ -1499,38 +1955,18 @@ class RushWars(BaseCog):
             "defenses": [],
             "commanders": []
         }
-        files = ['troops.csv', 'airdrops.csv',
-                 'defenses.csv', 'commanders.csv']
-        for file in files:
-            fp = self.path / file
-            try:
-                with fp.open('rt', encoding='iso-8859-15') as f:
-                    reader = csv.DictReader(f, delimiter=',')
-                    for row in reader:
-                        if int(row['UnlockLvl']) == hq:
-                            card_type = file.split('.')[0]
-                            cards_unlocked[card_type].append(row['Name'])
-                            continue
-            except FileNotFoundError:
-                log.exception("File not found.")
-                return
-            except Exception as ex:
-                return
+        for card in self.CATALOG.unlocked_at(hq):
+            cards_unlocked[card.Type + "s"].append(card.Name)
 
         # update cards to include newly unlocked cards
-        try:
-            async with self.config.user(ctx.author).cards() as cards:
-                for card_type in ['troops', 'airdrops', 'defenses', 'commanders']:
-                    for card in cards_unlocked[card_type]:
-                        if card not in list(cards[card_type]):
-                            # get card rarity
-                            card_info = self.card_search(card)[1]
-                            rarity = card_info.Rarity
-                            level = base_card_levels[rarity.lower()]
-                            cards[card_type][card] = [level, 0]
-        except Exception as ex:
-            log.exception(ex)
-            return
+        cards = user_data["cards"]
+        for card_type in ['troops', 'airdrops', 'defenses', 'commanders']:
+            for card in cards_unlocked[card_type]:
+                if card not in cards[card_type]:
+                    # get card rarity
+                    rarity = self.CATALOG.get(card).Rarity
+                    level = base_card_levels[rarity.lower()]
+                    cards[card_type][card] = [level, 0]
 
     def rush_strings(self, data):
         """To return strings containing card information."""
@@ -1544,25 +1980,19 @@ class RushWars(BaseCog):
             info += f"{card_emote} {card_name} x{count}\n"
         return info
 
-    async def rush_card_level(self, ctx, card_name, card_type):
+    @staticmethod
+    @timed("rush_card_level")
+    def rush_card_level(cards, card_name, card_type):
         """Return the level of card user owns."""
-        try:
-            async with self.config.user(ctx.author).cards() as cards:
-                if card_type == "defenses":
-                    card_types = ["troops", "defenses"]
-                else:
-                    card_types = [card_type]
-                for ctype in card_types:
-                    data = cards[ctype]
-                    for item in data.keys():
-                        if card_name == item:
-                            return data[item][0]
-        except:
-            log.exception("Error with character sheet.")
-            return
+        return card_level(cards, card_name, card_type)
 
-    async def get_rewards(self, ctx, reward_stars):
-        hq = await self.config.user(ctx.author).hq()
+    @timed("get_rewards")
+    def get_rewards(self, user_data, reward_stars):
+        """Apply battle rewards to the user document.
+
+        Returns (stars, gold, xp) rewarded.
+        """
+        hq = user_data["hq"]
         cost = self.HQ_LEVELS[str(hq)]["AttackCost"]
 
         if cost < 25:
@@ -1575,485 +2005,241 @@ class RushWars(BaseCog):
         else:
             reward_gold = random.choice(range(0, available_gold_in_mine))
 
-        try:
-            async with self.config.user(ctx.author).stars() as stars:
-                att_stars = stars["attack"]
-                def_stars = stars["defense"]
-        except:
-            log.exception("Error with character sheet.")
-            return
-        total_stars = att_stars + def_stars
-        i = 0
-        for league in LEAGUES.keys():
-            i += 1
-            low, high = LEAGUES[league][0], LEAGUES[league][1]
-            if total_stars in range(low, high):
-                single_star_xp = i
-                break
-        reward_xp = single_star_xp * reward_stars
+        stars = user_data["stars"]
+        league = self.LEAGUES.resolve(stars["attack"] + stars["defense"])
+        reward_xp = league.Tier * reward_stars
 
         # update user variables
-        gold = await self.config.user(ctx.author).gold()
-        upd_gold = gold + reward_gold
-        await self.config.user(ctx.author).gold.set(upd_gold)
-        xp = await self.config.user(ctx.author).xp()
-        upd_xp = xp + reward_xp
-        await self.config.user(ctx.author).xp.set(upd_xp)
-        async with self.config.user(ctx.author).stars() as stars:
-            att_stars = stars["attack"] + reward_stars
-        await self.config.user(ctx.author).set_raw("stars", "attack", value=att_stars)
-        # except:
-        #     log.exception("Error with character sheet.")
-        #     return
-
-        embed = discord.Embed(colour=0x98D9EB, title="Rewards")
-        embed.add_field(
-            name="Stars", value=f"{STAT_EMOTES['Stars']} {reward_stars}")
-        embed.add_field(
-            name="Gold", value=f"{STAT_EMOTES['Gold_Icon']} {reward_gold}")
-        embed.add_field(name="Experience",
-                        value=f"{STAT_EMOTES['Experience']} {reward_xp}")
+        user_data["gold"] += reward_gold
+        user_data["xp"] += reward_xp
+        stars["attack"] += reward_stars
 
-        return embed
-
-    async def xp_level_handler(self, ctx):
-        """Handles xp level ups."""
-        xp = await self.config.user(ctx.author).xp()
-        lvl = await self.config.user(ctx.author).lvl()
+        return reward_stars, reward_gold, reward_xp
 
-        next_xp = self.XP_LEVELS[str(lvl)]["ExpToNextLevel"]
+    def xp_level_handler(self, user_data):
+        """Apply every level up earned with the user's xp at once.
 
-        if xp >= next_xp:
-            carry = xp - next_xp
-        else:
+        Returns (level up message, rewards message) or False if the user
+        did not level up.
+        """
+        lvl = user_data["lvl"]
+        new_lvl, xp, gem_reward = self.XP_TABLE.resolve(lvl, user_data["xp"])
+        user_data["xp"] = xp
+        if new_lvl == lvl:
             return False
 
-        await self.config.user(ctx.author).xp.set(carry)
-        await self.config.user(ctx.author).lvl.set(lvl+1)
+        user_data["lvl"] = new_lvl
+        user_data["gems"] += gem_reward
 
-        level_up_msg = f"Level up! You have reached level {lvl+1}."
-
-        gem_reward = self.XP_LEVELS[str(lvl)]["GemReward"]
+        level_up_msg = f"Level up! You have reached level {new_lvl}."
         reward_msg = f"Rewards: {gem_reward} {STAT_EMOTES['Gems']}"
-
-        gems = await self.config.user(ctx.author).gems()
-        upd_gem = gems + gem_reward
-        await self.config.user(ctx.author).gems.set(upd_gem)
-
         return (level_up_msg, reward_msg)
 
-    async def cost_gold(self, ctx):
+    def cost_gold(self, user_data):
         """Handle rush gold cost."""
-        hq = await self.config.user(ctx.author).hq()
+        hq = user_data["hq"]
         cost = self.HQ_LEVELS[str(hq)]["AttackCost"]
 
-        gold = await self.config.user(ctx.author).gold()
+        gold = user_data["gold"]
 
         if cost >= gold:
             return False
 
-        upd_gold = gold - cost
-        await self.config.user(ctx.author).gold.set(upd_gold)
+        user_data["gold"] = gold - cost
         return True
 
-    async def _box(self, ctx, box_type=None):
-        """To handle box openings."""
+    async def _box(self, user_data, box_type=None):
+        """To handle box openings. Rewards are applied to the user document."""
+        result, desc = await self.open_reward_box(user_data, box_type)
+        return self.box_embed(result, desc)
 
-        unlocked_boxes = await self.config.user(ctx.author).boxes()
+    @timed("box")
+    async def open_reward_box(self, user_data, box_type=None):
+        """Open a box for a user and apply it. Returns (result, description)."""
+        unlocked_boxes = user_data["boxes"]
 
         if not box_type:
-            c = Boxes(unlocked_boxes)
-            box_type = c.box_type
+            box_type = Boxes.battle_box_type(unlocked_boxes)
 
-        box_data = self.BOXES_INFO[box_type]
+        multiplier, desc = self.box_multiplier(user_data, box_type)
+        result = await self.COMPUTE.run(
+            open_boxes, self.DATA.snapshot.key, random.getrandbits(64),
+            box_type, 1, multiplier, user_data["hq"],
+            self.commander_guaranteed(user_data))
+        self.apply_box(user_data, result)
+        return result, desc
 
-        hq = await self.config.user(ctx.author).hq()
-
-        reward_gem = None
+    def box_multiplier(self, user_data, box_type):
+        """Return box multiplier and description of a box for a user."""
+        hq = user_data["hq"]
 
         if box_type == "Free":
             multiplier = self.HQ_LEVELS[str(hq)]["BoxMultiplier"] / 100
             desc = f"HQ {hq} Free Box"
-            get_gem = random.randint(1, 10)
-            if get_gem >= 7:
-                reward_gem = random.randint(2, 8)
-        else:
-            try:
-                async with self.config.user(ctx.author).stars() as stars:
-                    att_stars = stars["attack"]
-                    def_stars = stars["defense"]
-            except:
-                log.exception("Error with character sheet.")
-                return
-            total_stars = att_stars + def_stars
-            i = 0
-            for league in LEAGUES.keys():
-                low, high, multi = LEAGUES[league]
-                if total_stars in range(low, high):
-                    multiplier = multi / 100
-                    desc = f"{league.title()} {box_type.title()} Box"
-                    break
-
-        user_cards = {
-            "Common": [],
-            "Rare": [],
-            "Epic": [],
-            "Commander": []
-        }
-        async with self.config.user(ctx.author).cards() as cards:
-            for i in [cards["troops"], cards["airdrops"], cards["defenses"]]:
-                for card_name in i.keys():
-                    card_info = self.card_search(card_name)[1]
-                    rarity = card_info.Rarity
-                    user_cards[rarity].append(card_name)
-            commanders = cards["commanders"]
-            if commanders:
-                for commander in commanders:
-                    user_cards["Commander"].append(commander)
-
-        stacks = box_data["Stacks"]
-        total_cards = round(box_data["TotalCards"] * multiplier)
-        rare_chance = box_data["RareChance"]
-        epic_chance = box_data["EpicChance"]
-        commander_chance = box_data["CommanderChance"]
-
-        commander = epic = rare = False
-        random_draw = random.random()
-
-        if random_draw < 1/commander_chance:
-            commander = True
-
-        if random_draw < 1/epic_chance:
-            epic = True
-
-        if random_draw < 1/rare_chance:
-            rare = True
-
-        draws = {}
-
-        # guaranteed commander in 1st box of HQ 5
-        if commanders:
-            for item in commanders:
-                num_of_cards = commanders[item][1]
-                if num_of_cards < 1 and hq == 5:
-                    commander = True
-
-        # code below is a complete mess.
-        # move this to boxes.py
-        if commander:
-            total_commander = 1
-            total_epics = ceil((total_cards - 1) * 0.03)
-            total_rares = ceil((total_cards - 1) * 0.25)
-            total_commons = round((total_cards - 1) * 0.72)
-            total_all = total_commander + total_epics + total_rares + total_commons
-            if total_all > total_cards:
-                diff = total_all - total_cards
-                total_commons -= diff
-            elif total_all < total_cards:
-                diff = total_cards - total_all
-                total_commons += diff
-
-            if stacks == 3:
-                distribution = (1, 1, 0, 1)
-            elif stacks == 4:
-                distribution = (1, 1, 0, 2)
-            elif stacks == 5:
-                distribution = (1, 0, 1, 2)
-            elif stacks == 8:
-                distribution = (1, 1, 2, 4)
-
-            commander_draw = user_cards["Commander"]
-            if not commander_draw:
-                commander_draw = user_cards["Epic"]
-                if not commander_draw:
-                    commander_draw = user_cards["Rare"]
-                    if not commander_draw:
-                        commander_draw = user_cards["Common"]
-            draws[random.choice(commander_draw)] = 1
-
-            if distribution[1] > 0:
-                count = self.split_in_integers(total_epics, distribution[1])
-                for i in range(distribution[1]):
-                    epic_draw = user_cards["Epic"]
-                    if not epic_draw:
-                        epic_draw = user_cards["Rare"]
-                        if not epic_draw:
-                            epic_draw = user_cards["Common"]
-
-                    drawn = random.choice(epic_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
-            if distribution[2] > 0:
-                count = self.split_in_integers(total_rares, distribution[2])
-                for i in range(distribution[2]):
-                    rare_draw = user_cards["Rare"]
-                    if not epic_draw:
-                        rare_draw = user_cards["Common"]
-
-                    drawn = random.choice(rare_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
-                if distribution[3] > 0:
-                    count = self.split_in_integers(
-                        total_commons, distribution[3])
-                    for i in range(distribution[3]):
-                        common_draw = user_cards["Common"]
-
-                        drawn = random.choice(common_draw)
-                        if drawn in draws.keys():
-                            draws[drawn] += count[i]
-                        else:
-                            draws[drawn] = count[i]
-
-        elif epic:
-            total_epics = ceil(total_cards * 0.03)
-            total_rares = ceil(total_cards * 0.25)
-            total_commons = round(total_cards * 0.72)
-            total_all = total_epics + total_rares + total_commons
-            if total_all > total_cards:
-                diff = total_all - total_cards
-                total_commons -= diff
-            elif total_all < total_cards:
-                diff = total_cards - total_all
-                total_commons += diff
-
-            if stacks == 3:
-                distribution = (1, 0, 2)
-            elif stacks == 4:
-                distribution = (1, 1, 2)
-            elif stacks == 5:
-                distribution = (1, 2, 2)
-            elif stacks == 8:
-                distribution = (2, 2, 4)
-
-            if distribution[0] > 0:
-                count = self.split_in_integers(total_epics, distribution[0])
-                for i in range(distribution[0]):
-                    epic_draw = user_cards["Epic"]
-                    if not epic_draw:
-                        epic_draw = user_cards["Rare"]
-                        if not epic_draw:
-                            epic_draw = user_cards["Common"]
-
-                    drawn = random.choice(epic_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
-            if distribution[1] > 0:
-                count = self.split_in_integers(total_rares, distribution[1])
-                for i in range(distribution[1]):
-                    rare_draw = user_cards["Rare"]
-                    if not rare_draw:
-                        rare_draw = user_cards["Common"]
-
-                drawn = random.choice(rare_draw)
-                if drawn in draws.keys():
-                    draws[drawn] += count[i]
-                else:
-                    draws[drawn] = count[i]
-
-            if distribution[2] > 0:
-                count = self.split_in_integers(total_commons, distribution[2])
-                for i in range(distribution[2]):
-                    common_draw = user_cards["Common"]
-
-                    drawn = random.choice(common_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
-        elif rare:
-            total_rares = ceil(total_cards * 0.28)
-            total_commons = round(total_cards * 0.72)
-            total_all = total_rares + total_commons
-            if total_all > total_cards:
-                diff = total_all - total_cards
-                total_commons -= diff
-            elif total_all < total_cards:
-                diff = total_cards - total_all
-                total_commons += diff
-
-            if stacks == 3:
-                distribution = (1, 2)
-            elif stacks == 4:
-                distribution = (1, 3)
-            elif stacks == 5:
-                distribution = (2, 3)
-            elif stacks == 8:
-                distribution = (3, 5)
-
-            if distribution[0] > 0:
-                count = self.split_in_integers(total_rares, distribution[0])
-                for i in range(distribution[0]):
-                    rare_draw = user_cards["Rare"]
-                    if not rare_draw:
-                        rare_draw = user_cards["Common"]
-
-                    drawn = random.choice(rare_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
-            if distribution[1] > 0:
-                count = self.split_in_integers(total_commons, distribution[1])
-                for i in range(distribution[1]):
-                    common_draw = user_cards["Common"]
-
-                    drawn = random.choice(common_draw)
-                    if drawn in draws.keys():
-                        draws[drawn] += count[i]
-                    else:
-                        draws[drawn] = count[i]
-
         else:
-            total_commons = total_cards
-
-            count = self.split_in_integers(total_commons, stacks)
-            for i in range(stacks):
-                common_draw = user_cards["Common"]
-
-                drawn = random.choice(common_draw)
-                if drawn in draws.keys():
-                    draws[drawn] += count[i]
-                else:
-                    draws[drawn] = count[i]
-
-        try:
-            async with self.config.user(ctx.author).cards() as cards:
-                for card_name in draws.keys():
-                    count = draws[card_name]
-                    card_info = self.card_search(card_name)
-                    card_type = str(card_info[0]) + "s"
-                    # return await ctx.send(card_name)
-                    # update number of cards
-                    cards[card_type][card_name][1] += count
-        except Exception as ex:
-            log.exception(ex)
-            return
+            stars = user_data["stars"]
+            league = self.LEAGUES.resolve(stars["attack"] + stars["defense"])
+            multiplier = league.Multiplier / 100
+            desc = f"{league.Name} {box_type.title()} Box"
+        return multiplier, desc
 
-        # handle gold
-        min_gold = round(box_data["MinGold"] * multiplier)
-        max_gold = round(box_data["MaxGold"] * multiplier)
-
-        reward_gold = random.randint(min_gold, max_gold)
-
-        gold = await self.config.user(ctx.author).gold()
-        upd_gold = gold + reward_gold
-        await self.config.user(ctx.author).gold.set(upd_gold)
+    @staticmethod
+    def commander_guaranteed(user_data):
+        """Guaranteed commander in 1st box of HQ 5."""
+        return user_data["hq"] == 5 and any(
+            item[1] < 1 for item in user_data["cards"]["commanders"].values())
+
+    def apply_box(self, user_data, result, boxes=1):
+        """Add the contents of opened boxes to the user document."""
+        cards = user_data["cards"]
+        for card_name, count in result.draws.items():
+            card = self.CATALOG.get(card_name)
+            owned = cards[card.Type + "s"].setdefault(
+                card_name, [base_card_levels[card.Rarity.lower()], 0])
+            # update number of cards
+            owned[1] += count
+
+        user_data["gold"] += result.gold
+        user_data["gems"] += result.gems
 
         # increase number of boxes
-        await self.config.user(ctx.author).boxes.set(unlocked_boxes+1)
+        user_data["boxes"] += boxes
 
-        # return rewards embed
+    def box_embed(self, result, desc):
+        """Return rewards embed of an opened box."""
         embed = discord.Embed(colour=0x98D9EB)
         embed.set_author(
-            name=desc, icon_url=f"https://www.rushstats.com/assets/box/{box_type}.png")
+            name=desc, icon_url=f"https://www.rushstats.com/assets/box/{result.box_type}.png")
 
-        if reward_gem:
-            gems = await self.config.user(ctx.author).gems()
-            upd_gems = gold + reward_gold
-            await self.config.user(ctx.author).gold.set(upd_gems)
+        if result.gems:
             embed.add_field(
-                name=f"Gems {STAT_EMOTES['Gems']}", value=f"{reward_gem}")
+                name=f"Gems {STAT_EMOTES['Gems']}", value=f"{result.gems}")
 
         embed.add_field(
-            name=f"Gold {STAT_EMOTES['Gold_Icon']}", value=f"{reward_gold}")
-
-        for rarity in user_cards.keys():
-            # embed.add_field()
-            items = user_cards[rarity]
-            for card in draws.keys():
-                count = draws[card]
-                if card in items:
-                    # card_rarity = rarity
-                    card_emote = self.card_emotes(card)
-                    embed.add_field(
-                        name=f"{card} {card_emote} x {count}", value=f"Rarity: {rarity}")
+            name=f"Gold {STAT_EMOTES['Gold_Icon']}", value=f"{result.gold}")
+
+        # embeds are limited to 25 fields, list cards in the description
+        # when there are too many of them
+        if len(result.draws) > 20:
+            cards_str = ""
+            for card, count in result.draws.items():
+                rarity = self.CATALOG.get(card).Rarity
+                card_emote = self.card_emotes(card)
+                cards_str += f"{card_emote} `{card}` x{count} ({rarity})\n"
+            embed.description = cards_str
+            return embed
+
+        for card, count in result.draws.items():
+            rarity = self.CATALOG.get(card).Rarity
+            card_emote = self.card_emotes(card)
+            embed.add_field(
+                name=f"{card} {card_emote} x {count}", value=f"Rarity: {rarity}")
 
         return embed
 
-    def split_in_integers(self, number, num_of_pieces):
-        """Split a number into number of integers."""
-        if num_of_pieces == 1:
-            total_sum = 1
-        else:
-            total_sum = sum(range(1, num_of_pieces))
+    def battle_embed(self, player, opponent, attack_str, defense_str, stars,
+                     rewards, box=None, level_up=None):
+        """Return one embed with every outcome of a battle.
 
-        parts = []
-        for i in range(num_of_pieces):
-            x = int((i+1) * number / total_sum)
-            parts.append(x)
+        `rewards` is the (stars, gold, xp) tuple of `get_rewards`, `box`
+        an optional (result, description) tuple of `open_reward_box` and
+        `level_up` the optional messages of `xp_level_handler`.
+        """
+        result_str = "You win!" if stars > 0 else "You lose!"
+        embed = discord.Embed(colour=0x98D9EB, title="Battle Result",
+                              description=f"**{result_str}** {STAT_EMOTES['Stars'] * stars}")
+        embed.set_author(name=f"{player} vs {opponent}",
+                         icon_url="https://cdn.discordapp.com/attachments/622323508755693581/626058519929684027/Leaderboard.png")
+        embed.add_field(
+            name="Attack <:RW_Attck:625783202836905984>", value=attack_str or "-")
+        embed.add_field(
+            name="Defense <:RW_Defenses:626339085501333504>", value=defense_str or "-")
 
-        parts.sort()
-        return parts
+        reward_stars, reward_gold, reward_xp = rewards
+        embed.add_field(
+            name="Rewards",
+            value=f"{STAT_EMOTES['Stars']} {reward_stars} "
+                  f"{STAT_EMOTES['Gold_Icon']} {reward_gold} "
+                  f"{STAT_EMOTES['Experience']} {reward_xp}",
+            inline=False)
+
+        if box:
+            result, desc = box
+            box_str = f"{STAT_EMOTES['Gold_Icon']} {result.gold}"
+            if result.gems:
+                box_str += f" {STAT_EMOTES['Gems']} {result.gems}"
+            box_str += "\n"
+            for card, count in result.draws.items():
+                box_str += f"{self.card_emotes(card)} `{card}` x{count}\n"
+            embed.add_field(name=desc, value=box_str[:1024], inline=False)
+
+        if level_up:
+            embed.add_field(name="Level Up", value=f"{level_up[0]}\n{level_up[1]}", inline=False)
 
-    async def handle_keys(self, ctx, stars):
+        return embed
+
+    @staticmethod
+    def handle_keys(user_data, stars):
         """Handle keys and check whether to open box or not."""
-        temp_stars = await self.config.user(ctx.author).temp_stars()
-        keys = await self.config.user(ctx.author).keys()
+        temp_stars = user_data["temp_stars"]
+        keys = user_data["keys"]
 
         if keys > 0:
             temp_stars += stars
             if temp_stars >= 5:
-                # update config variable
-                await self.config.user(ctx.author).temp_stars.set(temp_stars - 5)
-                # update keys
-                await self.config.user(ctx.author).keys.set(keys-1)
+                # update temp stars and keys
+                user_data["temp_stars"] = temp_stars - 5
+                user_data["keys"] = keys - 1
                 return True
             else:
-                await self.config.user(ctx.author).temp_stars.set(temp_stars)
+                user_data["temp_stars"] = temp_stars
                 return False
         if keys < 0:
             temp_stars += stars
             if temp_stars > 5:
                 temp_stars = 5
-            await self.config.user(ctx.author).temp_stars.set(temp_stars)
+            user_data["temp_stars"] = temp_stars
             return False
 
-    async def matchmaking(self, ctx):
-        user_stars = await self.get_stars(ctx.author)
-        # return await ctx.send(f"`{ctx.author}`")
-        selected = None
-
-        opponents = await self.config.all_users()
-        opponent_keys = list(opponents.keys())
-        random.shuffle(opponent_keys)
-        for opponent_id in opponent_keys:
-            # return await ctx.send(opponent)
-            if opponent_id == ctx.author.id:
-                continue
-
+    @timed("matchmaking")
+    async def matchmaking(self, ctx, user_stars=None):
+        """Find a random opponent in the guild within 100 stars."""
+        if ctx.guild is None:
+            return None
+        if user_stars is None:
+            user_stars = await self.get_stars(ctx.author)
+
+        while True:
+            opponent_id = self.MATCHMAKING.find(
+                ctx.guild.id, ctx.author.id, user_stars)
+            if opponent_id is None:
+                return None
             opponent = ctx.guild.get_member(opponent_id)
-            opponent_stars = await self.get_stars(opponent)
+            if opponent is not None:
+                return opponent
+            # member left the guild
+            self.MATCHMAKING.remove(opponent_id, ctx.guild.id)
 
-            if user_stars in range(opponent_stars-100, opponent_stars+100):
-                if opponents[opponent_id]["active"]["defenses"]:
-                    selected = opponent
-                    break
-            else:
-                continue
-
-        return selected
+    @staticmethod
+    def has_defense(active):
+        """Return whether an active document has any defense cards."""
+        return has_defense(active)
+
+    def index_player(self, user, guild, user_data):
+        """Update the matchmaking index and leaderboards from a user document."""
+        stars = user_data["stars"]["attack"] + user_data["stars"]["defense"]
+        guild_id = guild.id if guild is not None else None
+        self.MATCHMAKING.update(
+            user.id, stars, self.has_defense(user_data["active"]), guild_id)
+        self.LEADERBOARDS.update(user.id, stars, guild_id)
 
     async def get_stars(self, user):
         """Get total stars of selected user."""
         try:
-            async with self.config.user(user).stars() as stars:
-                att_stars = stars["attack"]
-                def_stars = stars["defense"]
+            stars = (await self.users.get(user))["stars"]
         except:
             log.exception("Error with character sheet.")
             return
 
-        return att_stars + def_stars
+        return stars["attack"] + stars["defense"]
     
\ No newline at end of file
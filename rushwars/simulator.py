@@ -0,0 +1,146 @@
+import numpy as np
+
+from .battle import ATTACK_TYPES, STAR_THRESHOLDS
+from .catalog import max_card_level
+
+
+class BattleSimulator:
+    """Vectorized version of the rush battle formula.
+
+    Squads and defenses are encoded as count and level matrices of shape
+    (battles, cards), with one column per card of the catalog. Per-level
+    contributions of every card are precomputed into (cards, levels)
+    tables so a batch of battles is a handful of NumPy operations.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.names = [card.Name for card in catalog.cards]
+        self.columns = {name: i for i, name in reversed(list(enumerate(self.names)))}
+
+        shape = (len(self.names), max_card_level + 1)
+        self.hp = np.zeros(shape)
+        self.attps = np.zeros(shape)
+        self.def_attps = np.zeros(shape)
+
+        for i, card in enumerate(catalog.cards):
+            for level in range(max_card_level + 1):
+                stats = catalog.level_stats(card.Name, level)
+                if card.Type == "airdrop":
+                    effect = card.Value * stats.Duration
+                    if card.Ability in ["Damage", "Boost"]:
+                        self.attps[i, level] = effect
+                    if card.Ability in ["Heal", "Boost"]:
+                        self.hp[i, level] = effect
+                    if card.Ability in ["Invisibility", "Freeze"]:
+                        self.def_attps[i, level] = -effect
+                else:
+                    self.hp[i, level] = stats.Hp
+                    self.attps[i, level] = stats.Att / card.AttSpeed
+
+    def encode(self, cards: dict, levels: dict = None):
+        """Return (counts, levels) rows for a {card name: count} mapping."""
+        counts = np.zeros(len(self.names))
+        card_levels = np.ones(len(self.names), dtype=np.int64)
+        for name, count in cards.items():
+            column = self.columns[name]
+            counts[column] += count
+            if levels is not None:
+                card_levels[column] = levels[name]
+        return counts, card_levels
+
+    def encode_squad(self, active: dict, levels: dict):
+        """Encode the attack part of an `active` document."""
+        cards = {}
+        for card_type in ATTACK_TYPES:
+            for name, count in active[card_type].items():
+                cards[name] = cards.get(name, 0) + count
+        return self.encode(cards, levels)
+
+    def attack_power(self, counts, levels):
+        """Return hp, attps and def_attps arrays for a batch of squads."""
+        levels = np.clip(levels, 0, max_card_level)
+        columns = np.arange(counts.shape[-1])
+        hp = (counts * self.hp[columns, levels]).sum(axis=-1)
+        attps = (counts * self.attps[columns, levels]).sum(axis=-1)
+        def_attps = (counts * self.def_attps[columns, levels]).sum(axis=-1)
+        return hp, attps, def_attps
+
+    def defense_power(self, counts, levels):
+        """Return def_hp and def_attps arrays for a batch of defenses."""
+        levels = np.clip(levels, 0, max_card_level)
+        columns = np.arange(counts.shape[-1])
+        def_hp = (counts * self.hp[columns, levels]).sum(axis=-1)
+        def_attps = (counts * self.attps[columns, levels]).sum(axis=-1)
+        return def_hp, def_attps
+
+    @staticmethod
+    def score(hp, attps, def_hp, def_attps):
+        """Vectorized `battle.battle_score`."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            survive = np.where(def_attps != 0, hp / def_attps, np.inf)
+            destroy = np.where(attps != 0, def_hp / attps, np.inf)
+        return survive - destroy
+
+    @staticmethod
+    def stars(score):
+        """Vectorized `battle.battle_stars`."""
+        stars = np.zeros(np.shape(score), dtype=np.int8)
+        for threshold in STAR_THRESHOLDS:
+            stars += score > threshold
+        return stars
+
+    def battle(self, squads, squad_levels, defenses, defense_levels):
+        """Return the stars of a batch of battles.
+
+        All arguments are (battles, cards) arrays or rows that broadcast
+        against them.
+        """
+        hp, attps, def_attps = self.attack_power(squads, squad_levels)
+        def_hp, base_def_attps = self.defense_power(defenses, defense_levels)
+        return self.stars(self.score(hp, attps, def_hp, def_attps + base_def_attps))
+
+    def simulate_computer(self, active: dict, levels: dict, defenses: list,
+                          battles: int = 100000, batch_size: int = 100000, seed=None):
+        """Simulate a squad against randomly chosen computer defenses.
+
+        Every battle picks one of `defenses` and jitters each defense card's
+        level around the squad's average level, like the computer opponent
+        in rush. Returns a report dict.
+        """
+        rng = np.random.default_rng(seed)
+        squad, squad_levels = self.encode_squad(active, levels)
+        if levels:
+            avg_level = round(sum(levels[name] for name in levels) / len(levels))
+        else:
+            avg_level = 1
+
+        options = np.stack([self.encode(defense)[0] for defense in defenses])
+        star_counts = np.zeros(4, dtype=np.int64)
+
+        done = 0
+        while done < battles:
+            size = min(batch_size, battles - done)
+            picks = options[rng.integers(0, len(defenses), size)]
+            jitter = rng.integers(-1, 2, picks.shape)
+            def_levels = np.maximum(avg_level + jitter, 1)
+            stars = self.battle(squad, squad_levels, picks, def_levels)
+            star_counts += np.bincount(stars, minlength=4)
+            done += size
+
+        return self.report(star_counts)
+
+    @staticmethod
+    def report(star_counts):
+        """Return win rate and star distribution from star counts."""
+        total = int(star_counts.sum())
+        distribution = {
+            stars: (int(count) / total if total else 0.0)
+            for stars, count in enumerate(star_counts)
+        }
+        return {
+            "battles": total,
+            "win_rate": 1 - distribution[0],
+            "stars": distribution,
+            "average_stars": float((star_counts * np.arange(4)).sum() / total) if total else 0.0
+        }
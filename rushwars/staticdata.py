@@ -0,0 +1,236 @@
+import json
+import logging
+import threading
+from pathlib import Path
+
+from .boxes import Boxes
+from .catalog import CARD_FILES, RARITIES, CardCatalog, max_card_level
+from .combat import CombatEngine
+from .housing import Housing
+from .levels import XPTable
+from .power import CombatPower
+from .simulator import BattleSimulator
+
+log = logging.getLogger("red.rushwars.staticdata")
+
+# attribute -> (file name, keys every entry must have)
+JSON_FILES = {
+    "xp_levels": ("xp_levels.json", ("ExpToNextLevel", "MaxHQLevel", "GemReward")),
+    "hq_levels": ("hq_levels.json", ("UpgradeGold", "BoxMultiplier", "AttackCost", "ResourceMax")),
+    "chopper_levels": (
+        "chopper_levels.json", ("UpgradeGold", "TroopHousing", "AirdropHousing", "DefenceHousing")),
+    "boxes_info": (
+        "boxes.json",
+        ("TotalCards", "Stacks", "RareChance", "EpicChance", "CommanderChance", "MinGold", "MaxGold")),
+    "rarity_info": ("rarities.json", ("UpgradeCards", "UpgradeCost", "UpgradePlayerExp")),
+}
+TIPS_FILE = "tips.json"
+CARD_CSV_FILES = [file for file, _ in CARD_FILES]
+
+
+class DataError(ValueError):
+    """Raised when a bundled data file is missing or invalid."""
+
+
+class StaticData:
+    """Immutable snapshot of the bundled game data.
+
+    Derived tables are built on first use and kept for the lifetime of
+    the snapshot. A reload builds a new snapshot instead of changing
+    this one, so code holding a snapshot always sees consistent data.
+    """
+
+    def __init__(self, path, version: int, mtimes: dict, xp_levels: dict, hq_levels: dict,
+                 chopper_levels: dict, boxes_info: dict, rarity_info: dict, tips: list,
+                 catalog: CardCatalog):
+        self.path = path
+        self.version = version
+        # file name -> st_mtime_ns when it was parsed
+        self.mtimes = mtimes
+        self.xp_levels = xp_levels
+        self.hq_levels = hq_levels
+        self.chopper_levels = chopper_levels
+        self.boxes_info = boxes_info
+        self.rarity_info = rarity_info
+        self.tips = tips
+        self.catalog = catalog
+        self._xp_table = None
+        self._boxes = None
+        self._simulator = None
+        self._housing = None
+        self._combat = None
+        self._power = None
+
+    @property
+    def key(self):
+        """(data path, version) identifying this snapshot in compute workers."""
+        return str(self.path), self.version
+
+    @property
+    def xp_table(self) -> XPTable:
+        if self._xp_table is None:
+            self._xp_table = XPTable(self.xp_levels)
+        return self._xp_table
+
+    @property
+    def boxes(self) -> Boxes:
+        if self._boxes is None:
+            self._boxes = Boxes(self.boxes_info, self.catalog)
+        return self._boxes
+
+    @property
+    def simulator(self) -> BattleSimulator:
+        if self._simulator is None:
+            self._simulator = BattleSimulator(self.catalog)
+        return self._simulator
+
+    @property
+    def housing(self) -> Housing:
+        if self._housing is None:
+            self._housing = Housing(self.catalog, self.chopper_levels, self.power)
+        return self._housing
+
+    @property
+    def power(self) -> CombatPower:
+        if self._power is None:
+            self._power = CombatPower(self.catalog)
+        return self._power
+
+    @property
+    def combat(self) -> CombatEngine:
+        if self._combat is None:
+            self._combat = CombatEngine(self.catalog)
+        return self._combat
+
+    def __repr__(self):
+        return f"<StaticData v{self.version} ({len(self.catalog)} cards)>"
+
+
+class DataStore:
+    """Loads the bundled data files into StaticData snapshots.
+
+    Files are parsed once. `reload` only parses files whose mtime
+    changed and reuses everything else, including derived tables that
+    do not depend on a changed file, from the current snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.snapshot: StaticData = None
+        self._lock = threading.Lock()
+
+    def load(self) -> StaticData:
+        """Parse every data file and return the new snapshot."""
+        snapshot, _ = self.reload(force=True)
+        return snapshot
+
+    def reload(self, force: bool = False):
+        """Return (snapshot, changed file names).
+
+        The current snapshot is kept, and DataError raised, when a
+        changed file is invalid. It is returned unchanged, with no
+        changed files, when nothing was modified.
+        """
+        with self._lock:
+            old = self.snapshot
+            mtimes = self._mtimes()
+            changed = [
+                file for file, mtime in mtimes.items()
+                if force or old is None or old.mtimes.get(file) != mtime
+            ]
+            if not changed:
+                return old, []
+
+            parts = {}
+            for attr, (file, keys) in JSON_FILES.items():
+                if file in changed:
+                    parts[attr] = self._load_table(file, keys)
+                else:
+                    parts[attr] = getattr(old, attr)
+            if TIPS_FILE in changed:
+                parts["tips"] = self._load_tips()
+            else:
+                parts["tips"] = old.tips
+            if any(file in changed for file in CARD_CSV_FILES):
+                parts["catalog"] = self._load_catalog()
+            else:
+                parts["catalog"] = old.catalog
+            self._validate(parts)
+
+            snapshot = StaticData(
+                self.path, old.version + 1 if old else 1, mtimes, **parts)
+            if old is not None:
+                if snapshot.xp_levels is old.xp_levels:
+                    snapshot._xp_table = old._xp_table
+                if snapshot.catalog is old.catalog:
+                    snapshot._simulator = old._simulator
+                    snapshot._combat = old._combat
+                    snapshot._power = old._power
+                    if snapshot.boxes_info is old.boxes_info:
+                        snapshot._boxes = old._boxes
+                    if snapshot.chopper_levels is old.chopper_levels:
+                        snapshot._housing = old._housing
+            self.snapshot = snapshot
+        log.debug(f"Loaded data version {snapshot.version}: {', '.join(changed)}.")
+        return snapshot, changed
+
+    def _mtimes(self):
+        files = [file for file, _ in JSON_FILES.values()] + [TIPS_FILE] + CARD_CSV_FILES
+        mtimes = {}
+        for file in files:
+            try:
+                mtimes[file] = (self.path / file).stat().st_mtime_ns
+            except OSError:
+                raise DataError(f"{file} could not be found in the Rush Wars data folder.")
+        return mtimes
+
+    def _load_json(self, file):
+        try:
+            with (self.path / file).open("r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as ex:
+            raise DataError(f"{file} could not be read: {ex}")
+
+    def _load_table(self, file, keys):
+        table = self._load_json(file)
+        if not isinstance(table, dict) or not table:
+            raise DataError(f"{file} must be a non-empty object.")
+        for name, entry in table.items():
+            missing = [key for key in keys if key not in entry]
+            if missing:
+                raise DataError(f"{file}: {name} is missing {', '.join(missing)}.")
+        return table
+
+    def _load_tips(self):
+        tips = self._load_json(TIPS_FILE)
+        if not isinstance(tips, list) or not all(isinstance(tip, str) for tip in tips):
+            raise DataError(f"{TIPS_FILE} must be a list of strings.")
+        return tips
+
+    def _load_catalog(self):
+        try:
+            catalog = CardCatalog.from_path(self.path)
+        except (KeyError, ValueError) as ex:
+            raise DataError(f"Card files could not be parsed: {ex!r}")
+        if not len(catalog):
+            raise DataError("No cards found in the card files.")
+        return catalog
+
+    @staticmethod
+    def _validate(parts):
+        """Check references between files."""
+        for table in ("xp_levels", "hq_levels", "chopper_levels"):
+            levels = sorted(int(level) for level in parts[table])
+            if levels != list(range(1, len(levels) + 1)):
+                raise DataError(f"{table} must have levels 1 to {len(levels)}.")
+        for card in parts["catalog"].cards:
+            if card.Rarity not in parts["rarity_info"]:
+                raise DataError(f"{card.Name} has unknown rarity {card.Rarity}.")
+        for rarity in RARITIES:
+            info = parts["rarity_info"].get(rarity)
+            if info is None:
+                raise DataError(f"rarities.json is missing {rarity}.")
+            # upgrade tables are indexed by the level within the rarity
+            levels = [len(info[key]) for key in JSON_FILES["rarity_info"][1]]
+            if min(levels) != max(levels) or max(levels) > max_card_level:
+                raise DataError(f"rarities.json: {rarity} upgrade lists do not match.")
@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+
+log = logging.getLogger("red.rushwars.storage")
+
+BACKENDS = ("config", "sqlite")
+
+# document keys stored in their own players column
+SCALARS = ("xp", "lvl", "hq", "chopper", "keys", "gold", "gems", "boxes",
+           "temp_stars", "temp_def_stars")
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    user_id INTEGER PRIMARY KEY,
+    xp INTEGER NOT NULL,
+    lvl INTEGER NOT NULL,
+    hq INTEGER NOT NULL,
+    chopper INTEGER NOT NULL,
+    keys INTEGER NOT NULL,
+    gold INTEGER NOT NULL,
+    gems INTEGER NOT NULL,
+    boxes INTEGER NOT NULL,
+    temp_stars INTEGER NOT NULL,
+    temp_def_stars INTEGER NOT NULL,
+    attack_stars INTEGER NOT NULL,
+    defense_stars INTEGER NOT NULL,
+    total_stars INTEGER NOT NULL,
+    has_defense INTEGER NOT NULL,
+    last_active REAL NOT NULL,
+    extra TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS players_stars ON players (total_stars DESC, user_id, has_defense);
+CREATE INDEX IF NOT EXISTS players_activity ON players (last_active);
+CREATE TABLE IF NOT EXISTS cards (
+    user_id INTEGER NOT NULL,
+    card_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, card_type, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS active (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, category, name)
+) WITHOUT ROWID;
+"""
+
+
+def total_stars(user_data):
+    return user_data["stars"]["attack"] + user_data["stars"]["defense"]
+
+
+def has_defense(active):
+    """Return whether an active document has any defense cards."""
+    return any(count > 0 for count in active["defenses"].values())
+
+
+class ConfigStorage:
+    """User documents stored as Red Config user blobs."""
+
+    name = "config"
+
+    def __init__(self, config):
+        self.config = config
+
+    async def load(self, user_id: int):
+        return await self.config.user_from_id(user_id).all()
+
+    async def save_many(self, docs: dict):
+        """Write {user_id: document}. Returns the IDs that failed."""
+        failed = []
+        for user_id, doc in docs.items():
+            try:
+                await self.config.user_from_id(user_id).set(doc)
+            except Exception:
+                failed.append(user_id)
+                log.exception(f"Error writing user {user_id} to Config.")
+        return failed
+
+    async def ranking(self):
+        """Return (user_id, total stars, has defense) of every player, most stars first.
+
+        Config can only be scanned as a whole, so every document is loaded.
+        """
+        all_users = await self.config.all_users()
+        rows = [
+            (user_id, total_stars(data), has_defense(data["active"]))
+            for user_id, data in all_users.items()
+        ]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows
+
+    async def iter_users(self, chunk_size: int = 500):
+        """Yield lists of (user_id, document) of every stored player.
+
+        Config has no partial reads, its documents are copied from one
+        all_users() call; use SQLite for exports in bounded memory.
+        """
+        all_users = await self.config.all_users()
+        user_ids = list(all_users)
+        for i in range(0, len(user_ids), chunk_size):
+            yield [(user_id, all_users.pop(user_id)) for user_id in user_ids[i:i + chunk_size]]
+
+    async def stats(self, since: float = None):
+        # counting Config users means loading all of them
+        return {}
+
+    async def clear(self):
+        """Delete every stored player."""
+        await self.config.clear_all_users()
+
+    async def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """User documents stored in normalized tables of a SQLite database.
+
+    Players get one row with their scalar fields, stars and the time of
+    their last write; owned cards and the active squad and defense get
+    one row per card. Keys without a column of their own (housing,
+    power, presets) are kept as JSON in `players.extra`, so documents
+    load back unchanged.
+
+    The database runs in WAL mode so reads never wait on a write. All
+    queries run in a single worker thread owning the connection, which
+    keeps the event loop free and serializes access.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, defaults: dict):
+        self.path = Path(path)
+        self.defaults = defaults
+        # decoding is a lot faster than deepcopy for new documents
+        self._defaults_json = json.dumps(defaults)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rushwars-sqlite")
+        self._conn = None
+
+    async def load(self, user_id: int):
+        """Return a user's document, the defaults for unknown users."""
+        return await self._run(self._load, user_id)
+
+    async def save_many(self, docs: dict):
+        """Write {user_id: document} in one transaction. Returns the IDs that failed."""
+        if not docs:
+            return []
+        try:
+            await self._run(self._save_many, docs, time.time())
+        except Exception:
+            log.exception(f"Error writing {len(docs)} users to {self.path.name}.")
+            return list(docs)
+        return []
+
+    async def ranking(self):
+        """Return (user_id, total stars, has defense) of every player, most stars first.
+
+        Served from the players_stars index without reading the players.
+        """
+        return await self._run(self._query, (
+            "SELECT user_id, total_stars, has_defense FROM players"
+            " ORDER BY total_stars DESC, user_id"))
+
+    async def iter_users(self, chunk_size: int = 500):
+        """Yield lists of (user_id, document) of every stored player, in user ID order.
+
+        Only one chunk is in memory at a time.
+        """
+        after = -1
+        while True:
+            chunk = await self._run(self._load_chunk, after, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            after = chunk[-1][0]
+
+    async def stats(self, since: float = None):
+        """Return the number of players and of players written since `since`."""
+        rows = await self._run(self._query, (
+            "SELECT COUNT(*), (SELECT COUNT(*) FROM players WHERE last_active >= ?)"
+            " FROM players"), (since or 0,))
+        players, active = rows[0]
+        return {"players": players, "active": active}
+
+    async def clear(self):
+        """Delete every stored player."""
+        await self._run(self._clear)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # everything below runs in the worker thread
+
+    def _connection(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path))
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL stays consistent on power loss, only the last commits may be lost
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _clear(self):
+        conn = self._connection()
+        with conn:
+            for table in ("players", "cards", "active"):
+                conn.execute(f"DELETE FROM {table}")
+
+    def _query(self, sql, params=()):
+        return self._connection().execute(sql, params).fetchall()
+
+    def _load(self, user_id):
+        players = self._load_players("user_id = ?", (user_id,))
+        if not players:
+            return json.loads(self._defaults_json)
+        return players[0][1]
+
+    def _load_chunk(self, after, chunk_size):
+        return self._load_players("user_id > ? ORDER BY user_id LIMIT ?", (after, chunk_size))
+
+    def _load_players(self, where, params):
+        """Return (user_id, document) of the players selected by `where`.
+
+        `where` must select consecutive user IDs in order, their cards are
+        read with one range scan.
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            f"SELECT user_id, {', '.join(SCALARS)}, attack_stars, defense_stars, extra"
+            f" FROM players WHERE {where}", params).fetchall()
+        if not rows:
+            return []
+
+        docs = {}
+        for row in rows:
+            doc = json.loads(self._defaults_json)
+            doc.update(zip(SCALARS, row[1:]))
+            doc["stars"] = {"attack": row[-3], "defense": row[-2]}
+            doc.update(json.loads(row[-1]))
+            doc["cards"] = {card_type: {} for card_type in self.defaults["cards"]}
+            doc["active"] = {category: {} for category in self.defaults["active"]}
+            docs[row[0]] = doc
+
+        user_range = (rows[0][0], rows[-1][0])
+        for user_id, card_type, name, level, count in conn.execute(
+                "SELECT user_id, card_type, name, level, count FROM cards"
+                " WHERE user_id BETWEEN ? AND ?", user_range):
+            docs[user_id]["cards"].setdefault(card_type, {})[name] = [level, count]
+        for user_id, category, name, count in conn.execute(
+                "SELECT user_id, category, name, count FROM active"
+                " WHERE user_id BETWEEN ? AND ?", user_range):
+            docs[user_id]["active"].setdefault(category, {})[name] = count
+        return [(row[0], docs[row[0]]) for row in rows]
+
+    def _save_many(self, docs, now):
+        players = []
+        cards = []
+        active = []
+        for user_id, doc in docs.items():
+            extra = {
+                key: value for key, value in doc.items()
+                if key not in SCALARS and key not in ("stars", "cards", "active")
+            }
+            players.append(
+                (user_id,) + tuple(doc[key] for key in SCALARS) + (
+                    doc["stars"]["attack"], doc["stars"]["defense"], total_stars(doc),
+                    has_defense(doc["active"]), now, json.dumps(extra, separators=(",", ":"))))
+            cards += [
+                (user_id, card_type, name, level, count)
+                for card_type, owned in doc["cards"].items()
+                for name, (level, count) in owned.items()
+            ]
+            active += [
+                (user_id, category, name, count)
+                for category, selected in doc["active"].items()
+                for name, count in selected.items()
+            ]
+
+        conn = self._connection()
+        user_ids = [(user_id,) for user_id in docs]
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO players VALUES ({', '.join('?' * 17)})", players)
+            conn.executemany("DELETE FROM cards WHERE user_id = ?", user_ids)
+            conn.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?)", cards)
+            conn.executemany("DELETE FROM active WHERE user_id = ?", user_ids)
+            conn.executemany("INSERT INTO active VALUES (?, ?, ?, ?)", active)
+
+
+async def copy_players(source, target, defaults: dict, chunk_size: int = 500):
+    """Copy every player of `source` into `target`. Returns the number copied.
+
+    Documents are merged with the defaults first, like Config does for
+    keys that were never set, and written `chunk_size` at a time. Players
+    only in `target` are kept; clear it first for an exact copy.
+    """
+    count = 0
+    async for chunk in source.iter_users(chunk_size):
+        docs = {}
+        for user_id, data in chunk:
+            doc = deepcopy(defaults)
+            doc.update(data)
+            docs[user_id] = doc
+        failed = await target.save_many(docs)
+        if failed:
+            raise RuntimeError(f"{len(failed)} players could not be written to {target.name}.")
+        count += len(docs)
+    return count
@@ -0,0 +1,191 @@
+"""In-memory stand-ins for Red's Config and the Discord objects used by the cog.
+
+Shared by the tests and the benchmarks.
+"""
+from collections import Counter
+from copy import deepcopy
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA_PATH = ROOT / "rushwars" / "data"
+
+
+class FakeGroup:
+    """Config user group; returns copies like Red's Config does."""
+
+    def __init__(self, config, user_id):
+        self.config = config
+        self.user_id = user_id
+
+    async def all(self):
+        self.config.calls["user.all"] += 1
+        doc = self.config.docs.get(self.user_id)
+        if doc is None:
+            doc = self.config.defaults
+        return deepcopy(doc)
+
+    async def set(self, value):
+        self.config.calls["user.set"] += 1
+        self.config.docs[self.user_id] = deepcopy(value)
+
+
+class FakeValue:
+    """Config global or guild value."""
+
+    def __init__(self, config, values, name, scope="global"):
+        self.config = config
+        self.values = values
+        self.name = name
+        self.scope = scope
+
+    async def __call__(self):
+        self.config.calls[f"{self.scope}.get"] += 1
+        return self.values[self.name]
+
+    async def set(self, value):
+        self.config.calls[f"{self.scope}.set"] += 1
+        self.values[self.name] = value
+
+
+class FakeGuildGroup:
+    def __init__(self, config, guild_id):
+        self.config = config
+        self.values = config.guilds.setdefault(guild_id, dict(config.guild_defaults))
+
+    def __getattr__(self, name):
+        return FakeValue(self.config, self.values, name, "guild")
+
+
+class FakeConfig:
+    """In-memory stand-in for the parts of Red's Config used by the cog."""
+
+    def __init__(self):
+        self.defaults = {}
+        self.globals = {}
+        self.guild_defaults = {}
+        self.guilds = {}
+        self.docs = {}
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get("globals", {}):
+            return FakeValue(self, self.globals, name)
+        raise AttributeError(name)
+
+    @classmethod
+    def get_conf(cls, cog, identifier, force_registration=False):
+        return cls()
+
+    def register_user(self, **defaults):
+        self.defaults = defaults
+
+    def register_global(self, **defaults):
+        self.globals.update(defaults)
+
+    def register_guild(self, **defaults):
+        self.guild_defaults.update(defaults)
+
+    def guild(self, guild):
+        return FakeGuildGroup(self, guild.id)
+
+    def user(self, user):
+        return FakeGroup(self, user.id)
+
+    def user_from_id(self, user_id):
+        return FakeGroup(self, user_id)
+
+    async def all_guilds(self):
+        self.calls["all_guilds"] += 1
+        return {guild_id: dict(values) for guild_id, values in self.guilds.items()}
+
+    async def all_users(self):
+        self.calls["all_users"] += 1
+        return deepcopy(self.docs)
+
+    async def clear_all_users(self):
+        self.calls["clear_all_users"] += 1
+        self.docs.clear()
+
+
+class FakeUser:
+    bot = False
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"player{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return f"{self.name}#0001"
+
+
+class FakeGuild:
+    def __init__(self, guild_id, members):
+        self.id = guild_id
+        self.members = members
+        self._members = {member.id: member for member in members}
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+
+class FakeMessage:
+    async def add_reaction(self, emoji):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class FakeContext:
+    invoked_subcommand = None
+
+    def __init__(self, bot, author, guild):
+        self.bot = bot
+        self.author = author
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        self.sent += 1
+        return FakeMessage()
+
+
+class FakeBot:
+    def __init__(self, loop, guilds, users):
+        self.loop = loop
+        self.guilds = guilds
+        self._users = users
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_user(self, user_id):
+        return self._users.get(user_id)
+
+
+async def fake_menu(ctx, pages, controls, *args, **kwargs):
+    await ctx.send(embed=pages[0])
+
+
+# a user document with every key the storages need
+DEFAULTS = {
+    "xp": 0, "lvl": 1, "hq": 1, "chopper": 1, "keys": 0, "gold": 0, "gems": 0,
+    "boxes": 0, "temp_stars": 0, "temp_def_stars": 0,
+    "stars": {"attack": 0, "defense": 0},
+    "cards": {"troops": {}, "airdrops": {}, "defenses": {}, "commanders": {}},
+    "active": {"troops": {}, "airdrops": {}, "defenses": {}, "commanders": {}},
+    "presets": {},
+}
+
+
+def player(gold, stars, **changes):
+    doc = deepcopy(DEFAULTS)
+    doc["gold"] = gold
+    doc["stars"]["attack"] = stars
+    doc["cards"]["troops"]["Troopers"] = [2, 10]
+    doc["active"]["troops"]["Troopers"] = 3
+    doc["active"]["defenses"]["Troopers"] = 1
+    doc.update(changes)
+    return doc
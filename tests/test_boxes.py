@@ -0,0 +1,66 @@
+import json
+import random
+from collections import Counter
+
+import pytest
+
+from rushwars.boxes import AliasSampler, Boxes
+from rushwars.catalog import CardCatalog
+from tests.fakes import DATA_PATH
+
+
+@pytest.fixture(scope="module")
+def boxes():
+    with open(DATA_PATH / "boxes.json") as f:
+        boxes_info = json.load(f)
+    return Boxes(boxes_info, CardCatalog.from_path(DATA_PATH))
+
+
+def test_alias_sampler_follows_weights():
+    sampler = AliasSampler(["a", "b", "c"], [1, 0, 3])
+    rng = random.Random(1)
+    draws = Counter(sampler.draw(rng) for _ in range(40000))
+    assert draws["b"] == 0
+    assert draws["a"] / 40000 == pytest.approx(0.25, abs=0.01)
+    assert draws["c"] / 40000 == pytest.approx(0.75, abs=0.01)
+
+
+def test_alias_sampler_single_outcome():
+    sampler = AliasSampler(["only"], [0.5])
+    assert {sampler.draw() for _ in range(100)} == {"only"}
+
+
+@pytest.mark.parametrize("number, pieces, parts", [
+    (7, 1, [7]),
+    (4, 3, [1, 2, 4]),
+    (9, 5, [0, 1, 2, 3, 4]),
+])
+def test_split_in_integers(number, pieces, parts):
+    assert Boxes.split_in_integers(number, pieces) == parts
+
+
+def open_tier(boxes, box_type, tier, multiplier=1.0, hq=5):
+    rng = random.Random(0)
+    for _ in range(10000):
+        result = boxes.open_box(box_type, multiplier, hq, rng=rng)
+        if result.tier == tier:
+            return result
+    raise AssertionError(f"no {tier} tier drawn")
+
+
+@pytest.mark.parametrize("box_type, multiplier, total", [
+    # 4 cards in 3 stacks are split into 1 + 2 + 4
+    ("Common", 1.0, 7),
+    ("Common", 2.0, 15),
+    # 9 cards in 5 stacks are split into 0 + 1 + 2 + 3 + 4
+    ("Rare", 1.0, 10),
+])
+def test_common_tier_totals(boxes, box_type, multiplier, total):
+    result = open_tier(boxes, box_type, "Common", multiplier)
+    assert sum(result.draws.values()) == total
+
+
+def test_forced_commander(boxes):
+    result = boxes.open_box("Common", 1.0, 5, force_commander=True, rng=random.Random(0))
+    assert result.tier == "Commander"
+    assert result.stacks[0][1:] == ("Commander", 1)
@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from rushwars.cache import UserCache
+from rushwars.storage import ConfigStorage
+from tests.fakes import FakeConfig
+
+
+def make_cache(*user_ids):
+    config = FakeConfig()
+    config.register_user(gold=0, stars={"attack": 0, "defense": 0})
+    for user_id in user_ids:
+        config.docs[user_id] = {"gold": 100, "stars": {"attack": 0, "defense": 0}}
+    return UserCache(ConfigStorage(config))
+
+
+class RecordingLock(asyncio.Lock):
+    def __init__(self, user_id, order):
+        super().__init__()
+        self.user_id = user_id
+        self.order = order
+
+    async def acquire(self):
+        self.order.append(self.user_id)
+        return await super().acquire()
+
+
+def test_locks_taken_in_user_id_order(run):
+    cache = make_cache(1, 2)
+    order = []
+    locks = {user_id: RecordingLock(user_id, order) for user_id in (1, 2)}
+    cache.lock = locks.get
+
+    async def transact():
+        async with cache.transaction(2, 1) as (second, first):
+            assert second["gold"] == first["gold"] == 100
+            assert all(lock.locked() for lock in locks.values())
+
+    run(transact())
+    assert order == [1, 2]
+    assert not any(lock.locked() for lock in locks.values())
+
+
+def test_opposite_order_transactions_do_not_deadlock(run):
+    cache = make_cache(1, 2)
+
+    async def transfer(source, target):
+        async with cache.transaction(source, target) as (src, dst):
+            await asyncio.sleep(0)
+            src["gold"] -= 10
+            dst["gold"] += 10
+
+    async def both():
+        await asyncio.wait_for(asyncio.gather(transfer(1, 2), transfer(2, 1)), 1)
+        return [(await cache.get(user_id))["gold"] for user_id in (1, 2)]
+
+    assert run(both()) == [100, 100]
+
+
+def test_commit_only_when_changed(run):
+    cache = make_cache(1)
+
+    async def unchanged():
+        async with cache.transaction(1) as doc:
+            doc["gold"] += 0
+
+    run(unchanged())
+    assert cache.commits == 0
+    assert not cache._dirty
+
+    async def changed():
+        async with cache.transaction(1) as doc:
+            doc["gold"] += 5
+        return await cache.get(1)
+
+    assert run(changed())["gold"] == 105
+    assert cache.commits == 1
+    assert cache._dirty == {1}
+
+
+def test_rollback_on_exception(run):
+    cache = make_cache(1)
+
+    async def failing():
+        async with cache.transaction(1) as doc:
+            doc["gold"] = 0
+            doc["stars"]["attack"] = 50
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        run(failing())
+
+    async def check():
+        return await cache.get(1)
+
+    doc = run(check())
+    assert doc["gold"] == 100
+    assert doc["stars"]["attack"] == 0
+    assert not cache._dirty
+    assert not cache.lock(1).locked()
+
+
+def test_overlapping_transactions_do_not_lose_updates(run):
+    cache = make_cache(1)
+
+    async def add(amount):
+        async with cache.transaction(1) as doc:
+            gold = doc["gold"]
+            await asyncio.sleep(0)
+            doc["gold"] = gold + amount
+
+    async def overlap():
+        await asyncio.gather(*[add(1) for _ in range(20)])
+        await cache.flush()
+        return (await cache.get(1))["gold"]
+
+    assert run(overlap()) == 120
+    assert cache.storage.config.docs[1]["gold"] == 120
+
+
+def test_exclusive_waits_for_transactions(run):
+    cache = make_cache(1)
+    order = []
+
+    async def main():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def first():
+            async with cache.transaction(1) as doc:
+                started.set()
+                await release.wait()
+                doc["gold"] += 1
+            order.append("first")
+
+        async def exclusive():
+            async with cache.exclusive():
+                order.append("exclusive")
+                # transactions started meanwhile wait
+                for _ in range(5):
+                    await asyncio.sleep(0)
+                order.append("exclusive done")
+
+        async def second():
+            async with cache.transaction(1) as doc:
+                doc["gold"] += 1
+            order.append("second")
+
+        tasks = [asyncio.ensure_future(first())]
+        await started.wait()
+        tasks.append(asyncio.ensure_future(exclusive()))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(second()))
+        await asyncio.sleep(0)
+        assert order == []
+        release.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        return (await cache.get(1))["gold"]
+
+    assert run(main()) == 102
+    assert order == ["first", "exclusive", "exclusive done", "second"]
+
+
+def test_flush_waits_for_running_writes(run):
+    cache = make_cache(1)
+    storage = cache.storage
+    save_many = storage.save_many
+    saved = []
+
+    async def slow_save_many(docs):
+        await asyncio.sleep(0.01)
+        failed = await save_many(docs)
+        saved.append(list(docs))
+        return failed
+    storage.save_many = slow_save_many
+
+    async def main():
+        async with cache.transaction(1) as doc:
+            doc["gold"] = 5
+        background = asyncio.ensure_future(cache.flush())
+        await asyncio.sleep(0)
+        # nothing is dirty any more, but the write is still running
+        await cache.flush()
+        assert saved == [[1]]
+        await background
+
+    run(main())
+    assert storage.config.docs[1]["gold"] == 5
@@ -0,0 +1,148 @@
+import random
+
+import pytest
+
+from rushwars.catalog import CardCatalog
+from rushwars.combat import TARGETS_AIR, TARGETS_BOTH, TARGETS_GROUND, Army, CombatEngine
+from tests.fakes import DATA_PATH
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return CardCatalog.from_path(DATA_PATH)
+
+
+@pytest.fixture(scope="module")
+def engine(catalog):
+    return CombatEngine(catalog)
+
+
+def base_levels(catalog, names):
+    return {name: catalog.stat_table(name)[0].Level for name in names}
+
+
+def units(*stats, **effects):
+    """Return an Army of (hp, att, speed, targets, aerial, trap) units."""
+    army = Army()
+    for hp, att, speed, targets, aerial, trap in stats:
+        army.hp.append(hp)
+        army.att.append(att)
+        army.speed.append(speed)
+        army.targets.append(targets)
+        army.aerial.append(aerial)
+        army.trap.append(trap)
+    for name, value in effects.items():
+        setattr(army, name, value)
+    return army
+
+
+def test_airdrop_totals_do_not_depend_on_order(engine, catalog):
+    cards = ["Arcade", "Paratroopers"]
+    levels = base_levels(catalog, cards)
+    first = engine.army(dict.fromkeys(cards, 1), levels)
+    second = engine.army(dict.fromkeys(reversed(cards), 1), levels)
+    # 90 for 1 second and 30 for 4 seconds
+    assert first.damage == second.damage == pytest.approx(210)
+    assert first.damage_time == second.damage_time == pytest.approx(4.0)
+
+
+def test_airdrop_damage_is_dealt_once(engine):
+    # a harmless unit keeps the attack going while the airdrop runs
+    attack = units((1000, 0, 1.0, TARGETS_BOTH, False, False), damage=210.0, damage_time=4.0)
+    defense = units((10000, 0, 1.0, TARGETS_BOTH, False, False))
+    stars, destruction = engine.fight([attack], [defense])
+    assert destruction[0] == pytest.approx(0.021)
+    assert stars[0] == 0
+
+
+def test_trap_fires_once(engine):
+    attack = units((200, 10, 1.0, TARGETS_BOTH, False, False))
+    # the trap takes 150 health, a second shot would kill the attacker
+    defense = units((1, 150, 0.1, TARGETS_BOTH, False, True),
+                    (50, 0, 1.0, TARGETS_BOTH, False, False))
+    stars, destruction = engine.fight([attack], [defense])
+    assert stars[0] == 3
+    assert destruction[0] == 1.0
+
+
+def test_trap_is_never_targeted(catalog):
+    # five shots of 10 destroy the building if none is spent on the trap
+    engine = CombatEngine(catalog, max_time=5.0)
+    # the flying attacker can not trigger the ground trap but could shoot it
+    attack = units((1000, 10, 1.0, TARGETS_GROUND, True, False))
+    defense = units((1, 150, 0.1, TARGETS_GROUND, False, True),
+                    (50, 0, 1.0, TARGETS_BOTH, False, False))
+    stars, destruction = engine.fight([attack], [defense])
+    assert destruction[0] == 1.0
+    assert stars[0] == 3
+
+
+@pytest.mark.parametrize("targets, aerial, stars", [
+    (TARGETS_GROUND, False, 3),
+    (TARGETS_GROUND, True, 0),
+    (TARGETS_AIR, False, 0),
+    (TARGETS_AIR, True, 3),
+    (TARGETS_BOTH, False, 3),
+    (TARGETS_BOTH, True, 3),
+])
+def test_attack_targets(engine, targets, aerial, stars):
+    attack = units((1000, 100, 1.0, targets, False, False))
+    defense = units((100, 0, 1.0, TARGETS_BOTH, aerial, False))
+    assert engine.fight([attack], [defense])[0][0] == stars
+
+
+@pytest.mark.parametrize("targets, stars", [
+    (TARGETS_GROUND, 3),
+    (TARGETS_AIR, 0),
+    (TARGETS_BOTH, 0),
+])
+def test_defense_targets_flying_units(engine, targets, stars):
+    # the defense kills the flying attacker in one shot if it can hit it
+    attack = units((10, 10, 1.0, TARGETS_BOTH, True, False))
+    defense = units((100, 1000, 1.0, targets, False, False))
+    assert engine.fight([attack], [defense])[0][0] == stars
+
+
+def test_empty_squad_gets_no_stars(engine, catalog):
+    active = {"troops": {}, "airdrops": {"Satellite": 3}, "commanders": {}}
+    defenses = {"Mines": 1}
+    levels = base_levels(catalog, ["Satellite", "Mines"])
+    assert engine.battle(active, levels, defenses, levels) == 0
+    stars, _ = engine.fight([units()], [units()])
+    assert stars[0] == 0
+
+
+def test_battle_without_targets_ends(engine):
+    # neither side can hit the other
+    attack = units((100, 10, 1.0, TARGETS_AIR, True, False))
+    defense = units((100, 10, 1.0, TARGETS_GROUND, False, False))
+    stars, destruction = engine.fight([attack], [defense])
+    assert stars[0] == 0
+    assert destruction[0] == 0
+
+
+def test_removed_cards_do_not_fight(engine, catalog):
+    levels = base_levels(catalog, ["Troopers"])
+    army = engine.army({"Troopers": 1, "Removed Card": 3}, dict(levels))
+    assert len(army) == len(engine.army({"Troopers": 1}, levels))
+
+
+def test_batched_fight_matches_single_battles(engine, catalog):
+    rng = random.Random(0)
+    squad_cards = [card.Name for card in catalog.cards if card.Type in ("troop", "airdrop", "commander")]
+    defense_cards = [card.Name for card in catalog.cards if card.Type == "defense"]
+    levels = base_levels(catalog, squad_cards + defense_cards)
+
+    attacks = []
+    defenses = []
+    for _ in range(30):
+        squad = {name: rng.randint(1, 3) for name in rng.sample(squad_cards, rng.randint(1, 6))}
+        defense = {name: rng.randint(1, 2) for name in rng.sample(defense_cards, rng.randint(1, 5))}
+        attacks.append(engine.army(squad, levels))
+        defenses.append(engine.army(defense, levels))
+
+    stars, destruction = engine.fight(attacks, defenses)
+    for i, (attack, defense) in enumerate(zip(attacks, defenses)):
+        single_stars, single_destruction = engine.fight([attack], [defense])
+        assert stars[i] == single_stars[0]
+        assert destruction[i] == pytest.approx(single_destruction[0])
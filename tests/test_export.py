@@ -0,0 +1,76 @@
+import gzip
+import json
+
+import pytest
+
+from rushwars.export import ExportError, export_players, import_players, validate_player
+from rushwars.storage import SQLiteStorage
+from tests.fakes import DEFAULTS, player
+
+
+def test_fills_missing_keys():
+    doc = validate_player({"gold": 5, "stars": {"attack": 3}}, DEFAULTS)
+    assert doc["gold"] == 5
+    assert doc["gems"] == 0
+    assert doc["stars"] == {"attack": 3, "defense": 0}
+    assert doc["active"] == DEFAULTS["active"]
+    # defaults are copied, not shared
+    assert doc["cards"] is not DEFAULTS["cards"]
+
+
+def test_accepts_a_full_player():
+    assert validate_player(player(100, 50), DEFAULTS) == player(100, 50)
+
+
+@pytest.mark.parametrize("doc, error", [
+    ([], "player data must be an object"),
+    ({"hacks": 1}, "unknown keys hacks"),
+    ({"gold": "lots"}, "gold must be int"),
+    ({"gold": 1.5}, "gold must be int"),
+    ({"stars": {"attack": None}}, "stars.attack must be int"),
+    ({"cards": {"troops": []}}, "cards.troops must be dict"),
+    ({"cards": {"troops": {"Tank": [1]}}}, "cards.troops.Tank must be [level, count]"),
+    ({"cards": {"troops": {"Tank": [1, True]}}}, "cards.troops.Tank must be [level, count]"),
+    ({"active": {"troops": {"Tank": "2"}}}, "active.troops must map cards to numbers"),
+])
+def test_rejects_invalid_players(doc, error):
+    with pytest.raises(ExportError, match=error.replace("[", r"\[")):
+        validate_player(doc, DEFAULTS)
+
+
+def test_export_and_import(run, tmp_path):
+    source = SQLiteStorage(tmp_path / "source.db", DEFAULTS)
+    target = SQLiteStorage(tmp_path / "target.db", DEFAULTS)
+    path = tmp_path / "players.jsonl.gz"
+
+    async def main():
+        await source.save_many({user_id: player(user_id, user_id) for user_id in range(1, 8)})
+        count = await export_players(source, path, chunk_size=3)
+        user_ids = await import_players(target, path, DEFAULTS, chunk_size=3)
+        docs = [await target.load(user_id) for user_id in user_ids]
+        await source.close()
+        await target.close()
+        return count, user_ids, docs
+
+    count, user_ids, docs = run(main())
+    assert count == 7
+    assert user_ids == list(range(1, 8))
+    assert docs == [player(user_id, user_id) for user_id in user_ids]
+
+
+def test_invalid_file_imports_nothing(run, tmp_path):
+    target = SQLiteStorage(tmp_path / "target.db", DEFAULTS)
+    path = tmp_path / "players.jsonl.gz"
+    with gzip.open(str(path), "wt") as f:
+        f.write(json.dumps({"format": "rushwars-players", "version": 1}) + "\n")
+        f.write(json.dumps({"id": 1, "data": player(1, 1)}) + "\n")
+        f.write(json.dumps({"id": 2, "data": {"gold": "x"}}) + "\n")
+
+    async def main():
+        with pytest.raises(ExportError, match="line 3: gold must be int"):
+            await import_players(target, path, DEFAULTS)
+        ranking = await target.ranking()
+        await target.close()
+        return ranking
+
+    assert run(main()) == []
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from rushwars.catalog import CardCatalog
+from rushwars.housing import DEFENSE_TYPES, SQUAD_TYPES, Housing
+from tests.fakes import DATA_PATH
+
+
+@pytest.fixture(scope="module")
+def housing():
+    with open(DATA_PATH / "chopper_levels.json") as f:
+        chopper_levels = json.load(f)
+    return Housing(CardCatalog.from_path(DATA_PATH), chopper_levels)
+
+
+@pytest.fixture
+def user_data():
+    # chopper 1 houses 3 troop, 1 airdrop and 4 defense space
+    return {
+        "chopper": 1,
+        "cards": {
+            "troops": {"Troopers": [1, 5], "Tank": [1, 2], "Pitcher": [1, 0]},
+            "airdrops": {"Arcade": [1, 1]},
+            "defenses": {"Cannon": [1, 3]},
+            "commanders": {"Mother": [1, 1]},
+        },
+    }
+
+
+def test_squad(housing, user_data):
+    active, error = housing.compose(
+        user_data, {"Troopers": 1, "Tank": 1, "Arcade": 1, "Mother": 1}, SQUAD_TYPES)
+    assert error is None
+    assert active == {
+        "troops": {"Troopers": 1, "Tank": 1},
+        "airdrops": {"Arcade": 1},
+        "commanders": {"Mother": 1},
+    }
+
+
+def test_defense_takes_troops(housing, user_data):
+    active, error = housing.compose(user_data, {"Cannon": 1, "Troopers": 2}, DEFENSE_TYPES)
+    assert error is None
+    assert active == {"defenses": {"Cannon": 1, "Troopers": 2}}
+
+
+@pytest.mark.parametrize("cards, types, error", [
+    ({"Nothing": 1}, SQUAD_TYPES, "Nothing does not exist."),
+    ({"Cannon": 1}, SQUAD_TYPES, "Cannon is not a valid attack card."),
+    ({"Arcade": 1}, DEFENSE_TYPES, "Arcade is not a valid defense card."),
+    # owned with no cards left, and never unlocked
+    ({"Pitcher": 1}, SQUAD_TYPES, "You have not unlocked Pitcher."),
+    ({"Coach": 1}, SQUAD_TYPES, "You have not unlocked Coach."),
+    ({"Tank": 2}, SQUAD_TYPES, "Troops need 4 space but only 3 is available."),
+    ({"Mother": 2}, SQUAD_TYPES, "Commanders need 2 space but only 1 is available."),
+    ({"Cannon": 3}, DEFENSE_TYPES, "Defenses need 6 space but only 4 is available."),
+])
+def test_rejected(housing, user_data, cards, types, error):
+    assert housing.compose(user_data, cards, types) == (None, error)
+
+
+def test_full_capacity_fits(housing, user_data):
+    active, error = housing.compose(user_data, {"Troopers": 1, "Tank": 1}, SQUAD_TYPES)
+    assert error is None
+    user_data["active"] = {"troops": {}, "airdrops": {}, "commanders": {}, "defenses": {}}
+    housing.replace(user_data, active)
+    assert housing.used(user_data, "troops") == 3
+    assert housing.used(user_data, "airdrops") == 0
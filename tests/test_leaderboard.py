@@ -0,0 +1,74 @@
+import random
+
+from rushwars.leaderboard import Leaderboard, Leaderboards
+
+
+def test_rank_and_top():
+    board = Leaderboard()
+    for user_id, stars in [(1, 50), (2, 300), (3, 120), (4, 120)]:
+        board.update(user_id, stars)
+    assert board.top() == [(2, 300), (3, 120), (4, 120), (1, 50)]
+    # ties are ranked by user ID
+    assert [board.rank(user_id) for user_id in (2, 3, 4, 1)] == [1, 2, 3, 4]
+    assert board.top(2, start=1) == [(3, 120), (4, 120)]
+    assert board.rank(5) is None
+
+
+def test_update_moves_a_user():
+    board = Leaderboard()
+    for user_id, stars in [(1, 50), (2, 300), (3, 120)]:
+        board.update(user_id, stars)
+    board.update(1, 500)
+    assert board.rank(1) == 1
+    assert board.rank(2) == 2
+    board.update(1, 0)
+    assert board.rank(1) == 3
+    assert len(board) == 3
+    assert board.stars(1) == 0
+
+
+def test_remove():
+    board = Leaderboard()
+    board.update(1, 50)
+    board.update(2, 60)
+    board.remove(2)
+    board.remove(3)
+    assert 2 not in board
+    assert board.top() == [(1, 50)]
+    assert board.rank(1) == 1
+
+
+def test_matches_sorting():
+    board = Leaderboard()
+    stars = {}
+    rng = random.Random(0)
+    for _ in range(2000):
+        user_id = rng.randint(1, 200)
+        if rng.random() < 0.1:
+            board.remove(user_id)
+            stars.pop(user_id, None)
+        else:
+            stars[user_id] = rng.randint(0, 100)
+            board.update(user_id, stars[user_id])
+    expected = sorted(stars.items(), key=lambda item: (-item[1], item[0]))
+    assert board.top(len(expected)) == expected
+    for rank, (user_id, _) in enumerate(expected, 1):
+        assert board.rank(user_id) == rank
+
+
+def test_guild_boards_follow_updates():
+    boards = Leaderboards()
+    boards.update(1, 100, guild_id=10)
+    boards.update(2, 200, guild_id=20)
+    # without a guild the user moves on every board they are in
+    boards.update(1, 300)
+    assert boards.global_board.rank(1) == 1
+    assert boards.guild(10).top() == [(1, 300)]
+    assert 1 not in boards.guild(20)
+
+    boards.remove(1, guild_id=10)
+    assert 1 not in boards.guild(10)
+    assert 1 in boards.global_board
+    boards.remove(2)
+    assert 2 not in boards.global_board
+    assert 2 not in boards.guild(20)
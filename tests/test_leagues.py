@@ -0,0 +1,40 @@
+import pytest
+
+from rushwars.leagues import LEAGUES, LeagueTable
+
+
+@pytest.fixture(scope="module")
+def leagues():
+    return LeagueTable()
+
+
+@pytest.mark.parametrize("stars, name", [
+    (0, "Rookie"),
+    (199, "Rookie"),
+    # lower limits belong to the league, upper limits to the next one
+    (200, "Bronze"),
+    (599, "Bronze"),
+    (600, "Silver"),
+    (11999, "Elite"),
+    # above the last upper limit and below zero
+    (12000, "Elite"),
+    (50000, "Elite"),
+    (-5, "Rookie"),
+])
+def test_resolve(leagues, stars, name):
+    assert leagues.resolve(stars).Name == name
+
+
+def test_matches_league_ranges(leagues):
+    for name, (low, high, multiplier) in LEAGUES.items():
+        for stars in (low, (low + high) // 2, high - 1):
+            league = leagues.resolve(stars)
+            assert league.Name == name
+            assert league.Multiplier == multiplier
+
+
+def test_tiers_follow_star_order():
+    table = LeagueTable({"B": (100, 200, 2), "A": (0, 100, 1), "C": (200, 300, 3)})
+    assert [league.Name for league in table] == ["A", "B", "C"]
+    assert [league.Tier for league in table] == [1, 2, 3]
+    assert table.by_name["B"].Tier == 2
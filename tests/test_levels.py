@@ -0,0 +1,57 @@
+import json
+import random
+
+import pytest
+
+from rushwars.levels import XPTable
+from tests.fakes import DATA_PATH
+
+XP_LEVELS = {
+    "1": {"ExpToNextLevel": 10, "GemReward": 5},
+    "2": {"ExpToNextLevel": 20, "GemReward": 6},
+    "3": {"ExpToNextLevel": 30, "GemReward": 7},
+    "4": {"ExpToNextLevel": 40, "GemReward": 8},
+}
+
+
+@pytest.fixture
+def table():
+    return XPTable(XP_LEVELS)
+
+
+@pytest.mark.parametrize("level, xp, result", [
+    (1, 0, (1, 0, 0)),
+    (1, 9, (1, 9, 0)),
+    (1, 10, (2, 0, 5)),
+    (2, 25, (3, 5, 6)),
+    # several levels at once collect every reward on the way
+    (1, 35, (3, 5, 11)),
+    (1, 60, (4, 0, 18)),
+    # levels outside the table are clamped
+    (0, 10, (2, 0, 5)),
+])
+def test_resolve(table, level, xp, result):
+    assert table.resolve(level, xp) == result
+
+
+def test_max_level_keeps_xp(table):
+    assert table.max_level == 4
+    assert table.resolve(4, 500) == (4, 500, 0)
+    assert table.resolve(3, 1000) == (4, 970, 7)
+
+
+def test_matches_one_level_at_a_time():
+    with open(DATA_PATH / "xp_levels.json") as f:
+        xp_levels = json.load(f)
+    table = XPTable(xp_levels)
+    rng = random.Random(0)
+    for _ in range(500):
+        level = rng.randint(1, table.max_level - 1)
+        xp = rng.randint(0, table.cumulative[-1] - table.cumulative[level - 1] - 1)
+        # the original handler, one level up per call
+        expected_level, expected_xp, expected_gems = level, xp, 0
+        while expected_xp >= xp_levels[str(expected_level)]["ExpToNextLevel"]:
+            expected_xp -= xp_levels[str(expected_level)]["ExpToNextLevel"]
+            expected_gems += xp_levels[str(expected_level)]["GemReward"]
+            expected_level += 1
+        assert table.resolve(level, xp) == (expected_level, expected_xp, expected_gems)
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from rushwars.matchmaking import MatchmakingIndex
+
+
+def index_of(players, guild_id=1):
+    index = MatchmakingIndex()
+    for user_id, stars in players.items():
+        index.update(user_id, stars, True, guild_id)
+    return index
+
+
+@pytest.mark.parametrize("opponent_stars, found", [
+    (101, True),
+    (100, False),
+    (300, True),
+    (301, False),
+    # bands further away than the window
+    (900, False),
+])
+def test_window_bounds(opponent_stars, found):
+    # opponents match when opponent - 100 <= stars < opponent + 100
+    index = index_of({1: 200, 2: opponent_stars})
+    assert (index.find(1, 1, 200) == 2) is found
+
+
+def test_never_finds_self():
+    index = index_of({1: 200})
+    assert index.find(1, 1, 200) is None
+
+
+def test_players_move_between_bands():
+    index = index_of({1: 50, 2: 60})
+    index.update(2, 950, True)
+    assert index.find(1, 1, 50) is None
+    assert index.find(1, 3, 950) == 2
+    assert index.stars(2) == 950
+
+
+def test_players_without_defense_are_removed():
+    index = index_of({1: 50, 2: 60})
+    index.update(2, 60, False)
+    assert 2 not in index
+    assert index.find(1, 1, 50) is None
+
+
+def test_guilds_are_separate():
+    index = index_of({1: 50})
+    index.update(2, 60, True, guild_id=2)
+    assert index.find(1, 3, 50) == 1
+    assert index.find(2, 3, 50) == 2
+    index.remove(2, guild_id=2)
+    assert index.find(2, 3, 50) is None
+
+
+def test_finds_only_matching_opponents():
+    rng = random.Random(0)
+    players = {user_id: rng.randint(0, 2000) for user_id in range(1, 300)}
+    index = index_of(players)
+    # move and remove some players after they were indexed
+    for user_id in rng.sample(list(players), 60):
+        players[user_id] = rng.randint(0, 2000)
+        index.update(user_id, players[user_id], True)
+    for user_id in rng.sample(list(players), 30):
+        del players[user_id]
+        index.remove(user_id)
+
+    random.seed(0)
+    for _ in range(500):
+        stars = rng.randint(0, 2000)
+        user_id = rng.randint(1, 300)
+        expected = {
+            opponent for opponent, opponent_stars in players.items()
+            if opponent != user_id and opponent_stars - 100 <= stars < opponent_stars + 100}
+        found = index.find(1, user_id, stars)
+        if expected:
+            assert found in expected
+        else:
+            assert found is None
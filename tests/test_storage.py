@@ -0,0 +1,54 @@
+import pytest
+
+from rushwars.storage import ConfigStorage, SQLiteStorage, copy_players
+from tests.fakes import DEFAULTS, FakeConfig, player
+
+
+@pytest.fixture
+def config():
+    config = FakeConfig()
+    config.register_user(**DEFAULTS)
+    config.docs = {1: player(100, 50), 2: player(200, 70)}
+    # written before a key was added to the defaults
+    del config.docs[2]["gems"]
+    return config
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    return SQLiteStorage(tmp_path / "players.db", DEFAULTS)
+
+
+def test_copy_config_to_sqlite(run, config, sqlite):
+    async def main():
+        await sqlite.save_many({99: player(5, 5)})
+        await sqlite.clear()
+        count = await copy_players(ConfigStorage(config), sqlite, DEFAULTS)
+        docs = {user_id: await sqlite.load(user_id) for user_id in (1, 2, 99)}
+        ranking = await sqlite.ranking()
+        await sqlite.close()
+        return count, docs, ranking
+
+    count, docs, ranking = run(main())
+    assert count == 2
+    assert docs[1] == player(100, 50)
+    assert docs[2] == player(200, 70)
+    # cleared players load as new ones
+    assert docs[99] == DEFAULTS
+    assert ranking == [(2, 70, True), (1, 50, True)]
+
+
+def test_copy_sqlite_to_config(run, config, sqlite):
+    target = FakeConfig()
+    target.register_user(**DEFAULTS)
+    target.docs = {99: player(5, 5)}
+
+    async def main():
+        await copy_players(ConfigStorage(config), sqlite, DEFAULTS)
+        await ConfigStorage(target).clear()
+        count = await copy_players(sqlite, ConfigStorage(target), DEFAULTS)
+        await sqlite.close()
+        return count
+
+    assert run(main()) == 2
+    assert target.docs == {1: player(100, 50), 2: player(200, 70)}